@@ -1,100 +1,130 @@
 from decimal import Decimal
 
 from django.conf import settings
-from django.shortcuts import get_object_or_404
-
-from products.models import Product
-from profiles.models import UserProfile
+from django.utils.functional import SimpleLazyObject
+
+from profiles.utils import is_member as get_is_member
+from .utils import (
+    BAG_BADGE_DEFERRED_ATTR,
+    BAG_SUMMARY_ATTR,
+    calculate_delivery,
+    count_bag_items,
+    get_cached_bag_totals,
+    resolve_bag,
+    store_bag_totals,
+)
 
 MEMBER_DISCOUNT_RATE = Decimal('0.10')
 
 
+def get_bag_summary(request):
+    """
+    Return the bag summary for this request, computing it at most once.
+
+    The result is memoized on the request and dropped by
+    `bag.utils.invalidate_bag_summary` whenever the session bag changes,
+    so the context processor and views that need the totals share a
+    single calculation.
+    """
+    summary = getattr(request, BAG_SUMMARY_ATTR, None)
+    if summary is None:
+        summary = _calculate_bag_summary(request)
+        setattr(request, BAG_SUMMARY_ATTR, summary)
+    return summary
+
+
+class BagSummary:
+    """
+    Lazy view of the request's bag summary for templates.
+
+    The bag is only priced (through `get_bag_summary`) the first time a
+    template reads one of its values, e.g. ``{{ bag_summary.total }}``.
+    The values themselves are plain decimals and lists, so filters and
+    localization work on them as usual.
+    """
+
+    def __init__(self, request):
+        self._request = request
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return get_bag_summary(self._request)[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
 def bag_contents(request):
+    """
+    Context processor exposing the bag summary to every template.
+
+    Most pages only show the nav badge, so ``product_count`` is counted
+    straight from the session with no queries. The priced values are
+    read through ``bag_summary``, which only prices the bag (and looks
+    up the member discount) when a template actually uses it.
+
+    Pages that may be served from the shared page cache set
+    ``defer_bag_badge``; their badge is left blank and filled in by the
+    browser from the bag summary endpoint.
+    """
+    deferred = getattr(request, BAG_BADGE_DEFERRED_ATTR, False)
+    return {
+        'defer_bag_badge': deferred,
+        'product_count': (
+            None if deferred
+            else count_bag_items(request.session.get('bag', {}))
+        ),
+        'free_delivery_threshold': settings.FREE_DELIVERY_THRESHOLD,
+        'bag_summary': BagSummary(request),
+    }
+
+
+def _calculate_bag_summary(request):
     """
     Calculate bag totals, apply member discount if eligible,
     and return all relevant context variables.
 
-    Updated to reference ProductVariant for pricing,
-    since Product no longer contains a price field.
+    Line items are priced by `bag.utils.resolve_bag`, which fetches
+    every variant in the bag with a single query. The resulting totals
+    are cached in the session and reused until the bag or the catalog
+    price version changes.
     """
-    bag_items = []
-    total = Decimal('0.00')
-    product_count = 0
     bag = request.session.get('bag', {})
+    cached_totals = get_cached_bag_totals(request.session, bag)
+
+    if cached_totals:
+        # Totals are still valid, so only price the lines if a caller
+        # actually needs them
+        total, product_count = cached_totals
+        bag_items = SimpleLazyObject(
+            lambda: resolve_bag(bag)['bag_items']
+        )
+    else:
+        resolved = resolve_bag(bag)
+        bag_items = resolved['bag_items']
+        total = resolved['total']
+        product_count = resolved['product_count']
+        if bag:
+            store_bag_totals(request.session, bag, total, product_count)
+
     discount = Decimal('0.00')
     is_member = False
 
-    for item_id, item_data in bag.items():
-        product = get_object_or_404(Product, pk=int(item_id))
-
-        # Handle non-variant items (fallback)
-        if isinstance(item_data, int):
-            variant = product.variants.first()
-            if not variant:
-                continue  # Skip if no variants exist
-
-            price = variant.price
-            subtotal = item_data * price
-            total += subtotal
-            product_count += item_data
-            bag_items.append({
-                'item_id': item_id,
-                'quantity': item_data,
-                'product': product,
-                'variant': variant,
-                'sku': variant.sku,
-                'price': price,
-                'subtotal': subtotal,
-            })
-            continue
-
-        # Handle variant-based products
-        items_by_variant = item_data.get('items_by_variant', {})
-        for variant_key, quantity in items_by_variant.items():
-            size, colour = variant_key.split('_')
-            size = size.strip().upper()
-            colour = colour.strip().capitalize()
-
-            variant = product.variants.filter(size=size, colour=colour).first()
-
-            if variant:
-                price = variant.price
-                subtotal = Decimal(quantity) * price
-                total += subtotal
-                product_count += quantity
-                bag_items.append({
-                    'item_id': item_id,
-                    'quantity': quantity,
-                    'product': product,
-                    'variant': variant,
-                    'sku': variant.sku,
-                    'price': price,
-                    'subtotal': subtotal,
-                    'variant_key': variant_key,
-                })
-
     # Apply member discount
-    if request.user.is_authenticated:
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_member:
-                is_member = True
-                discount = total * MEMBER_DISCOUNT_RATE
-        except UserProfile.DoesNotExist:
-            pass
+    if get_is_member(request):
+        is_member = True
+        discount = total * MEMBER_DISCOUNT_RATE
 
     discount = round(discount, 2)
     total_after_discount = total - discount
 
     # Delivery logic
+    delivery = calculate_delivery(total_after_discount)
     if total_after_discount < settings.FREE_DELIVERY_THRESHOLD:
-        delivery = total_after_discount * (
-            Decimal(settings.STANDARD_DELIVERY_PERCENTAGE) / 100
-        )
         threshold = settings.FREE_DELIVERY_THRESHOLD
         free_delivery_delta = threshold - total_after_discount
     else:
-        delivery = Decimal('0.00')
         free_delivery_delta = Decimal('0.00')
 
     grand_total = total_after_discount + delivery
@@ -0,0 +1,205 @@
+"""
+Test suite for bag.contexts.
+
+Covers:
+- Memoization of the bag summary on the request
+- Invalidation when the bag is saved or cleared
+"""
+
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase, RequestFactory, override_settings
+
+from bag.contexts import bag_contents, get_bag_summary
+from bag.utils import BAG_TOTALS_SESSION_KEY, clear_bag, save_bag
+from fitsix_project.testing import IN_MEMORY_CACHES
+from products.models import Category, Product, ProductVariant
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class BagSummaryMemoizationTest(TestCase):
+    """
+    Tests for the per-request bag summary cache.
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name='gear')
+        self.product = Product.objects.create(
+            name='Bottle',
+            description='Water bottle',
+            category=category
+        )
+        ProductVariant.objects.create(
+            product=self.product,
+            sku='BOT-001',
+            price=Decimal('10.00'),
+            stock=5,
+            size='One Size',
+            colour='Blue'
+        )
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+        self.request.session = {
+            'bag': {
+                str(self.product.id): {
+                    'items_by_variant': {'one size_blue': 1}
+                }
+            }
+        }
+
+    def test_summary_is_computed_once_per_request(self):
+        """
+        Repeated calls should reuse the first calculation.
+        """
+        with self.assertNumQueries(1):
+            first = get_bag_summary(self.request)
+            context = bag_contents(self.request)
+            second = get_bag_summary(self.request)
+            self.assertEqual(context['bag_summary'].total, first['total'])
+        self.assertIs(first, second)
+        self.assertEqual(first['product_count'], 1)
+
+    def test_save_bag_invalidates_summary(self):
+        """
+        Saving a new bag should force the summary to be recalculated.
+        """
+        self.assertEqual(get_bag_summary(self.request)['product_count'], 1)
+        bag = self.request.session['bag']
+        bag[str(self.product.id)]['items_by_variant']['one size_blue'] = 3
+        save_bag(self.request, bag)
+        self.assertEqual(get_bag_summary(self.request)['product_count'], 3)
+
+    def test_clear_bag_invalidates_summary(self):
+        """
+        Clearing the bag should leave an empty summary.
+        """
+        self.assertEqual(get_bag_summary(self.request)['product_count'], 1)
+        clear_bag(self.request)
+        self.assertNotIn('bag', self.request.session)
+        self.assertEqual(get_bag_summary(self.request)['product_count'], 0)
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class LazyBagContentsTest(TestCase):
+    """
+    Tests for the lazy bag context processor.
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name='gear')
+        product = Product.objects.create(
+            name='Bottle',
+            description='Water bottle',
+            category=category
+        )
+        ProductVariant.objects.create(
+            product=product,
+            sku='BOT-001',
+            price=Decimal('10.00'),
+            stock=5,
+            size='One Size',
+            colour='Blue'
+        )
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+        self.request.session = {
+            'bag': {
+                str(product.id): {
+                    'items_by_variant': {'one size_blue': 2}
+                }
+            }
+        }
+
+    def test_product_count_needs_no_queries(self):
+        """
+        The nav badge count should come straight from the session.
+        """
+        with self.assertNumQueries(0):
+            context = bag_contents(self.request)
+            self.assertEqual(context['product_count'], 2)
+
+    def test_lazy_values_resolve_on_access(self):
+        """
+        Totals are only calculated when read, and only once.
+        """
+        summary = bag_contents(self.request)['bag_summary']
+        with self.assertNumQueries(1):
+            self.assertEqual(len(summary.bag_items), 1)
+            self.assertEqual(summary.total, Decimal('20.00'))
+            self.assertTrue(summary.grand_total > 0)
+            self.assertFalse(summary.is_member)
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class SessionBagTotalsTest(TestCase):
+    """
+    Tests for bag totals cached in the session.
+    """
+
+    def setUp(self):
+        category = Category.objects.create(name='gear')
+        product = Product.objects.create(
+            name='Bottle',
+            description='Water bottle',
+            category=category
+        )
+        self.variant = ProductVariant.objects.create(
+            product=product,
+            sku='BOT-001',
+            price=Decimal('10.00'),
+            stock=5,
+            size='One Size',
+            colour='Blue'
+        )
+        self.session = {
+            'bag': {
+                str(product.id): {
+                    'items_by_variant': {'one size_blue': 2}
+                }
+            }
+        }
+
+    def _request(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = self.session
+        return request
+
+    def test_totals_served_from_session_without_queries(self):
+        """
+        A later request with the same bag should not query for totals.
+        """
+        get_bag_summary(self._request())
+        self.assertIn(BAG_TOTALS_SESSION_KEY, self.session)
+
+        with self.assertNumQueries(0):
+            summary = get_bag_summary(self._request())
+            self.assertEqual(summary['total'], Decimal('20.00'))
+            self.assertEqual(summary['product_count'], 2)
+
+    def test_price_change_invalidates_cached_totals(self):
+        """
+        Changing a variant's price should force the totals to be repriced.
+        """
+        get_bag_summary(self._request())
+        self.variant.price = Decimal('15.00')
+        self.variant.save()
+
+        summary = get_bag_summary(self._request())
+        self.assertEqual(summary['total'], Decimal('30.00'))
+
+    def test_bag_change_invalidates_cached_totals(self):
+        """
+        Changing the bag should ignore totals priced for the old bag.
+        """
+        get_bag_summary(self._request())
+        request = self._request()
+        bag = self.session['bag']
+        bag[str(self.variant.product_id)]['items_by_variant'][
+            'one size_blue'
+        ] = 1
+        save_bag(request, bag)
+
+        summary = get_bag_summary(request)
+        self.assertEqual(summary['total'], Decimal('10.00'))
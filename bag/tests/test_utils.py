@@ -0,0 +1,117 @@
+"""
+Test suite for bag.utils.
+
+Covers:
+- Parsing the session bag into flat lines
+- Resolving lines into priced items with a single query
+- Skipping malformed entries and missing variants
+"""
+
+from decimal import Decimal
+
+from django.test import TestCase
+
+from bag.utils import parse_bag, resolve_bag
+from products.models import Category, Product, ProductVariant
+
+
+class ResolveBagTest(TestCase):
+    """
+    Tests for parse_bag and resolve_bag.
+    """
+
+    def setUp(self):
+        self.category = Category.objects.create(name='apparel')
+        self.products = []
+        self.variants = []
+        for i in range(5):
+            product = Product.objects.create(
+                name=f'Tee {i}',
+                description='A tee',
+                category=self.category,
+                has_variants=True
+            )
+            self.products.append(product)
+            for size in ('S', 'M', 'L'):
+                self.variants.append(ProductVariant.objects.create(
+                    product=product,
+                    sku=f'TEE-{i}-{size}',
+                    price=Decimal('12.50'),
+                    stock=10,
+                    size=size,
+                    colour='Black'
+                ))
+
+    def test_parse_bag_flattens_and_skips_malformed_entries(self):
+        """
+        parse_bag should flatten variants and ignore bad product ids.
+        """
+        bag = {
+            '1': {'items_by_variant': {'s_black': 2, 'm_black': 1}},
+            '2': 3,
+            'some': 'thing',
+        }
+        self.assertEqual(parse_bag(bag), [
+            ('1', 's_black', 2),
+            ('1', 'm_black', 1),
+            ('2', None, 3),
+        ])
+
+    def test_resolve_bag_uses_single_query(self):
+        """
+        A multi-line bag should be priced with one query.
+        """
+        bag = {
+            str(product.id): {
+                'items_by_variant': {'s_black': 1, 'l_black': 2}
+            }
+            for product in self.products
+        }
+        with self.assertNumQueries(1):
+            resolved = resolve_bag(bag)
+            names = [item['product'].name for item in resolved['bag_items']]
+
+        self.assertEqual(len(names), 10)
+        self.assertEqual(resolved['product_count'], 15)
+        self.assertEqual(resolved['total'], Decimal('187.50'))
+
+    def test_resolve_bag_matches_variants_case_insensitively(self):
+        """
+        Variant keys should match regardless of case.
+        """
+        product = self.products[0]
+        bag = {str(product.id): {'items_by_variant': {'M_BLACK': 1}}}
+        resolved = resolve_bag(bag)
+        self.assertEqual(resolved['bag_items'][0]['sku'], 'TEE-0-M')
+
+    def test_resolve_bag_skips_missing_variants_and_products(self):
+        """
+        Lines for unknown variants or deleted products are dropped.
+        """
+        product = self.products[0]
+        bag = {
+            str(product.id): {'items_by_variant': {'xl_pink': 1}},
+            '99999': {'items_by_variant': {'s_black': 1}},
+        }
+        resolved = resolve_bag(bag)
+        self.assertEqual(resolved['bag_items'], [])
+        self.assertEqual(resolved['total'], Decimal('0.00'))
+
+    def test_resolve_bag_non_variant_item_uses_first_variant(self):
+        """
+        Integer bag entries are priced from the product's first variant.
+        """
+        product = self.products[1]
+        resolved = resolve_bag({str(product.id): 2})
+        item = resolved['bag_items'][0]
+        self.assertEqual(item['sku'], 'TEE-1-S')
+        self.assertNotIn('variant_key', item)
+        self.assertEqual(resolved['product_count'], 2)
+
+    def test_resolve_empty_bag_runs_no_queries(self):
+        """
+        An empty bag should not touch the database.
+        """
+        with self.assertNumQueries(0):
+            resolved = resolve_bag({})
+        self.assertEqual(resolved['product_count'], 0)
@@ -0,0 +1,186 @@
+"""
+Test suite for bag views.
+
+Covers:
+- The JSON bag summary used by cached pages
+- ETag revalidation and optional pricing of the summary
+- The bag page sharing the memoized bag summary
+- The success toast rendered after adding to the bag
+"""
+
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from fitsix_project.testing import IN_MEMORY_CACHES
+from products.models import Product, ProductVariant
+
+
+@override_settings(
+    CACHES=IN_MEMORY_CACHES,
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class BagSummaryViewTest(TestCase):
+    """
+    Tests for the nav badge summary endpoint.
+    """
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Bottle', description='Water bottle'
+        )
+        self.url = reverse('bag_summary')
+
+    def _set_bag(self, bag):
+        session = self.client.session
+        session['bag'] = bag
+        session.save()
+
+    def test_counts_bag_from_session(self):
+        """
+        The count is read from the session without catalog queries.
+        """
+        self._set_bag({
+            str(self.product.pk): {'items_by_variant': {'M_red': 2}},
+            '999': 1,
+        })
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json(), {'product_count': 3})
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_includes_csrf_token_on_request(self):
+        """
+        ``?csrf=1`` returns a token and sets the CSRF cookie.
+        """
+        response = self.client.get(self.url, {'csrf': 1})
+        self.assertEqual(response.json()['product_count'], 0)
+        self.assertTrue(response.json()['csrf_token'])
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_etag_revalidation(self):
+        """
+        An unchanged bag answers revalidation with 304 Not Modified.
+        """
+        self._set_bag({str(self.product.pk): 1})
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self._set_bag({str(self.product.pk): 2})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['product_count'], 2)
+
+    def test_prices_on_request(self):
+        """
+        ``?prices=1`` prices the bag, with its own ETag.
+        """
+        ProductVariant.objects.create(
+            product=self.product, sku='BTL-1', price='12.50', stock=5
+        )
+        self._set_bag({str(self.product.pk): 2})
+        plain = self.client.get(self.url)
+
+        response = self.client.get(self.url, {'prices': 1})
+        data = response.json()
+        self.assertEqual(data['total'], '25.00')
+        self.assertEqual(data['product_count'], 2)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+
+    def test_price_change_changes_priced_etag(self):
+        """
+        Repricing a variant invalidates priced summaries.
+        """
+        variant = ProductVariant.objects.create(
+            product=self.product, sku='BTL-1', price='12.50', stock=5
+        )
+        self._set_bag({str(self.product.pk): 1})
+        etag = self.client.get(self.url, {'prices': 1})['ETag']
+
+        variant.price = '10.00'
+        variant.save()
+        response = self.client.get(
+            self.url, {'prices': 1}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], '10.00')
+
+
+class ViewBagTest(TestCase):
+    """
+    Tests for the bag page.
+    """
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Bottle', description='Water bottle'
+        )
+        ProductVariant.objects.create(
+            product=self.product, sku='BTL-1', price='12.50', stock=5,
+            size='One Size', colour='Blue'
+        )
+        session = self.client.session
+        session['bag'] = {
+            str(self.product.pk): {'items_by_variant': {'one size_blue': 2}}
+        }
+        session.save()
+
+    def test_bag_is_priced_once(self):
+        """
+        The page and the context processor share one bag summary.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('view_bag'))
+        self.assertEqual(response.status_code, 200)
+        variant_queries = [
+            query for query in queries.captured_queries
+            if 'products_productvariant' in query['sql']
+        ]
+        self.assertEqual(len(variant_queries), 1)
+        self.assertEqual(response.context['total'], Decimal('25.00'))
+        self.assertEqual(
+            response.context['grand_total'],
+            response.context['total'] + response.context['delivery'],
+        )
+
+
+class AddToBagToastTest(TestCase):
+    """
+    Tests for the success toast shown after adding to the bag.
+    """
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Bottle', description='Water bottle'
+        )
+        ProductVariant.objects.create(
+            product=self.product, sku='BTL-1', price='12.50', stock=5,
+            size='One Size', colour='Blue'
+        )
+
+    def test_toast_renders_bag_summary(self):
+        """
+        The toast lists the bag and how much more to spend for free
+        delivery.
+        """
+        detail_url = reverse('product_detail', args=[self.product.slug])
+        response = self.client.post(
+            reverse('add_to_bag', args=[self.product.slug]),
+            {
+                'quantity': 2,
+                'redirect_url': detail_url,
+                'variant_size': 'One Size',
+                'variant_colour': 'Blue',
+            },
+            follow=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Go To Secure Checkout')
+        self.assertContains(response, '£25.00')
+        self.assertContains(response, 'Spend <strong>£25.00</strong> more')
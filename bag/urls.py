@@ -7,4 +7,5 @@ urlpatterns = [
     path('adjust/<slug:slug>/', views.adjust_bag, name='adjust_bag'),
     path('remove/<slug:slug>/', views.remove_from_bag, name='remove_from_bag'),
     path('update-all/', views.update_bag_all, name='update_bag_all'),
+    path('summary/', views.bag_summary, name='bag_summary'),
 ]
@@ -0,0 +1,206 @@
+"""
+Helpers for resolving the session bag into priced line items.
+
+The session bag is stored as ``{product_id: {'items_by_variant':
+{'size_colour': quantity}}}`` (or ``{product_id: quantity}`` for older,
+non-variant entries). Both the bag context processor and the bag page
+need the same priced lines, so resolution lives here and fetches every
+referenced variant in a single query instead of one or two per line.
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+from products.models import ProductVariant
+from products.versions import get_price_version
+
+# Request attribute used to memoize the bag summary for one request
+BAG_SUMMARY_ATTR = '_bag_summary'
+
+# Session key holding priced totals stamped with the bag and price version
+BAG_TOTALS_SESSION_KEY = 'bag_totals'
+
+# Request attribute set on pages whose nav badge is filled in client-side
+BAG_BADGE_DEFERRED_ATTR = '_bag_badge_deferred'
+
+
+def parse_bag(bag):
+    """
+    Flatten the session bag into ``(item_id, variant_key, quantity)``
+    tuples, preserving bag order.
+
+    ``variant_key`` is ``None`` for non-variant entries. Malformed
+    entries (non-numeric product ids or unexpected values) are skipped.
+    """
+    lines = []
+    for item_id, item_data in bag.items():
+        if not str(item_id).isdigit():
+            continue
+
+        if isinstance(item_data, int):
+            lines.append((item_id, None, item_data))
+            continue
+
+        if not isinstance(item_data, dict):
+            continue
+
+        items_by_variant = item_data.get('items_by_variant', {})
+        for variant_key, quantity in items_by_variant.items():
+            lines.append((item_id, variant_key, quantity))
+    return lines
+
+
+def count_bag_items(bag):
+    """
+    Return the total quantity in the bag without touching the database.
+
+    Lines for variants that no longer exist are still counted; the
+    priced summary drops them once the bag is resolved.
+    """
+    return sum(quantity for _, _, quantity in parse_bag(bag))
+
+
+def invalidate_bag_summary(request):
+    """Drop the bag summary memoized on the request, if any."""
+    if hasattr(request, BAG_SUMMARY_ATTR):
+        delattr(request, BAG_SUMMARY_ATTR)
+
+
+def save_bag(request, bag):
+    """
+    Store the bag in the session and invalidate the memoized summary.
+
+    All views that mutate ``request.session['bag']`` should go through
+    this so later renders in the same request see the new totals.
+    """
+    request.session['bag'] = bag
+    invalidate_bag_summary(request)
+
+
+def clear_bag(request):
+    """Remove the bag from the session and invalidate the summary."""
+    request.session.pop('bag', None)
+    request.session.pop(BAG_TOTALS_SESSION_KEY, None)
+    invalidate_bag_summary(request)
+
+
+def calculate_delivery(total_after_discount):
+    """
+    Return the delivery charge, to the penny, for goods worth
+    ``total_after_discount`` once any member discount is taken off.
+
+    The bag summary and ``Order.update_total`` both use this, so an
+    order's grand total always matches the amount charged at checkout.
+    """
+    if total_after_discount < settings.FREE_DELIVERY_THRESHOLD:
+        return round(
+            total_after_discount
+            * Decimal(settings.STANDARD_DELIVERY_PERCENTAGE) / 100,
+            2,
+        )
+    return Decimal('0.00')
+
+
+def bag_fingerprint(bag):
+    """Return a stable hash of the bag's contents."""
+    payload = json.dumps(bag, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_bag_totals(session, bag):
+    """
+    Return ``(total, product_count)`` cached in the session, or ``None``.
+
+    Cached totals are only used when they were priced for exactly this
+    bag and the catalog price version has not moved since.
+    """
+    cached = session.get(BAG_TOTALS_SESSION_KEY)
+    if not cached:
+        return None
+    if (
+        cached.get('fingerprint') != bag_fingerprint(bag)
+        or cached.get('price_version') != get_price_version()
+    ):
+        return None
+    return Decimal(cached['total']), cached['product_count']
+
+
+def store_bag_totals(session, bag, total, product_count):
+    """Cache priced bag totals in the session for later requests."""
+    session[BAG_TOTALS_SESSION_KEY] = {
+        'fingerprint': bag_fingerprint(bag),
+        'price_version': get_price_version(),
+        'total': str(total),
+        'product_count': product_count,
+    }
+
+
+def resolve_bag(bag):
+    """
+    Resolve the session bag into priced line items.
+
+    All variants for the products referenced by the bag are fetched in a
+    single query (with their parent product) and matched in Python on
+    ``(product_id, variant_key)``; bag keys are already in the canonical
+    lower-cased form stored on `ProductVariant.variant_key`. Lines whose
+    product or variant no longer exists are dropped.
+
+    Returns:
+        dict: ``bag_items`` (list of line dicts), ``total`` (Decimal)
+        and ``product_count`` (int).
+    """
+    lines = parse_bag(bag)
+    product_ids = {int(item_id) for item_id, _, _ in lines}
+
+    first_variants = {}
+    variants_by_key = {}
+    variants = (
+        ProductVariant.objects.filter(product_id__in=product_ids)
+        .select_related('product')
+        .order_by('product_id', 'pk')
+    )
+    for variant in variants:
+        first_variants.setdefault(variant.product_id, variant)
+        variants_by_key[(variant.product_id, variant.variant_key)] = variant
+
+    bag_items = []
+    total = Decimal('0.00')
+    product_count = 0
+
+    for item_id, variant_key, quantity in lines:
+        product_id = int(item_id)
+
+        if variant_key is None:
+            # Non-variant items fall back to the product's first variant
+            variant = first_variants.get(product_id)
+        else:
+            variant = variants_by_key.get((product_id, variant_key.lower()))
+
+        if not variant:
+            continue
+
+        price = variant.price
+        subtotal = Decimal(quantity) * price
+        total += subtotal
+        product_count += quantity
+
+        item = {
+            'item_id': item_id,
+            'quantity': quantity,
+            'product': variant.product,
+            'variant': variant,
+            'sku': variant.sku,
+            'price': price,
+            'subtotal': subtotal,
+        }
+        if variant_key is not None:
+            item['variant_key'] = variant_key
+        bag_items.append(item)
+
+    return {
+        'bag_items': bag_items,
+        'total': total,
+        'product_count': product_count,
+    }
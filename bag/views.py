@@ -1,96 +1,28 @@
-from decimal import Decimal
+import hashlib
 from django.shortcuts import (
     render, redirect, HttpResponse, get_object_or_404
 )
 from django.contrib import messages
-from django.views.decorators.http import require_POST
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import etag, require_GET, require_POST
 
 from products.models import Product
-from profiles.models import UserProfile
-
-# Member discount rate (10%)
-MEMBER_DISCOUNT_RATE = Decimal('0.10')
+from products.versions import get_price_version
+from profiles.utils import is_member as get_is_member
+from .contexts import get_bag_summary
+from .utils import bag_fingerprint, count_bag_items, save_bag
 
 
 def view_bag(request):
     """Render the bag contents page,
-    calculating totals and member discount."""
-
-    bag = request.session.get('bag', {})
-    bag_items = []
-    total = Decimal('0.00')
-    product_count = 0
-
-    for item_id, item_data in bag.items():
-        product = get_object_or_404(Product, pk=item_id)
-
-        # Handle non-variant items (if any remain)
-        if isinstance(item_data, int):
-            # Use first variant price if available, else 0.00
-            variant = product.variants.first()
-            price = variant.price if variant else Decimal('0.00')
-            subtotal = Decimal(item_data) * price
-            total += subtotal
-            product_count += item_data
-            bag_items.append({
-                'item_id': item_id,
-                'quantity': item_data,
-                'product': product,
-                'price': price,
-                'subtotal': subtotal,
-            })
-            continue
-
-        # Handle products with variants
-        for variant_key, quantity in item_data.get(
-            'items_by_variant', {}
-        ).items():
-            size, colour = variant_key.split('_')
-            size = size.strip().upper()
-            colour = colour.strip().capitalize()
-
-            variant = product.variants.filter(size=size, colour=colour).first()
-            if variant:
-                price = variant.price
-                subtotal = Decimal(quantity) * price
-                total += subtotal
-                product_count += quantity
-
-                bag_items.append({
-                    'item_id': item_id,
-                    'quantity': quantity,
-                    'product': product,
-                    'variant': variant,
-                    'sku': variant.sku,
-                    'price': price,
-                    'subtotal': subtotal,
-                    'variant_key': variant_key,
-                })
-
-    # --- Member discount logic ---
-    discount = Decimal('0.00')
-    is_member = False
-
-    if request.user.is_authenticated:
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            if profile.is_member:
-                discount = total * MEMBER_DISCOUNT_RATE
-                is_member = True
-        except UserProfile.DoesNotExist:
-            pass
-
-    grand_total = total - discount
-
-    context = {
-        'bag_items': bag_items,
-        'total': total,
-        'product_count': product_count,
-        'discount': round(discount, 2),
-        'grand_total': grand_total,
-        'is_member': is_member,
-    }
+    calculating totals and member discount.
 
+    The page uses the same memoized summary as the bag context
+    processor, so the bag is only priced once per request.
+    """
+    context = dict(get_bag_summary(request))
     return render(request, 'bag/bag.html', context)
 
 
@@ -143,7 +75,7 @@ def add_to_bag(request, slug):
             bag[item_id_str] = quantity
             messages.success(request, f"Added {product.name} to your bag")
 
-    request.session['bag'] = bag
+    save_bag(request, bag)
     return redirect(redirect_url)
 
 
@@ -181,7 +113,7 @@ def adjust_bag(request, slug):
     else:
         messages.error(request, "Unable to update item - not found in bag")
 
-    request.session['bag'] = bag
+    save_bag(request, bag)
     return redirect(redirect_url)
 
 
@@ -224,7 +156,7 @@ def remove_from_bag(request, slug):
             else:
                 messages.error(request, "Item not found in bag")
 
-        request.session['bag'] = bag
+        save_bag(request, bag)
         return HttpResponse(status=200)
 
     except Exception as e:
@@ -268,5 +200,64 @@ def update_bag_all(request):
                     f"{colour.capitalize()}) from your bag"
                 )
 
-    request.session['bag'] = bag
+    save_bag(request, bag)
     return redirect('view_bag')
+
+
+def _bag_summary_etag(request):
+    """
+    Return an ETag for the bag summary, or ``None`` when it can't be
+    reused.
+
+    The count only depends on the bag itself. Priced summaries also
+    depend on the catalog price version and the member discount.
+    Responses carrying a CSRF token are never revalidated because each
+    token is freshly masked.
+    """
+    if request.GET.get('csrf'):
+        return None
+
+    parts = [bag_fingerprint(request.session.get('bag', {}))]
+    if request.GET.get('prices'):
+        parts += [
+            'prices',
+            str(get_price_version()),
+            str(get_is_member(request)),
+        ]
+    return hashlib.sha1(':'.join(parts).encode('utf-8')).hexdigest()
+
+
+@require_GET
+@etag(_bag_summary_etag)
+def bag_summary(request):
+    """
+    Return the bag count (and optionally totals) as JSON.
+
+    Cached catalog pages render the nav badge blank and fill it in from
+    here. The count is read straight from the session. Only with
+    ``?prices=1`` is the bag priced, reusing the totals cached in the
+    session when they are still valid. With ``?csrf=1`` the visitor's
+    own CSRF token is included so forms on shared pages can be patched
+    before they are posted.
+
+    Responses are private and carry an ETag, so browsers revalidate
+    and get a ``304 Not Modified`` while the bag is unchanged.
+    """
+    payload = {
+        'product_count': count_bag_items(request.session.get('bag', {})),
+    }
+    if request.GET.get('prices'):
+        summary = get_bag_summary(request)
+        payload.update({
+            'total': summary['total'],
+            'discount': summary['discount'],
+            'delivery': summary['delivery'],
+            'grand_total': summary['grand_total'],
+            'free_delivery_delta': summary['free_delivery_delta'],
+        })
+    if request.GET.get('csrf'):
+        payload['csrf_token'] = get_token(request)
+
+    response = JsonResponse(payload)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Order, OrderLineItem
+from .models import (
+    Order, OrderLineItem, ProcessedStripeEvent, QueuedEmail, WebhookJob
+)
+from .utils import defer_order_total_updates
 
 
 class OrderLineItemAdminInline(admin.TabularInline):
@@ -34,5 +37,51 @@ class OrderAdmin(admin.ModelAdmin):
 
     ordering = ('-date',)
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Save the inline line items, recalculating the order's totals
+        once rather than after every line item.
+        """
+        with defer_order_total_updates():
+            super().save_related(request, form, formsets, change)
+
+
+class WebhookJobAdmin(admin.ModelAdmin):
+    """Admin configuration for queued Stripe webhook jobs."""
+    list_display = (
+        'event_type', 'event_id', 'status', 'attempts',
+        'run_after', 'created',
+    )
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id',)
+    readonly_fields = (
+        'event_id', 'event_type', 'payload', 'attempts',
+        'last_error', 'created', 'updated',
+    )
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    """Admin configuration for the email outbox."""
+    list_display = (
+        'subject', 'status', 'attempts', 'send_after', 'sent_at',
+    )
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = (
+        'subject', 'body', 'from_email', 'recipients', 'attempts',
+        'last_error', 'created', 'sent_at',
+    )
+
+
+class ProcessedStripeEventAdmin(admin.ModelAdmin):
+    """Admin configuration for handled Stripe webhook events."""
+    list_display = ('event_id', 'event_type', 'received')
+    list_filter = ('event_type',)
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event_type', 'received')
+
 
 admin.site.register(Order, OrderAdmin)
+admin.site.register(WebhookJob, WebhookJobAdmin)
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
+admin.site.register(ProcessedStripeEvent, ProcessedStripeEventAdmin)
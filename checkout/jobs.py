@@ -0,0 +1,152 @@
+"""
+A small database-backed queue for Stripe webhook work.
+
+The webhook view records each event as a ``WebhookJob`` and answers
+Stripe straight away, so web workers are never tied up waiting on
+order reconciliation. A separate worker process
+(``python manage.py process_webhook_jobs``) claims due jobs one at a
+time and runs them. Failed jobs are retried with exponential backoff
+until ``MAX_ATTEMPTS`` is reached (or straight away if the runner raises
+``FailJob``), then marked as failed for a human to look at in the admin.
+
+A job is claimed in a short transaction that counts the attempt and
+leases it to the worker by pushing ``run_after`` forward by
+``JOB_LEASE``. It then runs outside that transaction, so no row lock or
+transaction is held open while waiting on Stripe. If the worker stops
+before recording a result, the job becomes due again once the lease
+runs out.
+"""
+import json
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import WebhookJob
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 300
+
+# How long a claimed job is reserved for its worker. Longer than any run
+# should take, Stripe retries included.
+JOB_LEASE = timedelta(minutes=5)
+
+
+class RetryJob(Exception):
+    """
+    Raised by a job runner when the job can't complete yet and should
+    be tried again after the usual backoff.
+    """
+
+
+class FailJob(Exception):
+    """
+    Raised by a job runner when retrying can't help, so the job is
+    marked as failed straight away for a human to look at.
+    """
+
+
+def enqueue_webhook_job(event):
+    """
+    Queue a Stripe event's data object for the background worker.
+
+    Returns:
+        WebhookJob: The new pending job, due immediately.
+    """
+    return WebhookJob.objects.create(
+        event_id=event.get('id') or '',
+        event_type=event['type'],
+        payload=json.dumps(event['data']['object']),
+    )
+
+
+def backoff_delay(attempts):
+    """
+    Return how long to wait before retrying a job that has been tried
+    ``attempts`` times: 1s, 2s, 4s... capped at ``BACKOFF_MAX_SECONDS``.
+    """
+    seconds = BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, BACKOFF_MAX_SECONDS))
+
+
+def _claim_job():
+    """
+    Claim the next due job, or return ``None`` if there isn't one.
+
+    The row is locked with ``SELECT ... FOR UPDATE SKIP LOCKED`` (on
+    databases that support it) only while the attempt is counted and
+    the lease taken. A job still pending after ``MAX_ATTEMPTS`` claims
+    lost its worker every time, so it is marked as failed instead.
+    """
+    with transaction.atomic():
+        job = (
+            WebhookJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                status=WebhookJob.PENDING,
+                run_after__lte=timezone.now(),
+            )
+            .order_by('run_after', 'pk')
+            .first()
+        )
+        if job is None:
+            return None
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = WebhookJob.FAILED
+            job.last_error = (
+                job.last_error or 'The worker stopped while running the job'
+            )
+        else:
+            job.attempts += 1
+            job.run_after = timezone.now() + JOB_LEASE
+        job.save()
+    return job
+
+
+def _run_job(job, run):
+    """
+    Run a claimed job and record the outcome on it.
+
+    The runner's database writes happen in their own transaction, so a
+    failed attempt leaves nothing half-written behind.
+    """
+    try:
+        with transaction.atomic():
+            run(job)
+    except Exception as e:
+        job.last_error = str(e) or e.__class__.__name__
+        if isinstance(e, FailJob) or job.attempts >= MAX_ATTEMPTS:
+            job.status = WebhookJob.FAILED
+        else:
+            job.run_after = timezone.now() + backoff_delay(job.attempts)
+    else:
+        job.status = WebhookJob.DONE
+        job.last_error = ''
+    job.save()
+
+
+def process_due_jobs(run, limit=50):
+    """
+    Run up to ``limit`` pending jobs whose ``run_after`` has passed.
+
+    Each job is claimed first (see ``_claim_job``), so several workers
+    can share the queue without running the same job twice, and then
+    run and recorded outside the claiming transaction.
+
+    Args:
+        run (callable): Called with each ``WebhookJob`` to do its work.
+        limit (int): The most jobs to run in this pass.
+
+    Returns:
+        int: The number of jobs run.
+    """
+    processed = 0
+    while processed < limit:
+        job = _claim_job()
+        if job is None:
+            break
+        if job.status == WebhookJob.PENDING:
+            _run_job(job, run)
+            processed += 1
+    return processed
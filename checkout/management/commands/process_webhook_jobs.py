@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.jobs import process_due_jobs
+from checkout.webhook_handler import StripeWH_Handler
+
+
+class Command(BaseCommand):
+    """
+    Run queued Stripe webhook jobs.
+
+    Runs as the ``worker`` process in the Procfile, polling the queue
+    until stopped. Use ``--once`` to run the currently due jobs and exit
+    (e.g. from a scheduler).
+    """
+    help = 'Process queued Stripe webhook jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Run the jobs that are due now, then exit.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait when the queue is empty.',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Most jobs to run per pass.',
+        )
+
+    def handle(self, *args, **options):
+        handler = StripeWH_Handler()
+
+        while True:
+            processed = process_due_jobs(
+                handler.run_job, limit=options['limit']
+            )
+            if processed:
+                self.stdout.write(f'Processed {processed} webhook job(s).')
+            if options['once']:
+                break
+            if not processed:
+                time.sleep(options['interval'])
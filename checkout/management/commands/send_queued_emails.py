@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    """
+    Deliver queued outbox emails.
+
+    Runs as the ``mailer`` process in the Procfile, polling the outbox
+    until stopped. Use ``--once`` to send the currently due emails and
+    exit (e.g. from a scheduler).
+    """
+    help = 'Send queued outbox emails.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Send the emails that are due now, then exit.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help='Seconds to wait when the outbox is empty.',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Most emails to send per batch.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_emails(limit=options['limit'])
+            if sent:
+                self.stdout.write(f'Sent {sent} email(s).')
+            if options['once']:
+                break
+            if not sent:
+                time.sleep(options['interval'])
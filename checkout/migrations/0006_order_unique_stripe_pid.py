@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0005_webhookjob'),
+        ('profiles', '0002_userprofile_is_member'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('stripe_pid', ''), _negated=True), fields=('stripe_pid',), name='unique_order_stripe_pid'),
+        ),
+    ]
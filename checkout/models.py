@@ -3,16 +3,19 @@ from decimal import Decimal
 
 from django.db import models
 from django.db.models import Sum
-from django.conf import settings
+from django.utils import timezone
 
 from django_countries.fields import CountryField
 
+from bag.utils import calculate_delivery
 from products.models import ProductVariant
 from profiles.models import UserProfile
 
 
 class Order(models.Model):
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(
+        max_length=32, null=False, editable=False, unique=True
+    )
     user_profile = models.ForeignKey(
         UserProfile,
         on_delete=models.SET_NULL,
@@ -33,7 +36,7 @@ class Order(models.Model):
     street_address1 = models.CharField(max_length=80, null=False, blank=False)
     street_address2 = models.CharField(max_length=80, null=True, blank=True)
     county = models.CharField(max_length=80, null=True, blank=True)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
     delivery_cost = models.DecimalField(
         max_digits=6,
         decimal_places=2,
@@ -63,9 +66,21 @@ class Order(models.Model):
         max_length=254,
         null=False,
         blank=False,
-        default=''
+        default='',
+        db_index=True
     )
 
+    class Meta:
+        constraints = [
+            # One order per payment intent, so the webhook can match its
+            # order on the PID alone
+            models.UniqueConstraint(
+                fields=['stripe_pid'],
+                condition=~models.Q(stripe_pid=''),
+                name='unique_order_stripe_pid',
+            ),
+        ]
+
     def _generate_order_number(self):
         """
         Return a unique, random order number using UUID4.
@@ -78,25 +93,18 @@ class Order(models.Model):
         """
         Calculate and update the order's totals.
 
-        Adds up line item totals, applies delivery costs
-        (if below free delivery threshold), subtracts any discount,
-        and saves the grand total.
+        Adds up line item totals, subtracts any discount, applies
+        delivery costs (if the discounted total is below the free
+        delivery threshold), and saves the grand total.
         """
         self.order_total = self.lineitems.aggregate(
             Sum('lineitem_total')
         )['lineitem_total__sum'] or Decimal('0.00')
 
-        if self.order_total < settings.FREE_DELIVERY_THRESHOLD:
-            self.delivery_cost = (
-                self.order_total *
-                Decimal(settings.STANDARD_DELIVERY_PERCENTAGE) / 100
-            )
-        else:
-            self.delivery_cost = Decimal('0.00')
-
-        self.grand_total = (
-            self.order_total + self.delivery_cost - self.discount
-        )
+        # Delivery is charged on the discounted total, as in the bag
+        total_after_discount = self.order_total - self.discount
+        self.delivery_cost = calculate_delivery(total_after_discount)
+        self.grand_total = total_after_discount + self.delivery_cost
         self.save()
 
     def save(self, *args, **kwargs):
@@ -151,3 +159,125 @@ class OrderLineItem(models.Model):
         Return a readable string showing the SKU and related order number.
         """
         return f"SKU {self.variant.sku} on order {self.order.order_number}"
+
+
+class ProcessedStripeEvent(models.Model):
+    """
+    A Stripe webhook event that has already been handled.
+
+    Stripe may deliver the same event more than once; the webhook view
+    records each event id here and acknowledges repeats without
+    handling them again.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    received = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-received']
+
+    def __str__(self):
+        """
+        Return the event type and id.
+        """
+        return f"{self.event_type} {self.event_id}"
+
+
+class WebhookJob(models.Model):
+    """
+    A unit of Stripe webhook work queued for the background worker.
+
+    The webhook view only records the job and acknowledges the event;
+    ``python manage.py process_webhook_jobs`` runs it, retrying with
+    backoff until it succeeds or runs out of attempts.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=255, blank=True, default='')
+    event_type = models.CharField(max_length=100)
+    payload = models.TextField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(
+                fields=['status', 'run_after'],
+                name='checkout_webhookjob_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Return the event type and id with the job's status.
+        """
+        return f"{self.event_type} {self.event_id} ({self.status})"
+
+
+class QueuedEmail(models.Model):
+    """
+    An email waiting in the outbox.
+
+    Code that needs to send mail (e.g. order confirmations) queues it
+    here instead of talking to SMTP itself;
+    ``python manage.py send_queued_emails`` delivers queued mail in
+    batches, retrying failures with backoff.
+
+    A worker marks the emails it is about to send as ``SENDING``, so
+    mail left in that status was claimed by a worker that stopped before
+    recording the result. It isn't sent again automatically, as it may
+    already have been delivered.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    send_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['send_after']
+        indexes = [
+            models.Index(
+                fields=['status', 'send_after'],
+                name='checkout_queuedemail_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Return the subject and recipients with the email's status.
+        """
+        recipients = ', '.join(self.recipients)
+        return f"{self.subject} to {recipients} ({self.status})"
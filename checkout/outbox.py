@@ -0,0 +1,139 @@
+"""
+The email outbox.
+
+Mail is queued as ``QueuedEmail`` rows by ``queue_email`` and delivered
+by a separate worker process (``python manage.py send_queued_emails``),
+so a slow mail server never holds up a request or a webhook job.
+
+Queued mail is sent in batches over a single connection to the mail
+server. Failed sends are retried with the same exponential backoff as
+webhook jobs (see ``checkout.jobs``) until ``MAX_ATTEMPTS`` is reached.
+Queuing inside a transaction means mail is only sent if the
+transaction commits.
+
+A batch is claimed in a short transaction that marks it as sending, so
+no transaction is held open while talking to the mail server, and the
+result of each send is saved as soon as it is known. If the worker
+stops mid-batch, the emails it had claimed but not recorded stay
+``SENDING`` rather than being sent twice; they can be reviewed and set
+back to pending in the admin.
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .jobs import MAX_ATTEMPTS, backoff_delay
+from .models import QueuedEmail
+
+
+def queue_email(subject, body, recipients, from_email=None):
+    """
+    Queue an email for the outbox worker.
+
+    Returns:
+        QueuedEmail: The new pending email, due immediately.
+    """
+    return QueuedEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def _record_failure(email, error):
+    """
+    Count a failed send and schedule a retry, or give up.
+    """
+    email.attempts += 1
+    email.last_error = str(error) or error.__class__.__name__
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = QueuedEmail.FAILED
+    else:
+        email.status = QueuedEmail.PENDING
+        email.send_after = timezone.now() + backoff_delay(email.attempts)
+
+
+def _claim_batch(limit):
+    """
+    Mark up to ``limit`` due pending emails as sending and return them.
+
+    The rows are locked with ``SELECT ... FOR UPDATE SKIP LOCKED`` (on
+    databases that support it) only for as long as it takes to claim
+    them, so workers running side by side never pick the same email.
+    """
+    with transaction.atomic():
+        emails = list(
+            QueuedEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                status=QueuedEmail.PENDING,
+                send_after__lte=timezone.now(),
+            )
+            .order_by('send_after', 'pk')[:limit]
+        )
+        QueuedEmail.objects.filter(
+            pk__in=[email.pk for email in emails]
+        ).update(status=QueuedEmail.SENDING)
+    for email in emails:
+        email.status = QueuedEmail.SENDING
+    return emails
+
+
+def _save_result(email):
+    """Save the outcome of sending ``email``."""
+    email.save(update_fields=[
+        'status', 'attempts', 'send_after', 'last_error', 'sent_at',
+    ])
+
+
+def send_queued_emails(limit=50):
+    """
+    Send up to ``limit`` pending emails that are due.
+
+    The batch is claimed first, then sent over one connection to the
+    mail server outside any transaction, saving each email's result
+    straight after its send. If the connection can't be opened, every
+    email in the batch counts a failed attempt.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    emails = _claim_batch(limit)
+    if not emails:
+        return 0
+
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            _record_failure(email, e)
+            _save_result(email)
+        return 0
+
+    try:
+        for email in emails:
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email,
+                email.recipients,
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                _record_failure(email, e)
+            else:
+                email.attempts += 1
+                email.status = QueuedEmail.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                sent += 1
+            _save_result(email)
+    finally:
+        connection.close()
+    return sent
@@ -2,6 +2,7 @@ from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 from .models import OrderLineItem
+from .utils import schedule_order_total_update
 
 
 @receiver(post_save, sender=OrderLineItem)
@@ -9,7 +10,7 @@ def update_on_save(sender, instance, created, **kwargs):
     """
     Update order total on lineitem update/create
     """
-    instance.order.update_total()
+    schedule_order_total_update(instance.order)
 
 
 @receiver(post_delete, sender=OrderLineItem)
@@ -17,4 +18,4 @@ def update_on_delete(sender, instance, **kwargs):
     """
     Update order total on lineitem delete
     """
-    instance.order.update_total()
+    schedule_order_total_update(instance.order)
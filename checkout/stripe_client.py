@@ -0,0 +1,187 @@
+"""
+The shared Stripe API client.
+
+Every Stripe API call in the shop goes through ``get_stripe_client()``.
+The client is created once per worker process on a pooled, keep-alive
+``requests`` session, so after the first call checkout pages and the
+webhook worker reuse open HTTPS connections instead of paying for a new
+TLS handshake each time.
+
+Async views use ``get_async_stripe_client()`` instead, which makes the
+same calls over httpx's pooled ``AsyncClient`` (``create_async`` etc.).
+
+Calls are bounded by ``STRIPE_CONNECT_TIMEOUT``/``STRIPE_READ_TIMEOUT``
+and counted in ``stripe_metrics``. ``STRIPE_API_BASE`` points the client
+at another host, such as a local stub server in tests.
+"""
+import threading
+import time
+from functools import lru_cache
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Keep-alive connections held open per host
+POOL_MAXSIZE = 10
+
+
+class StripeMetrics:
+    """
+    Per-worker counters for Stripe API calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Zero the counters.
+        """
+        with self._lock:
+            self.requests = 0
+            self.errors = 0
+            self.total_seconds = 0.0
+
+    def record(self, seconds, error=False):
+        """
+        Record one API call that took ``seconds``.
+        """
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            if error:
+                self.errors += 1
+
+    def snapshot(self):
+        """
+        Return the counters and average call time as a dict.
+        """
+        with self._lock:
+            average = (
+                self.total_seconds / self.requests if self.requests else 0.0
+            )
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'total_seconds': self.total_seconds,
+                'average_ms': average * 1000,
+            }
+
+
+stripe_metrics = StripeMetrics()
+
+
+class MeteredRequestsClient(stripe.RequestsClient):
+    """
+    A ``RequestsClient`` that records every call in ``stripe_metrics``.
+
+    Connection failures and 5xx responses count as errors.
+    """
+
+    def request(self, method, url, headers, post_data=None):
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, headers, post_data)
+        except Exception:
+            stripe_metrics.record(time.monotonic() - start, error=True)
+            raise
+        stripe_metrics.record(
+            time.monotonic() - start, error=response[1] >= 500
+        )
+        return response
+
+
+class MeteredHTTPXClient(stripe.HTTPXClient):
+    """
+    An async ``HTTPXClient`` that records every call in
+    ``stripe_metrics``.
+    """
+
+    async def request_async(self, method, url, headers, post_data=None):
+        start = time.monotonic()
+        try:
+            response = await super().request_async(
+                method, url, headers, post_data
+            )
+        except Exception:
+            stripe_metrics.record(time.monotonic() - start, error=True)
+            raise
+        stripe_metrics.record(
+            time.monotonic() - start, error=response[1] >= 500
+        )
+        return response
+
+
+def _build_session():
+    """
+    Return a ``requests`` session that keeps a pool of connections
+    open for reuse.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _client_options():
+    """Return the ``StripeClient`` options shared by both clients."""
+    base_addresses = {}
+    if settings.STRIPE_API_BASE:
+        base_addresses['api'] = settings.STRIPE_API_BASE
+    return {
+        'base_addresses': base_addresses,
+        'max_network_retries': settings.STRIPE_MAX_NETWORK_RETRIES,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_stripe_client():
+    """
+    Return this worker's ``stripe.StripeClient``, creating it on first
+    use.
+
+    Call ``get_stripe_client.cache_clear()`` after changing the Stripe
+    settings (e.g. in tests).
+    """
+    http_client = MeteredRequestsClient(
+        session=_build_session(),
+        timeout=(
+            settings.STRIPE_CONNECT_TIMEOUT,
+            settings.STRIPE_READ_TIMEOUT,
+        ),
+    )
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        http_client=http_client,
+        **_client_options(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_stripe_client():
+    """
+    Return this worker's async-only ``stripe.StripeClient``, creating it
+    on first use.
+
+    Its httpx connection pool belongs to the event loop it is first
+    used on, which under uvicorn is the worker's only loop. Call
+    ``get_async_stripe_client.cache_clear()`` between event loops
+    (e.g. in tests).
+    """
+    import httpx
+
+    http_client = MeteredHTTPXClient(
+        timeout=httpx.Timeout(
+            settings.STRIPE_READ_TIMEOUT,
+            connect=settings.STRIPE_CONNECT_TIMEOUT,
+        ),
+    )
+    return stripe.StripeClient(
+        settings.STRIPE_SECRET_KEY,
+        http_client=http_client,
+        **_client_options(),
+    )
@@ -0,0 +1,190 @@
+"""
+Test suite for the webhook job queue in checkout.jobs.
+
+Covers:
+- Enqueuing events
+- Running due jobs, retries with backoff and final failure
+- Claiming jobs with a lease before running them
+- The process_webhook_jobs management command
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from checkout.jobs import (
+    JOB_LEASE, MAX_ATTEMPTS, BACKOFF_MAX_SECONDS, FailJob, RetryJob,
+    backoff_delay, enqueue_webhook_job, process_due_jobs,
+)
+from checkout.models import WebhookJob
+
+
+class WebhookJobQueueTest(TestCase):
+    """
+    Tests for enqueuing and processing webhook jobs.
+    """
+
+    def setUp(self):
+        self.job = enqueue_webhook_job({
+            'id': 'evt_1',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {'id': 'pi_1'}},
+        })
+
+    def test_enqueue_creates_due_pending_job(self):
+        """
+        A new job is pending and due immediately.
+        """
+        self.assertEqual(self.job.status, WebhookJob.PENDING)
+        self.assertEqual(self.job.attempts, 0)
+        self.assertLessEqual(self.job.run_after, timezone.now())
+        self.assertEqual(self.job.payload, '{"id": "pi_1"}')
+
+    def test_successful_job_is_marked_done(self):
+        """
+        A job whose runner returns normally is done.
+        """
+        ran = []
+        self.assertEqual(process_due_jobs(ran.append), 1)
+        self.assertEqual(ran, [self.job])
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.DONE)
+        self.assertEqual(self.job.attempts, 1)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """
+        A job that raises stays pending and is pushed back.
+        """
+        def run(job):
+            raise RetryJob('not yet')
+
+        before = timezone.now()
+        process_due_jobs(run)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.PENDING)
+        self.assertEqual(self.job.attempts, 1)
+        self.assertEqual(self.job.last_error, 'not yet')
+        self.assertGreaterEqual(
+            self.job.run_after, before + backoff_delay(1)
+        )
+        # Not due again until the backoff has passed
+        self.assertEqual(process_due_jobs(run), 0)
+
+    def test_job_fails_after_max_attempts(self):
+        """
+        A job that keeps failing is marked failed on its last attempt.
+        """
+        WebhookJob.objects.update(attempts=MAX_ATTEMPTS - 1)
+
+        def run(job):
+            raise ValueError('boom')
+
+        process_due_jobs(run)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.FAILED)
+        self.assertEqual(self.job.last_error, 'boom')
+
+    def test_fail_job_is_not_retried(self):
+        """
+        A job that raises FailJob is marked failed on its first attempt.
+        """
+        def run(job):
+            raise FailJob('mismatch')
+
+        process_due_jobs(run)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.FAILED)
+        self.assertEqual(self.job.attempts, 1)
+        self.assertEqual(self.job.last_error, 'mismatch')
+
+    def test_job_runs_outside_claim_transaction(self):
+        """
+        Only the runner's own transaction is open while the job runs,
+        and the job is already leased to this worker.
+        """
+        seen = []
+
+        def run(job):
+            seen.append((
+                len(connection.atomic_blocks),
+                WebhookJob.objects.get(pk=job.pk).run_after,
+            ))
+
+        # TestCase wraps each test in transactions of its own
+        depth = len(connection.atomic_blocks)
+        before = timezone.now()
+        process_due_jobs(run)
+
+        blocks, run_after = seen[0]
+        self.assertEqual(blocks, depth + 1)
+        self.assertGreaterEqual(run_after, before + JOB_LEASE)
+
+    def test_job_is_rerun_after_lease_if_worker_stops(self):
+        """
+        A job whose worker stopped mid-run becomes due again once its
+        lease runs out.
+        """
+        def stop(job):
+            raise SystemExit
+
+        with self.assertRaises(SystemExit):
+            process_due_jobs(stop)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.PENDING)
+        self.assertEqual(self.job.attempts, 1)
+        self.assertEqual(process_due_jobs(lambda job: None), 0)
+
+        WebhookJob.objects.update(run_after=timezone.now())
+        self.assertEqual(process_due_jobs(lambda job: None), 1)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.DONE)
+        self.assertEqual(self.job.attempts, 2)
+
+    def test_job_abandoned_too_often_fails(self):
+        """
+        A job still pending after using every attempt is failed without
+        running it again.
+        """
+        WebhookJob.objects.update(attempts=MAX_ATTEMPTS)
+        ran = []
+        self.assertEqual(process_due_jobs(ran.append), 0)
+
+        self.assertEqual(ran, [])
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, WebhookJob.FAILED)
+        self.assertTrue(self.job.last_error)
+
+    def test_future_jobs_are_not_run(self):
+        """
+        Jobs whose run_after is in the future are left alone.
+        """
+        WebhookJob.objects.update(
+            run_after=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(process_due_jobs(lambda job: None), 0)
+
+    def test_backoff_doubles_up_to_cap(self):
+        """
+        Backoff doubles per attempt and is capped.
+        """
+        self.assertEqual(backoff_delay(1), timedelta(seconds=1))
+        self.assertEqual(backoff_delay(3), timedelta(seconds=4))
+        self.assertEqual(
+            backoff_delay(50), timedelta(seconds=BACKOFF_MAX_SECONDS)
+        )
+
+    @patch('checkout.webhook_handler.StripeWH_Handler.run_job')
+    def test_command_once_runs_due_jobs(self, mock_run):
+        """
+        process_webhook_jobs --once runs due jobs and exits.
+        """
+        out = StringIO()
+        call_command('process_webhook_jobs', '--once', stdout=out)
+        mock_run.assert_called_once()
+        self.assertIn('Processed 1 webhook job(s).', out.getvalue())
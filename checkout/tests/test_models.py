@@ -4,9 +4,12 @@ Test suite for checkout models: Order and OrderLineItem.
 Covers:
 - String representations
 - Total and delivery cost calculations
+- Indexed order lookups
+- One order per Stripe payment intent
 """
 
 from decimal import Decimal
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 from checkout.models import Order, OrderLineItem
 from django.contrib.auth.models import User
@@ -58,6 +61,42 @@ class OrderModelTest(TestCase):
         """__str__ should return the order number."""
         self.assertEqual(str(self.order), self.order.order_number)
 
+    def test_order_lookups_use_indexes(self):
+        """Order number, Stripe PID and date lookups avoid table scans."""
+        plans = [
+            Order.objects.filter(
+                order_number=self.order.order_number
+            ).explain(),
+            Order.objects.filter(stripe_pid='pid456').explain(),
+            Order.objects.order_by('-date')[:20].explain(),
+        ]
+        for plan in plans:
+            self.assertIn('INDEX', plan)
+            self.assertNotIn('SCAN checkout_order\n', plan + '\n')
+
+    def test_stripe_pid_is_unique_unless_blank(self):
+        """A PID can only belong to one order; blank PIDs may repeat."""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(
+                full_name='Duplicate',
+                email='dup@example.com',
+                phone_number='0123456789',
+                street_address1='1 Road',
+                town_or_city='City',
+                country='GB',
+                stripe_pid='pid456',
+            )
+        for _ in range(2):
+            Order.objects.create(
+                full_name='No PID',
+                email='nopid@example.com',
+                phone_number='0123456789',
+                street_address1='1 Road',
+                town_or_city='City',
+                country='GB',
+            )
+        self.assertEqual(Order.objects.filter(stripe_pid='').count(), 2)
+
     def test_update_total_adds_correct_totals(self):
         """update_total should calculate lineitems + delivery correctly."""
         self.order.update_total()
@@ -67,6 +106,14 @@ class OrderModelTest(TestCase):
             self.order.order_total + self.order.delivery_cost
         )
 
+    def test_delivery_is_charged_on_discounted_total(self):
+        """update_total prices delivery after the member discount, as
+        the bag does."""
+        self.order.discount = Decimal('4.00')
+        self.order.update_total()
+        self.assertEqual(self.order.delivery_cost, Decimal('3.60'))
+        self.assertEqual(self.order.grand_total, Decimal('39.58'))
+
 
 class OrderLineItemModelTest(TestCase):
     """
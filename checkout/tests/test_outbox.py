@@ -0,0 +1,205 @@
+"""
+Test suite for the email outbox in checkout.outbox.
+
+Covers:
+- Queuing emails
+- Sending a batch over one connection
+- Claiming a batch before sending and saving each result
+- Retries with backoff and final failure
+- The send_queued_emails management command
+- Order confirmations going through the outbox
+"""
+
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from checkout.jobs import MAX_ATTEMPTS, backoff_delay
+from checkout.models import Order, QueuedEmail
+from checkout.outbox import queue_email, send_queued_emails
+from checkout.webhook_handler import StripeWH_Handler
+
+
+class OutboxTest(TestCase):
+    """
+    Tests for queuing and sending outbox emails.
+    """
+
+    def setUp(self):
+        self.first = queue_email('First', 'Body one', ['one@example.com'])
+        self.second = queue_email('Second', 'Body two', ['two@example.com'])
+
+    def test_queue_email_does_not_send(self):
+        """
+        Queuing stores a pending email without sending anything.
+        """
+        self.assertEqual(self.first.status, QueuedEmail.PENDING)
+        self.assertEqual(self.first.recipients, ['one@example.com'])
+        self.assertTrue(self.first.from_email)
+        self.assertEqual(mail.outbox, [])
+
+    def test_batch_is_sent_over_one_connection(self):
+        """
+        All due emails are sent using a single mail connection.
+        """
+        with patch(
+            'checkout.outbox.get_connection', wraps=get_connection
+        ) as mock_connection:
+            self.assertEqual(send_queued_emails(), 2)
+
+        mock_connection.assert_called_once()
+        self.assertEqual(
+            [m.subject for m in mail.outbox], ['First', 'Second']
+        )
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, QueuedEmail.SENT)
+        self.assertIsNotNone(self.first.sent_at)
+        # Nothing left to send
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_sends_outside_transaction(self):
+        """
+        The batch is marked sending before any mail goes out, and no
+        transaction is held open while sending.
+        """
+        seen = []
+
+        def send(message):
+            seen.append((
+                len(connection.atomic_blocks),
+                list(QueuedEmail.objects.values_list('status', flat=True)),
+            ))
+            return 1
+
+        # TestCase wraps each test in transactions of its own
+        depth = len(connection.atomic_blocks)
+        with patch(
+            'checkout.outbox.EmailMessage.send', autospec=True,
+            side_effect=send,
+        ):
+            send_queued_emails()
+
+        self.assertEqual([blocks for blocks, _ in seen], [depth, depth])
+        self.assertEqual(
+            seen[0][1], [QueuedEmail.SENDING, QueuedEmail.SENDING]
+        )
+        self.assertEqual(
+            seen[1][1], [QueuedEmail.SENT, QueuedEmail.SENDING]
+        )
+
+    def test_crash_mid_batch_does_not_resend(self):
+        """
+        If the worker stops mid-batch, delivered mail stays sent and the
+        email it was sending isn't picked up again.
+        """
+        with patch(
+            'checkout.outbox.EmailMessage.send',
+            side_effect=[1, SystemExit()],
+        ):
+            with self.assertRaises(SystemExit):
+                send_queued_emails()
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.status, QueuedEmail.SENT)
+        self.assertEqual(self.second.status, QueuedEmail.SENDING)
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_failed_send_is_retried_with_backoff(self):
+        """
+        An email that fails to send stays pending and is pushed back.
+        """
+        before = timezone.now()
+        with patch(
+            'checkout.outbox.EmailMessage.send',
+            side_effect=[OSError('mail server down'), 1],
+        ):
+            self.assertEqual(send_queued_emails(), 1)
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, QueuedEmail.PENDING)
+        self.assertEqual(self.first.attempts, 1)
+        self.assertEqual(self.first.last_error, 'mail server down')
+        self.assertGreaterEqual(
+            self.first.send_after, before + backoff_delay(1)
+        )
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.status, QueuedEmail.SENT)
+
+    def test_connection_failure_fails_whole_batch(self):
+        """
+        If the mail server can't be reached no email is sent.
+        """
+        with patch(
+            'django.core.mail.backends.locmem.EmailBackend.open',
+            side_effect=OSError('refused'),
+        ):
+            self.assertEqual(send_queued_emails(), 0)
+
+        self.assertEqual(
+            QueuedEmail.objects.filter(attempts=1).count(), 2
+        )
+        self.assertEqual(mail.outbox, [])
+
+    def test_email_fails_after_max_attempts(self):
+        """
+        An email that keeps failing is marked failed.
+        """
+        QueuedEmail.objects.update(attempts=MAX_ATTEMPTS - 1)
+        with patch(
+            'checkout.outbox.EmailMessage.send', side_effect=OSError('no')
+        ):
+            send_queued_emails()
+        self.assertEqual(
+            QueuedEmail.objects.filter(status=QueuedEmail.FAILED).count(), 2
+        )
+
+    def test_future_emails_wait(self):
+        """
+        Emails scheduled for later are not sent yet.
+        """
+        QueuedEmail.objects.update(
+            send_after=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_command_once_sends_due_emails(self):
+        """
+        send_queued_emails --once sends the outbox and exits.
+        """
+        out = StringIO()
+        call_command('send_queued_emails', '--once', stdout=out)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('Sent 2 email(s).', out.getvalue())
+
+
+class ConfirmationEmailOutboxTest(TestCase):
+    """
+    Order confirmations are queued, not sent, by the webhook handler.
+    """
+
+    def test_confirmation_is_queued(self):
+        """
+        The confirmation is rendered into the outbox for the customer.
+        """
+        order = Order.objects.create(
+            full_name='Queue Buyer',
+            email='buyer@example.com',
+            phone_number='0123456789',
+            street_address1='1 Road',
+            town_or_city='City',
+            country='GB',
+        )
+        StripeWH_Handler()._queue_confirmation_email(order)
+
+        self.assertEqual(mail.outbox, [])
+        queued = QueuedEmail.objects.get()
+        self.assertEqual(queued.recipients, ['buyer@example.com'])
+        self.assertIn(order.order_number, queued.subject)
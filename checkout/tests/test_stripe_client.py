@@ -0,0 +1,172 @@
+"""
+Test suite for the shared Stripe client in checkout.stripe_client.
+
+Runs the client against a local stub of the Stripe API.
+
+Covers:
+- One client per worker
+- Keep-alive connection reuse
+- Call metrics
+- The checkout page creating its PaymentIntent through the client
+"""
+
+import json
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from checkout.stripe_client import get_stripe_client, stripe_metrics
+from products.models import Product, ProductVariant
+
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    """
+    Answers PaymentIntent calls like the Stripe API, over keep-alive
+    HTTP/1.1 connections.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = parse_qs(self.rfile.read(length).decode())
+        self.server.calls.append((self.path, params, self.client_address))
+        if self.path in self.server.fail_paths:
+            self._respond(500, {'error': {'message': 'Stub failure'}})
+            return
+        amount = int(params.get('amount', ['0'])[0])
+        intent_id = f'pi_stub{len(self.server.calls) - 1}'
+        if self.path.startswith('/v1/payment_intents/'):
+            intent_id = self.path.rsplit('/', 1)[1]
+        self._respond(200, {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'client_secret': f'{intent_id}_secret_stub',
+            'status': self.server.intent_statuses.get(
+                intent_id, 'requires_payment_method'
+            ),
+        })
+
+    def _respond(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubStripeMixin:
+    """
+    Runs a stub Stripe API for the test and points the shared client at
+    it. Requests are recorded in ``self.server.calls`` as
+    ``(path, params, client_address)``; paths in
+    ``self.server.fail_paths`` answer with a 500, and intents can be
+    given a status through ``self.server.intent_statuses``.
+    """
+
+    def start_stub_stripe(self):
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), StubStripeHandler
+        )
+        self.server.daemon_threads = True
+        self.server.calls = []
+        self.server.fail_paths = set()
+        self.server.intent_statuses = {}
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings_override = override_settings(
+            STRIPE_API_BASE=f'http://127.0.0.1:{self.server.server_port}',
+            STRIPE_SECRET_KEY='sk_test_stub',
+            STRIPE_MAX_NETWORK_RETRIES=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        get_stripe_client.cache_clear()
+        self.addCleanup(get_stripe_client.cache_clear)
+        stripe_metrics.reset()
+
+
+class StripeClientTest(StubStripeMixin, TestCase):
+    """
+    Tests for get_stripe_client against a stub Stripe server.
+    """
+
+    def setUp(self):
+        self.start_stub_stripe()
+
+    def _create_intent(self, amount=1000):
+        return get_stripe_client().v1.payment_intents.create(params={
+            'amount': amount,
+            'currency': 'gbp',
+        })
+
+    def test_client_is_shared(self):
+        """
+        The same client is returned on every call.
+        """
+        self.assertIs(get_stripe_client(), get_stripe_client())
+
+    def test_calls_reuse_one_connection(self):
+        """
+        Consecutive calls go over the same keep-alive connection.
+        """
+        first = self._create_intent(1000)
+        second = self._create_intent(2500)
+
+        self.assertEqual(first.client_secret, 'pi_stub0_secret_stub')
+        self.assertEqual(second.amount, 2500)
+        self.assertEqual(len(self.server.calls), 2)
+        self.assertEqual(self.server.calls[0][0], '/v1/payment_intents')
+        client_ports = {address for _, _, address in self.server.calls}
+        self.assertEqual(len(client_ports), 1)
+
+    def test_metrics_count_calls_and_errors(self):
+        """
+        Every call is counted; server errors are counted as errors.
+        """
+        self._create_intent()
+        self.server.fail_paths.add('/v1/payment_intents')
+        with self.assertRaises(Exception):
+            self._create_intent()
+
+        metrics = stripe_metrics.snapshot()
+        self.assertEqual(metrics['requests'], 2)
+        self.assertEqual(metrics['errors'], 1)
+        self.assertGreater(metrics['total_seconds'], 0)
+
+    def test_checkout_page_creates_intent_via_client(self):
+        """
+        The checkout page gets its client secret from the shared client.
+        """
+        product = Product.objects.create(name='Tee', description='Tee')
+        ProductVariant.objects.create(
+            product=product, size='M', colour='Blue',
+            price=Decimal('12.00'), sku='TEE-M-BLUE'
+        )
+        session = self.client.session
+        session['bag'] = {str(product.pk): {'items_by_variant': {'m_blue': 1}}}
+        session.save()
+
+        response = self.client.get(reverse('checkout'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['client_secret'], 'pi_stub0_secret_stub'
+        )
+        path, params, _ = self.server.calls[0]
+        self.assertEqual(path, '/v1/payment_intents')
+        self.assertEqual(params['amount'], ['1320'])
+        self.assertEqual(params['currency'], ['gbp'])
@@ -0,0 +1,213 @@
+"""
+Test suite for checkout.utils.
+
+Covers:
+- Resolving bag lines to variants with a single query
+- Missing variants
+- Building an order with bulk-created line items
+- Deferring order total updates to the end of a block
+"""
+
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from checkout.models import Order, OrderLineItem
+from checkout.utils import (
+    build_order, defer_order_total_updates, resolve_order_lines
+)
+from products.models import Product, ProductVariant
+
+
+class ResolveOrderLinesTest(TestCase):
+    """
+    Tests for resolve_order_lines.
+    """
+
+    def setUp(self):
+        self.tee = Product.objects.create(name='Tee', description='Tee')
+        self.red = ProductVariant.objects.create(
+            product=self.tee, size='M', colour='Red',
+            price='15.00', sku='TEE-M-RED'
+        )
+        self.blue = ProductVariant.objects.create(
+            product=self.tee, size='L', colour='Blue',
+            price='16.00', sku='TEE-L-BLUE'
+        )
+        self.gel = Product.objects.create(name='Gel', description='Gel')
+        self.gel_variant = ProductVariant.objects.create(
+            product=self.gel, price='2.00', sku='GEL'
+        )
+
+    def test_resolves_all_lines_in_one_query(self):
+        """
+        Variant and non-variant lines resolve together, in bag order.
+        """
+        bag = {
+            str(self.tee.pk): {'items_by_variant': {'M_Red': 2, 'l_blue': 1}},
+            str(self.gel.pk): 3,
+        }
+        with self.assertNumQueries(1):
+            lines = resolve_order_lines(bag)
+        self.assertEqual(lines, [
+            (self.red, 2), (self.blue, 1), (self.gel_variant, 3),
+        ])
+
+    def test_missing_variant_raises(self):
+        """
+        A line whose variant is gone raises DoesNotExist.
+        """
+        bag = {str(self.tee.pk): {'items_by_variant': {'xl_green': 1}}}
+        with self.assertRaises(ProductVariant.DoesNotExist):
+            resolve_order_lines(bag)
+
+
+class BuildOrderTest(TestCase):
+    """
+    Tests for build_order.
+    """
+
+    setUp = ResolveOrderLinesTest.setUp
+
+    def _order(self):
+        return Order(
+            full_name='Bulk Buyer',
+            email='bulk@example.com',
+            phone_number='0123456789',
+            street_address1='1 Road',
+            town_or_city='City',
+            country='GB',
+            stripe_pid='pi_bulk',
+        )
+
+    def test_bulk_creates_lines_and_totals_once(self):
+        """
+        Lines are inserted together and the order is updated once.
+        """
+        bag = {
+            str(self.tee.pk): {'items_by_variant': {'m_red': 2, 'l_blue': 1}},
+            str(self.gel.pk): 3,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            order = build_order(self._order(), bag)
+
+        statements = [query['sql'].split()[0] for query in queries]
+        self.assertEqual(statements.count('INSERT'), 2)
+        self.assertEqual(statements.count('UPDATE'), 1)
+
+        totals = sorted(
+            order.lineitems.values_list('lineitem_total', flat=True)
+        )
+        self.assertEqual(
+            totals, [Decimal('6.00'), Decimal('16.00'), Decimal('30.00')]
+        )
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('52.00'))
+
+    def test_missing_variant_saves_nothing(self):
+        """
+        No order is saved when a variant can't be found.
+        """
+        bag = {str(self.tee.pk): {'items_by_variant': {'xl_green': 1}}}
+        with self.assertRaises(ProductVariant.DoesNotExist):
+            build_order(self._order(), bag)
+        self.assertFalse(Order.objects.exists())
+
+
+class DeferOrderTotalUpdatesTest(TestCase):
+    """
+    Tests for defer_order_total_updates.
+    """
+
+    setUp = ResolveOrderLinesTest.setUp
+    _order = BuildOrderTest._order
+
+    def _count_order_updates(self, queries):
+        return sum(
+            1 for q in queries
+            if q['sql'].startswith('UPDATE "checkout_order"')
+        )
+
+    def test_without_block_updates_per_line(self):
+        """
+        Outside a block every line item save updates the order.
+        """
+        order = self._order()
+        order.save()
+        with CaptureQueriesContext(connection) as ctx:
+            OrderLineItem.objects.create(
+                order=order, variant=self.red, quantity=1
+            )
+            OrderLineItem.objects.create(
+                order=order, variant=self.blue, quantity=1
+            )
+        self.assertEqual(self._count_order_updates(ctx.captured_queries), 2)
+
+    def test_block_updates_each_order_once(self):
+        """
+        Saves and deletes inside a block update the order once, at exit.
+        """
+        order = self._order()
+        order.save()
+        with CaptureQueriesContext(connection) as ctx:
+            with defer_order_total_updates():
+                OrderLineItem.objects.create(
+                    order=order, variant=self.red, quantity=1
+                )
+                blue = OrderLineItem.objects.create(
+                    order=order, variant=self.blue, quantity=1
+                )
+                OrderLineItem.objects.create(
+                    order=order, variant=self.gel_variant, quantity=1
+                )
+                blue.delete()
+                self.assertEqual(order.order_total, Decimal('0.00'))
+        self.assertEqual(self._count_order_updates(ctx.captured_queries), 1)
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('17.00'))
+
+    def test_nested_blocks_flush_at_outermost_exit(self):
+        """
+        An inner block leaves the update to the outer one.
+        """
+        order = self._order()
+        order.save()
+        with defer_order_total_updates():
+            with defer_order_total_updates():
+                OrderLineItem.objects.create(
+                    order=order, variant=self.red, quantity=1
+                )
+            order.refresh_from_db()
+            self.assertEqual(order.order_total, Decimal('0.00'))
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('15.00'))
+
+    def test_deleted_order_is_not_resaved(self):
+        """
+        An order deleted inside the block is not recreated at exit.
+        """
+        order = self._order()
+        order.save()
+        with defer_order_total_updates():
+            OrderLineItem.objects.create(
+                order=order, variant=self.red, quantity=1
+            )
+            Order.objects.filter(pk=order.pk).delete()
+        self.assertFalse(Order.objects.exists())
+
+    def test_error_drops_pending_updates(self):
+        """
+        If the block raises, the pending updates are not run.
+        """
+        order = self._order()
+        order.save()
+        with self.assertRaises(ValueError):
+            with defer_order_total_updates():
+                OrderLineItem.objects.create(
+                    order=order, variant=self.red, quantity=1
+                )
+                raise ValueError
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('0.00'))
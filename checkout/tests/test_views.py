@@ -6,13 +6,29 @@ Covers:
 - Redirect on empty bag
 - Checkout success page behavior
 - Stripe cache endpoint behavior
+- Resubmitting a checkout for an already-paid intent
+- Reusing the session's PaymentIntent across checkout reloads
+- The async checkout views
 """
 
+import json
 from decimal import Decimal
-from django.test import TestCase, Client
+from importlib.util import find_spec
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.test import AsyncRequestFactory, TestCase, Client
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage import default_storage
+from bag.utils import bag_fingerprint
 from checkout.models import Order
+from checkout.stripe_client import get_async_stripe_client
+from checkout.tests.test_stripe_client import StubStripeMixin
+from checkout.views import (
+    PAYMENT_INTENT_SESSION_KEY, cache_checkout_data_async, checkout_async
+)
 from profiles.models import UserProfile
 from products.models import Product, ProductVariant, Category
 
@@ -181,6 +197,99 @@ class CheckoutViewsTest(TestCase):
         messages = list(response.context['messages'])
         self.assertTrue(any("wasn't found" in str(m) for m in messages))
 
+    def test_checkout_resubmission_redirects_to_existing_order(self):
+        """
+        Posting again for a payment intent that already has an order
+        redirects to that order instead of creating a duplicate.
+        """
+        existing = Order.objects.create(
+            full_name='Name',
+            email='test@example.com',
+            phone_number='123',
+            country='GB',
+            town_or_city='Town',
+            street_address1='123 St',
+            stripe_pid='pi_12345',
+        )
+        session = self.client.session
+        session['bag'] = {
+            str(self.product.id): {
+                'items_by_variant': {
+                    f'{self.variant.size}_{self.variant.colour}': 1
+                }
+            }
+        }
+        session[PAYMENT_INTENT_SESSION_KEY] = {
+            'id': 'pi_12345',
+            'client_secret': 'pi_12345_secret_abcde',
+            'amount': 1100,
+        }
+        session.save()
+
+        response = self.client.post(reverse('checkout'), {
+            'full_name': 'Name',
+            'email': 'test@example.com',
+            'phone_number': '123',
+            'country': 'GB',
+            'postcode': '123',
+            'town_or_city': 'Town',
+            'street_address1': '123 St',
+            'street_address2': '',
+            'county': '',
+            'client_secret': 'pi_12345_secret_abcde'
+        })
+
+        self.assertRedirects(
+            response,
+            reverse('checkout_success', args=[existing.order_number]),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_checkout_never_redirects_to_another_sessions_order(self):
+        """
+        Posting the client secret of a payment intent this session
+        didn't create never hands over that intent's order.
+        """
+        Order.objects.create(
+            full_name='Someone Else',
+            email='other@example.com',
+            phone_number='123',
+            country='GB',
+            town_or_city='Town',
+            street_address1='1 Other St',
+            stripe_pid='pi_12345',
+        )
+        session = self.client.session
+        session['bag'] = {
+            str(self.product.id): {
+                'items_by_variant': {
+                    f'{self.variant.size}_{self.variant.colour}': 1
+                }
+            }
+        }
+        session[PAYMENT_INTENT_SESSION_KEY] = {
+            'id': 'pi_mine',
+            'client_secret': 'pi_mine_secret_abcde',
+            'amount': 1100,
+        }
+        session.save()
+
+        with self.assertRaises(IntegrityError):
+            self.client.post(reverse('checkout'), {
+                'full_name': 'Name',
+                'email': 'test@example.com',
+                'phone_number': '123',
+                'country': 'GB',
+                'postcode': '123',
+                'town_or_city': 'Town',
+                'street_address1': '123 St',
+                'street_address2': '',
+                'county': '',
+                'client_secret': 'pi_12345_secret_abcde'
+            })
+        self.assertEqual(Order.objects.count(), 1)
+
     def test_checkout_invalid_form_shows_error(self):
         """
         Invalid form submission should show error message and re-render page.
@@ -214,3 +323,309 @@ class CheckoutViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'checkout/checkout.html')
         self.assertContains(response, 'There was an error with your form')
+
+    def test_invalid_form_rerender_shows_bag_totals(self):
+        """
+        The re-rendered page still shows the order summary and the
+        amount the card will be charged.
+        """
+        session = self.client.session
+        session['bag'] = {
+            str(self.product.id): {
+                'items_by_variant': {
+                    f'{self.variant.size}_{self.variant.colour}': 4
+                }
+            }
+        }
+        session.save()
+
+        response = self.client.post(reverse('checkout'), {
+            'full_name': '',
+            'email': '',
+            'phone_number': '',
+            'country': '',
+            'postcode': '',
+            'town_or_city': '',
+            'street_address1': '',
+            'street_address2': '',
+            'county': '',
+            'client_secret': 'pi_12345_secret_abcde'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['grand_total'], Decimal('44.00'))
+        self.assertContains(response, 'Bottle')
+        self.assertContains(
+            response, 'Your card will be charged <strong>£44.00</strong>'
+        )
+
+
+class CheckoutPaymentIntentReuseTest(StubStripeMixin, TestCase):
+    """
+    Tests for reusing PaymentIntents across checkout page loads.
+    """
+
+    def setUp(self):
+        self.start_stub_stripe()
+        self.product = Product.objects.create(name='Tee', description='Tee')
+        ProductVariant.objects.create(
+            product=self.product, size='M', colour='Blue',
+            price=Decimal('12.00'), sku='TEE-M-BLUE'
+        )
+        self._set_bag(1)
+
+    def _set_bag(self, quantity):
+        session = self.client.session
+        session['bag'] = {
+            str(self.product.pk): {'items_by_variant': {'m_blue': quantity}}
+        }
+        session.save()
+
+    def test_reload_reuses_intent_without_calling_stripe(self):
+        """
+        Reloading checkout with the same bag makes no Stripe call.
+        """
+        first = self.client.get(reverse('checkout'))
+        second = self.client.get(reverse('checkout'))
+
+        self.assertEqual(len(self.server.calls), 1)
+        self.assertEqual(
+            first.context['client_secret'], second.context['client_secret']
+        )
+        stored = self.client.session[PAYMENT_INTENT_SESSION_KEY]
+        self.assertEqual(stored['id'], 'pi_stub0')
+        self.assertEqual(stored['amount'], 1320)
+        self.assertEqual(
+            stored['bag_hash'],
+            bag_fingerprint(self.client.session['bag']),
+        )
+
+    def test_finished_intent_is_replaced_on_update(self):
+        """
+        If updating the stored intent shows it has already succeeded, a
+        new one is created.
+        """
+        self.client.get(reverse('checkout'))
+        self.server.intent_statuses['pi_stub0'] = 'succeeded'
+        self._set_bag(2)
+        response = self.client.get(reverse('checkout'))
+
+        self.assertEqual(
+            response.context['client_secret'], 'pi_stub2_secret_stub'
+        )
+        self.assertEqual(
+            self.client.session[PAYMENT_INTENT_SESSION_KEY]['id'], 'pi_stub2'
+        )
+
+    def test_cache_checkout_data_drops_finished_intent(self):
+        """
+        Submitting payment for a finished intent fails and clears it, so
+        the reloaded page gets a new intent.
+        """
+        for status in ('succeeded', 'canceled'):
+            with self.subTest(status=status):
+                self.server.calls.clear()
+                self.client.get(reverse('checkout'))
+                self.server.intent_statuses['pi_stub0'] = status
+                response = self.client.post(
+                    reverse('cache_checkout_data'),
+                    {'client_secret': 'pi_stub0_secret_stub'},
+                )
+
+                self.assertEqual(response.status_code, 400)
+                self.assertNotIn(
+                    PAYMENT_INTENT_SESSION_KEY, self.client.session
+                )
+                response = self.client.get(reverse('checkout'))
+                self.assertEqual(
+                    response.context['client_secret'],
+                    'pi_stub2_secret_stub',
+                )
+                del self.server.intent_statuses['pi_stub0']
+                session = self.client.session
+                del session[PAYMENT_INTENT_SESSION_KEY]
+                session.save()
+
+    def test_cache_checkout_data_keeps_open_intent(self):
+        """
+        Submitting payment for an intent still awaiting payment succeeds
+        and keeps it in the session.
+        """
+        self.client.get(reverse('checkout'))
+        response = self.client.post(
+            reverse('cache_checkout_data'),
+            {'client_secret': 'pi_stub0_secret_stub'},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.session[PAYMENT_INTENT_SESSION_KEY]['id'], 'pi_stub0'
+        )
+
+    def test_changed_bag_with_same_total_updates_intent(self):
+        """
+        A different bag with the same total isn't treated as a reload.
+        """
+        other = Product.objects.create(name='Cap', description='Cap')
+        ProductVariant.objects.create(
+            product=other, size='M', colour='Blue',
+            price=Decimal('12.00'), sku='CAP-M-BLUE'
+        )
+        self.client.get(reverse('checkout'))
+        session = self.client.session
+        session['bag'] = {
+            str(other.pk): {'items_by_variant': {'m_blue': 1}}
+        }
+        session.save()
+        self.client.get(reverse('checkout'))
+
+        path, params, _ = self.server.calls[1]
+        self.assertEqual(path, '/v1/payment_intents/pi_stub0')
+        self.assertEqual(params, {'amount': ['1320']})
+        stored = self.client.session[PAYMENT_INTENT_SESSION_KEY]
+        self.assertEqual(
+            stored['bag_hash'],
+            bag_fingerprint(self.client.session['bag']),
+        )
+
+    def test_changed_total_updates_existing_intent(self):
+        """
+        A new bag total updates the stored intent's amount.
+        """
+        self.client.get(reverse('checkout'))
+        self._set_bag(2)
+        response = self.client.get(reverse('checkout'))
+
+        self.assertEqual(len(self.server.calls), 2)
+        path, params, _ = self.server.calls[1]
+        self.assertEqual(path, '/v1/payment_intents/pi_stub0')
+        self.assertEqual(params, {'amount': ['2640']})
+        self.assertEqual(
+            response.context['client_secret'], 'pi_stub0_secret_stub'
+        )
+        stored = self.client.session[PAYMENT_INTENT_SESSION_KEY]
+        self.assertEqual(stored['amount'], 2640)
+
+    def test_unusable_intent_is_replaced(self):
+        """
+        If the stored intent can't be updated a new one is created.
+        """
+        self.client.get(reverse('checkout'))
+        self.server.fail_paths.add('/v1/payment_intents/pi_stub0')
+        self._set_bag(2)
+        response = self.client.get(reverse('checkout'))
+
+        self.assertEqual(
+            response.context['client_secret'], 'pi_stub2_secret_stub'
+        )
+        stored = self.client.session[PAYMENT_INTENT_SESSION_KEY]
+        self.assertEqual(stored, {
+            'id': 'pi_stub2',
+            'client_secret': 'pi_stub2_secret_stub',
+            'amount': 2640,
+            'bag_hash': bag_fingerprint(self.client.session['bag']),
+        })
+
+    def test_success_clears_stored_intent(self):
+        """
+        The stored intent is dropped once the order succeeds.
+        """
+        self.client.get(reverse('checkout'))
+        order = Order.objects.create(
+            full_name='Name',
+            email='test@example.com',
+            phone_number='123',
+            country='GB',
+            town_or_city='Town',
+            street_address1='123 St',
+            stripe_pid='pi_stub0',
+        )
+        self.client.get(
+            reverse('checkout_success', args=[order.order_number])
+        )
+        self.assertNotIn(PAYMENT_INTENT_SESSION_KEY, self.client.session)
+
+
+class AsyncCheckoutViewTest(StubStripeMixin, TestCase):
+    """
+    Tests for the async checkout views, called directly as they are only
+    routed when ASYNC_CHECKOUT is on.
+    """
+
+    def setUp(self):
+        self.start_stub_stripe()
+        get_async_stripe_client.cache_clear()
+        self.addCleanup(get_async_stripe_client.cache_clear)
+        self.product = Product.objects.create(name='Tee', description='Tee')
+        ProductVariant.objects.create(
+            product=self.product, size='M', colour='Blue',
+            price=Decimal('12.00'), sku='TEE-M-BLUE'
+        )
+
+    def _set_bag(self, bag):
+        session = self.client.session
+        session['bag'] = bag
+        session.save()
+
+    def _request(self, method='get', data=None):
+        request = getattr(AsyncRequestFactory(), method)(
+            reverse('checkout'), data or {}
+        )
+        request.session = self.client.session
+        request.user = AnonymousUser()
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        request._messages = default_storage(request)
+        return request
+
+    async def test_empty_bag_redirects(self):
+        """
+        An empty bag redirects to the products page without Stripe.
+        """
+        request = await sync_to_async(self._request)()
+        response = await checkout_async(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse('products'))
+        self.assertEqual(self.server.calls, [])
+
+    @skipUnless(find_spec('httpx'), 'httpx is not installed')
+    async def test_get_creates_and_reuses_intent(self):
+        """
+        GET creates the intent on the async client, then reuses it.
+        """
+        await sync_to_async(self._set_bag)(
+            {str(self.product.pk): {'items_by_variant': {'m_blue': 1}}}
+        )
+        request = await sync_to_async(self._request)()
+        response = await checkout_async(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'pi_stub0_secret_stub', response.content)
+        self.assertEqual(
+            request.session[PAYMENT_INTENT_SESSION_KEY]['amount'], 1320
+        )
+
+        await checkout_async(request)
+        self.assertEqual(len(self.server.calls), 1)
+
+    @skipUnless(find_spec('httpx'), 'httpx is not installed')
+    async def test_cache_checkout_data_updates_metadata(self):
+        """
+        cache_checkout_data_async stores the bag on the intent.
+        """
+        bag = {str(self.product.pk): {'items_by_variant': {'m_blue': 1}}}
+        await sync_to_async(self._set_bag)(bag)
+        request = await sync_to_async(self._request)('post', {
+            'client_secret': 'pi_stub9_secret_stub',
+            'save_info': 'true',
+        })
+        response = await cache_checkout_data_async(request)
+
+        self.assertEqual(response.status_code, 200)
+        path, params, _ = self.server.calls[0]
+        self.assertEqual(path, '/v1/payment_intents/pi_stub9')
+        self.assertEqual(params['metadata[bag]'], [json.dumps(bag)])
+        self.assertEqual(params['metadata[username]'], ['AnonymousUser'])
@@ -3,7 +3,9 @@ Test suite for StripeWH_Handler in checkout.webhook_handler.
 
 Covers:
 - Generic unhandled events
-- Payment intent succeeded (order exists and does not exist)
+- Payment intent succeeded being queued for the worker
+- Reconciling a queued payment (retry, create, verify existing)
+- Member totals matching the amount charged, and mismatches failing
 - Payment failed event
 """
 
@@ -11,11 +13,16 @@ import json
 from decimal import Decimal
 from unittest.mock import patch, MagicMock
 
+import stripe
+from django.db import connection
 from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 
-from checkout.webhook_handler import StripeWH_Handler
-from checkout.models import Order
+from checkout.jobs import FailJob, RetryJob, process_due_jobs
+from checkout.webhook_handler import ORDER_WAIT_ATTEMPTS, StripeWH_Handler
+from checkout.models import Order, WebhookJob
+from checkout.utils import build_order
 from products.models import Category, Product, ProductVariant
 
 
@@ -62,17 +69,36 @@ class WebhookHandlerTests(TestCase):
             'username': self.user.username,
         }
 
-    def _mock_shipping(self):
-        shipping = MagicMock()
-        shipping.name = 'Test User'
-        shipping.phone = '1234567890'
-        shipping.address.country = 'GB'
-        shipping.address.postal_code = 'AB12 3CD'
-        shipping.address.city = 'Testville'
-        shipping.address.line1 = '123 Test St'
-        shipping.address.line2 = ''
-        shipping.address.state = 'Countyshire'
-        return shipping
+    def _event(self, pid='pi_123'):
+        return stripe.Event.construct_from({
+            'id': 'evt_123',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {
+                'object': 'payment_intent',
+                'id': pid,
+                'latest_charge': 'ch_123',
+                'metadata': self.metadata,
+                'shipping': {
+                    'name': 'Test User',
+                    'phone': '1234567890',
+                    'address': {
+                        'country': 'GB',
+                        'postal_code': 'AB12 3CD',
+                        'city': 'Testville',
+                        'line1': '123 Test St',
+                        'line2': '',
+                        'state': 'Countyshire',
+                    },
+                },
+            }},
+        }, 'sk_test')
+
+    def _mock_client(self, mock_client, amount=1000):
+        charges = mock_client.return_value.v1.charges
+        charges.retrieve.return_value = MagicMock(
+            billing_details=MagicMock(email='test@example.com'),
+            amount=amount
+        )
 
     def test_handle_event_returns_generic_response(self):
         """
@@ -85,79 +111,227 @@ class WebhookHandlerTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Unhandled webhook received', response.content.decode())
 
-    @patch('checkout.webhook_handler.stripe.Charge.retrieve')
+    @patch('checkout.webhook_handler.get_stripe_client')
+    def test_handle_payment_intent_succeeded_queues_job(self, mock_client):
+        """
+        payment_intent.succeeded is queued and acknowledged without
+        calling Stripe or touching orders.
+        """
+        request = self.factory.post('/webhook/')
+        handler = StripeWH_Handler(request)
+        response = handler.handle_payment_intent_succeeded(self._event())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Queued', response.content.decode())
+        job = WebhookJob.objects.get()
+        self.assertEqual(job.event_id, 'evt_123')
+        self.assertEqual(job.status, WebhookJob.PENDING)
+        self.assertEqual(json.loads(job.payload)['id'], 'pi_123')
+        mock_client.assert_not_called()
+        self.assertFalse(Order.objects.exists())
+
+    @patch('checkout.webhook_handler.get_stripe_client')
     @patch(
-        'checkout.webhook_handler.StripeWH_Handler._send_confirmation_email'
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
     )
-    def test_handle_payment_intent_succeeded_creates_new_order(
-        self, mock_email, mock_charge
+    def test_reconcile_retries_while_order_missing(
+        self, mock_email, mock_client
     ):
-        """A valid new webhook should create an order and
-        send confirmation email."""
-        mock_charge.return_value = MagicMock(
-            billing_details=MagicMock(email='test@example.com'),
-            amount=1000
+        """
+        Early attempts raise RetryJob rather than creating the order,
+        without calling Stripe or saving the profile.
+        """
+        self._mock_client(mock_client)
+        intent = self._event().data.object
+        with self.assertRaises(RetryJob):
+            StripeWH_Handler().reconcile_payment_intent(intent, 1)
+        self.assertFalse(Order.objects.exists())
+        mock_email.assert_not_called()
+        mock_client.assert_not_called()
+        self.profile.refresh_from_db()
+        self.assertIsNone(self.profile.default_postcode)
+
+    @patch('checkout.webhook_handler.get_stripe_client')
+    @patch(
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
+    )
+    def test_reconcile_creates_order_on_last_attempt(
+        self, mock_email, mock_client
+    ):
+        """A still-missing order is created from the webhook and
+        a confirmation email sent."""
+        self._mock_client(mock_client)
+        intent = self._event().data.object
+        order = StripeWH_Handler().reconcile_payment_intent(
+            intent, ORDER_WAIT_ATTEMPTS
         )
 
-        shipping = self._mock_shipping()
-        # Use MagicMock for metadata to mimic attribute access
-        metadata_mock = MagicMock()
-        metadata_mock.bag = self.bag
-        metadata_mock.save_info = 'true'
-        metadata_mock.username = self.user.username
-
-        event = MagicMock()
-        event.type = 'payment_intent.succeeded'
-        event.data.object = MagicMock(
-            id='pi_123',
-            metadata=metadata_mock,
-            shipping=shipping,
-            latest_charge='ch_123'
+        self.assertEqual(order.stripe_pid, 'pi_123')
+        self.assertEqual(order.user_profile, self.profile)
+        self.assertEqual(order.lineitems.count(), 1)
+        mock_email.assert_called_once_with(order)
+
+    @patch('checkout.webhook_handler.get_stripe_client')
+    @patch(
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
+    )
+    def test_reconcile_verifies_existing_order(
+        self, mock_email, mock_client
+    ):
+        """An order created by checkout is found on the first attempt
+        and no duplicate is created."""
+        self._mock_client(mock_client)
+        existing = Order.objects.create(
+            full_name='Test User',
+            email='test@example.com',
+            phone_number='1234567890',
+            country='GB',
+            postcode='AB12 3CD',
+            town_or_city='Testville',
+            street_address1='123 Test St',
+            county='Countyshire',
+            grand_total=Decimal('10.00'),
+            original_bag=self.bag,
+            stripe_pid='pi_123',
         )
+        intent = self._event().data.object
+        with CaptureQueriesContext(connection) as ctx:
+            order = StripeWH_Handler().reconcile_payment_intent(intent, 1)
 
-        request = self.factory.post('/webhook/')
-        handler = StripeWH_Handler(request)
-        response = handler.handle_payment_intent_succeeded(event)
+        self.assertEqual(order, existing)
+        order_queries = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('SELECT')
+            and 'FROM "checkout_order"' in q['sql']
+        ]
+        # One lookup on the PID; no case-insensitive text comparisons
+        self.assertEqual(len(order_queries), 1)
+        self.assertNotIn('LIKE', order_queries[0])
+        self.assertEqual(Order.objects.count(), 1)
+        mock_email.assert_called_once_with(existing)
 
-        self.assertEqual(response.status_code, 200)
-        self.assertTrue(Order.objects.filter(stripe_pid='pi_123').exists())
-        mock_email.assert_called_once()
+    @patch('checkout.webhook_handler.get_stripe_client')
+    @patch(
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
+    )
+    def test_reconcile_rejects_mismatched_order(
+        self, mock_email, mock_client
+    ):
+        """An order with the same PID but different details is
+        reported rather than confirmed or duplicated."""
+        self._mock_client(mock_client)
+        Order.objects.create(
+            full_name='Someone Else',
+            email='test@example.com',
+            phone_number='1234567890',
+            country='GB',
+            town_or_city='Testville',
+            street_address1='123 Test St',
+            grand_total=Decimal('10.00'),
+            original_bag=self.bag,
+            stripe_pid='pi_123',
+        )
+        intent = self._event().data.object
+        with self.assertRaisesMessage(FailJob, 'full_name'):
+            StripeWH_Handler().reconcile_payment_intent(intent, 1)
+        self.assertEqual(Order.objects.count(), 1)
+        mock_email.assert_not_called()
 
-    @patch('checkout.webhook_handler.stripe.Charge.retrieve')
+    @patch('checkout.webhook_handler.get_stripe_client')
     @patch(
-        'checkout.webhook_handler.StripeWH_Handler._send_confirmation_email'
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
     )
-    def test_handle_payment_intent_succeeded_order_already_exists(
-        self, mock_email, mock_charge
+    def test_mismatched_order_fails_job_without_retrying(
+        self, mock_email, mock_client
     ):
-        """A valid new webhook should create an order and
-        send confirmation email."""
-        mock_charge.return_value = MagicMock(
-            billing_details=MagicMock(email='test@example.com'),
-            amount=1000
+        """A mismatch can't fix itself, so the job fails on its first
+        attempt."""
+        self._mock_client(mock_client)
+        Order.objects.create(
+            full_name='Someone Else',
+            email='test@example.com',
+            grand_total=Decimal('10.00'),
+            original_bag=self.bag,
+            stripe_pid='pi_123',
         )
+        handler = StripeWH_Handler()
+        handler.handle_payment_intent_succeeded(self._event())
+
+        process_due_jobs(handler.run_job)
+
+        job = WebhookJob.objects.get()
+        self.assertEqual(job.status, WebhookJob.FAILED)
+        self.assertEqual(job.attempts, 1)
+        mock_client.return_value.v1.charges.retrieve.assert_called_once()
+
+    @patch('checkout.webhook_handler.get_stripe_client')
+    @patch(
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
+    )
+    def test_member_order_below_free_delivery_matches_payment(
+        self, mock_email, mock_client
+    ):
+        """A member's order totals match the amount the bag charged:
+        £10 less 10% is £9, plus £0.90 delivery on the discounted
+        total."""
+        self._mock_client(mock_client, amount=990)
+        checkout_order = build_order(Order(
+            full_name='Test User',
+            email='test@example.com',
+            phone_number='1234567890',
+            country='GB',
+            postcode='AB12 3CD',
+            town_or_city='Testville',
+            street_address1='123 Test St',
+            county='Countyshire',
+            discount=Decimal('1.00'),
+            original_bag=self.bag,
+            stripe_pid='pi_123',
+        ), json.loads(self.bag))
+        intent = self._event().data.object
+
+        order = StripeWH_Handler().reconcile_payment_intent(intent, 1)
 
-        shipping = self._mock_shipping()
-        # Use MagicMock for metadata to mimic attribute access
-        metadata_mock = MagicMock()
-        metadata_mock.bag = self.bag
-        metadata_mock.save_info = 'true'
-        metadata_mock.username = self.user.username
-
-        event = MagicMock()
-        event.type = 'payment_intent.succeeded'
-        event.data.object = MagicMock(
-            id='pi_123',
-            metadata=metadata_mock,
-            shipping=shipping,
-            latest_charge='ch_123'
+        self.assertEqual(order, checkout_order)
+        self.assertEqual(order.grand_total, Decimal('9.90'))
+        mock_email.assert_called_once_with(order)
+
+    @patch('checkout.webhook_handler.get_stripe_client')
+    @patch(
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
+    )
+    def test_created_member_order_matches_payment(
+        self, mock_email, mock_client
+    ):
+        """An order created from the webhook takes the member discount
+        off the goods, as the bag does."""
+        self._mock_client(mock_client, amount=990)
+        intent = self._event().data.object
+        order = StripeWH_Handler().reconcile_payment_intent(
+            intent, ORDER_WAIT_ATTEMPTS
         )
+        order.refresh_from_db()
+        self.assertEqual(order.discount, Decimal('1.00'))
+        self.assertEqual(order.delivery_cost, Decimal('0.90'))
+        self.assertEqual(order.grand_total, Decimal('9.90'))
 
-        request = self.factory.post('/webhook/')
-        handler = StripeWH_Handler(request)
-        response = handler.handle_payment_intent_succeeded(event)
+    @patch('checkout.webhook_handler.get_stripe_client')
+    @patch(
+        'checkout.webhook_handler.StripeWH_Handler._queue_confirmation_email'
+    )
+    def test_worker_runs_queued_job(self, mock_email, mock_client):
+        """
+        The worker reconciles a queued payment and marks the job done.
+        """
+        self._mock_client(mock_client)
+        handler = StripeWH_Handler()
+        handler.handle_payment_intent_succeeded(self._event())
+        WebhookJob.objects.update(attempts=ORDER_WAIT_ATTEMPTS - 1)
 
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(process_due_jobs(handler.run_job), 1)
+
+        job = WebhookJob.objects.get()
+        self.assertEqual(job.status, WebhookJob.DONE)
         self.assertTrue(Order.objects.filter(stripe_pid='pi_123').exists())
         mock_email.assert_called_once()
 
@@ -6,14 +6,19 @@ Covers:
 - Invalid payload
 - Invalid signature
 - Fallback error handling
+- Duplicate deliveries of the same event
 """
 
+from django.db import connection
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.http import HttpResponse
 from unittest.mock import patch
 import json
 
+from checkout.models import ProcessedStripeEvent, WebhookJob
+
 
 @override_settings(STRIPE_WH_SECRET='whsec_test', STRIPE_SECRET_KEY='sk_test')
 class WebhookViewTest(TestCase):
@@ -103,3 +108,65 @@ class WebhookViewTest(TestCase):
         )
         self.assertEqual(response.status_code, 400)
         self.assertIn(b'Error: Some other error', response.content)
+
+    def _post(self):
+        return self.client.post(
+            self.url,
+            data=self.payload,
+            content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=self.sig_header
+        )
+
+    @patch('stripe.Webhook.construct_event')
+    def test_duplicate_event_is_not_handled_again(self, mock_construct):
+        """
+        A redelivered event is acknowledged with one lookup and no
+        writes, and queues no second job.
+        """
+        mock_construct.return_value = {
+            'id': 'evt_test_webhook',
+            'type': 'payment_intent.succeeded',
+            'data': {'object': {'id': 'pi_dup'}},
+        }
+        self.assertEqual(self._post().status_code, 200)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Duplicate event', response.content)
+        self.assertEqual(WebhookJob.objects.count(), 1)
+        self.assertEqual(
+            ProcessedStripeEvent.objects.get().event_type,
+            'payment_intent.succeeded'
+        )
+        statements = [
+            q['sql'] for q in ctx.captured_queries
+            if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))
+        ]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('SELECT'))
+
+    @patch('stripe.Webhook.construct_event')
+    @patch(
+        'checkout.webhook_handler.'
+        'StripeWH_Handler.handle_payment_intent_succeeded'
+    )
+    def test_failed_delivery_is_retried(self, mock_handler, mock_construct):
+        """
+        An event whose handler fails is not recorded, so Stripe's retry
+        is handled again.
+        """
+        mock_construct.return_value = json.loads(self.payload)
+        mock_handler.side_effect = [
+            HttpResponse(status=500), HttpResponse(status=200),
+        ]
+
+        self.assertEqual(self._post().status_code, 500)
+        self.assertFalse(ProcessedStripeEvent.objects.exists())
+
+        self.assertEqual(self._post().status_code, 200)
+        self.assertEqual(mock_handler.call_count, 2)
+        self.assertTrue(ProcessedStripeEvent.objects.filter(
+            event_id='evt_test_webhook'
+        ).exists())
@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from .webhooks import webhook
 
+if settings.ASYNC_CHECKOUT:
+    checkout_view = views.checkout_async
+    cache_checkout_data_view = views.cache_checkout_data_async
+else:
+    checkout_view = views.checkout
+    cache_checkout_data_view = views.cache_checkout_data
+
 
 urlpatterns = [
-    path('', views.checkout, name='checkout'),
+    path('', checkout_view, name='checkout'),
     path(
         'checkout_success/<order_number>',
         views.checkout_success,
@@ -12,7 +20,7 @@ urlpatterns = [
     ),
     path(
         'cache_checkout_data/',
-        views.cache_checkout_data,
+        cache_checkout_data_view,
         name='cache_checkout_data'
     ),
     path('wh/', webhook, name='stripe_webhook'),
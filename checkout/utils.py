@@ -0,0 +1,162 @@
+"""
+Helpers for turning a bag into an order and its line items.
+
+The checkout view and the Stripe webhook both build orders from a bag,
+so they share this path. Every variant in the bag is fetched with a
+single query on the indexed ``(product, variant_key)`` pair, all line
+items are inserted with one ``bulk_create`` and the order totals are
+recalculated once, inside a single transaction.
+
+Code that saves or deletes line items one at a time (the admin inline,
+data imports) can wrap the work in ``defer_order_total_updates()`` so
+each affected order's totals are recalculated once, at the end, rather
+than after every line item.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from bag.utils import parse_bag
+from products.models import ProductVariant
+from .models import Order, OrderLineItem
+
+# Orders waiting for a total update, keyed by pk, while a
+# ``defer_order_total_updates()`` block is open
+_deferred_orders = ContextVar('deferred_order_totals', default=None)
+
+
+@contextmanager
+def defer_order_total_updates():
+    """
+    Coalesce order total updates made inside the block.
+
+    While the block is open, line item saves and deletes only record
+    their order; ``Order.update_total`` then runs once per order when
+    the block exits. Nested blocks join the outermost one. If the block
+    raises, the pending updates are dropped along with the error.
+    Orders deleted inside the block are skipped.
+    """
+    if _deferred_orders.get() is not None:
+        yield
+        return
+
+    pending = {}
+    token = _deferred_orders.set(pending)
+    try:
+        yield
+    finally:
+        _deferred_orders.reset(token)
+
+    if not pending:
+        return
+    existing = set(
+        Order.objects.filter(pk__in=pending).values_list('pk', flat=True)
+    )
+    for pk, order in pending.items():
+        if pk in existing:
+            order.update_total()
+
+
+def schedule_order_total_update(order):
+    """
+    Update ``order``'s totals now, or when the enclosing
+    ``defer_order_total_updates()`` block exits.
+    """
+    pending = _deferred_orders.get()
+    if pending is None:
+        order.update_total()
+    else:
+        pending.setdefault(order.pk, order)
+
+
+def resolve_order_lines(bag):
+    """
+    Resolve a bag into ``(variant, quantity)`` pairs, in bag order.
+
+    Variant lines are matched on their canonical ``variant_key``.
+    Non-variant lines use the product's first variant, as the bag does
+    when pricing them.
+
+    Raises:
+        ProductVariant.DoesNotExist: if any line's variant no longer
+        exists.
+    """
+    lines = [
+        (int(item_id), variant_key.lower() if variant_key else None, qty)
+        for item_id, variant_key, qty in parse_bag(bag)
+    ]
+
+    keys = {
+        (product_id, variant_key)
+        for product_id, variant_key, _ in lines
+        if variant_key is not None
+    }
+    first_variant_products = {
+        product_id
+        for product_id, variant_key, _ in lines
+        if variant_key is None
+    }
+
+    variants = ProductVariant.objects.for_keys(keys)
+    if first_variant_products:
+        variants = variants | ProductVariant.objects.filter(
+            product_id__in=first_variant_products
+        )
+
+    variants_by_key = {}
+    first_variants = {}
+    for variant in variants.order_by('product_id', 'pk'):
+        variants_by_key[(variant.product_id, variant.variant_key)] = variant
+        first_variants.setdefault(variant.product_id, variant)
+
+    order_lines = []
+    for product_id, variant_key, quantity in lines:
+        if variant_key is None:
+            variant = first_variants.get(product_id)
+        else:
+            variant = variants_by_key.get((product_id, variant_key))
+        if variant is None:
+            raise ProductVariant.DoesNotExist(
+                f'No variant {variant_key!r} for product {product_id}'
+            )
+        order_lines.append((variant, quantity))
+    return order_lines
+
+
+def build_order(order, bag, discount_rate=None):
+    """
+    Save ``order`` together with a line item for every line in ``bag``.
+
+    Line totals are computed up front so the items can be bulk created
+    without the per-line ``post_save`` total recalculation; totals are
+    then updated once. Nothing is saved if any variant is missing.
+
+    If ``discount_rate`` is given, the order's discount is set to that
+    share of the line totals, as the bag applies the member discount.
+
+    Raises:
+        ProductVariant.DoesNotExist: if any line's variant no longer
+        exists.
+    """
+    order_lines = resolve_order_lines(bag)
+    line_items = [
+        OrderLineItem(
+            order=order,
+            variant=variant,
+            quantity=quantity,
+            lineitem_total=variant.price * quantity,
+        )
+        for variant, quantity in order_lines
+    ]
+    if discount_rate is not None:
+        order.discount = round(
+            sum(item.lineitem_total for item in line_items) * discount_rate,
+            2,
+        )
+
+    with transaction.atomic():
+        order.save()
+        OrderLineItem.objects.bulk_create(line_items)
+        order.update_total()
+    return order
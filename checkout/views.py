@@ -2,19 +2,160 @@ import json
 from decimal import Decimal
 
 import stripe
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
+from django.db import IntegrityError
 from django.shortcuts import (
     render, redirect, reverse, get_object_or_404, HttpResponse
 )
 from django.views.decorators.http import require_POST
 
 from .forms import OrderForm
-from .models import Order, OrderLineItem
-from bag.contexts import bag_contents
+from .models import Order
+from .stripe_client import get_async_stripe_client, get_stripe_client
+from .utils import build_order
+from bag.contexts import get_bag_summary
+from bag.utils import bag_fingerprint, clear_bag
 from products.models import ProductVariant
 from profiles.forms import UserProfileForm
-from profiles.models import UserProfile
+from profiles.utils import aget_request_profile, get_request_profile
+
+# Session key holding the visitor's current PaymentIntent
+PAYMENT_INTENT_SESSION_KEY = 'checkout_payment_intent'
+
+# PaymentIntent statuses that can't take another payment
+FINISHED_INTENT_STATUSES = ('succeeded', 'canceled')
+
+EMPTY_BAG_MESSAGE = "There's nothing in your bag at the moment."
+
+FINISHED_INTENT_MESSAGE = (
+    'This payment has already been completed or cancelled. If you were '
+    'charged, please check your email for your order confirmation '
+    'before trying again.'
+)
+
+
+def _payment_intent_params(amount):
+    """Return the parameters for creating a checkout PaymentIntent."""
+    return {
+        'amount': amount,
+        'currency': settings.STRIPE_CURRENCY,
+        'payment_method_types': ['card'],
+    }
+
+
+def _store_payment_intent(request, intent, amount, bag_hash):
+    """Remember the visitor's PaymentIntent in the session."""
+    request.session[PAYMENT_INTENT_SESSION_KEY] = {
+        'id': intent.id,
+        'client_secret': intent.client_secret,
+        'amount': amount,
+        'bag_hash': bag_hash,
+    }
+
+
+def _get_payment_intent(request, amount):
+    """
+    Return the client secret of a PaymentIntent for ``amount``.
+
+    The intent created on the visitor's first checkout visit is kept in
+    the session with a fingerprint of the bag and reused on reloads, so
+    refreshing the page with the same bag doesn't call Stripe or leave
+    orphaned intents behind. If the bag has changed, the stored
+    intent's amount is updated instead. A new intent is created when
+    there is none, or the stored one has already succeeded, been
+    cancelled or can't be updated.
+
+    The stored intent is dropped once its order succeeds, or when
+    ``cache_checkout_data`` finds it has already finished.
+    """
+    client = get_stripe_client()
+    bag_hash = bag_fingerprint(request.session.get('bag', {}))
+    stored = request.session.get(PAYMENT_INTENT_SESSION_KEY)
+
+    if stored and (stored['amount'], stored.get('bag_hash')) == (
+        amount, bag_hash
+    ):
+        return stored['client_secret']
+
+    intent = None
+    if stored:
+        try:
+            intent = client.v1.payment_intents.update(
+                stored['id'], params={'amount': amount}
+            )
+        except stripe.StripeError:
+            intent = None
+
+    if intent is None or intent.status in FINISHED_INTENT_STATUSES:
+        intent = client.v1.payment_intents.create(
+            params=_payment_intent_params(amount)
+        )
+    _store_payment_intent(request, intent, amount, bag_hash)
+    return intent.client_secret
+
+
+async def _aget_payment_intent(request, amount):
+    """
+    Async version of ``_get_payment_intent``, using the async Stripe
+    client. The session must already be loaded.
+    """
+    client = get_async_stripe_client()
+    bag_hash = bag_fingerprint(request.session.get('bag', {}))
+    stored = request.session.get(PAYMENT_INTENT_SESSION_KEY)
+
+    if stored and (stored['amount'], stored.get('bag_hash')) == (
+        amount, bag_hash
+    ):
+        return stored['client_secret']
+
+    intent = None
+    if stored:
+        try:
+            intent = await client.v1.payment_intents.update_async(
+                stored['id'], params={'amount': amount}
+            )
+        except stripe.StripeError:
+            intent = None
+
+    if intent is None or intent.status in FINISHED_INTENT_STATUSES:
+        intent = await client.v1.payment_intents.create_async(
+            params=_payment_intent_params(amount)
+        )
+    _store_payment_intent(request, intent, amount, bag_hash)
+    return intent.client_secret
+
+
+def _checkout_metadata(request, bag, user):
+    """Return the metadata stored on the PaymentIntent at submission."""
+    return {
+        'bag': json.dumps(bag),
+        'save_info': request.POST.get('save_info'),
+        'username': str(user),
+    }
+
+
+def _cache_checkout_data_failed(request, error):
+    """Flash an error and return the 400 for a failed metadata update."""
+    messages.error(
+        request,
+        'Sorry, your payment cannot be processed right now. '
+        'Please try again later.'
+    )
+    return HttpResponse(content=error, status=400)
+
+
+def _finished_intent_response(request, intent):
+    """
+    Forget a PaymentIntent that can no longer take a payment and return
+    a 400, so the checkout page reloads with a new intent.
+    """
+    stored = request.session.get(PAYMENT_INTENT_SESSION_KEY) or {}
+    if stored.get('id') == intent.id:
+        del request.session[PAYMENT_INTENT_SESSION_KEY]
+    messages.error(request, FINISHED_INTENT_MESSAGE)
+    return HttpResponse(status=400)
 
 
 @require_POST
@@ -22,36 +163,62 @@ def cache_checkout_data(request):
     """
     View to cache checkout data in the payment intent metadata.
     Stores bag contents, save_info checkbox, and username.
+
+    Called just before the card payment is confirmed. If the intent has
+    already succeeded or been cancelled (e.g. the customer paid but
+    never reached the success page), it is dropped from the session and
+    a 400 returned, so the page reloads with a new intent.
     """
     try:
         pid = request.POST.get('client_secret').split('_secret')[0]
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-        stripe.PaymentIntent.modify(pid, metadata={
-            'bag': json.dumps(request.session.get('bag', {})),
-            'save_info': request.POST.get('save_info'),
-            'username': request.user,
+        metadata = _checkout_metadata(
+            request, request.session.get('bag', {}), request.user
+        )
+        intent = get_stripe_client().v1.payment_intents.update(pid, params={
+            'metadata': metadata,
         })
-        return HttpResponse(status=200)
     except Exception as e:
-        messages.error(
-            request,
-            'Sorry, your payment cannot be processed right now. '
-            'Please try again later.'
+        return _cache_checkout_data_failed(request, e)
+    if intent.status in FINISHED_INTENT_STATUSES:
+        return _finished_intent_response(request, intent)
+    return HttpResponse(status=200)
+
+
+@require_POST
+async def cache_checkout_data_async(request):
+    """
+    Async version of ``cache_checkout_data``, used when
+    ``ASYNC_CHECKOUT`` is on. The metadata update is awaited on the
+    async Stripe client instead of holding a worker thread.
+    """
+    try:
+        pid = request.POST.get('client_secret').split('_secret')[0]
+        bag = await sync_to_async(request.session.get)('bag', {})
+        metadata = _checkout_metadata(request, bag, await request.auser())
+        intent = await (
+            get_async_stripe_client().v1.payment_intents.update_async(
+                pid, params={'metadata': metadata}
+            )
+        )
+    except Exception as e:
+        return await sync_to_async(_cache_checkout_data_failed)(request, e)
+    if intent.status in FINISHED_INTENT_STATUSES:
+        return await sync_to_async(_finished_intent_response)(
+            request, intent
         )
-        return HttpResponse(content=e, status=400)
+    return HttpResponse(status=200)
 
 
 def checkout(request):
     """
     Handle checkout form display and order creation.
 
-    - GET: Create payment intent and prefill the order form
-    if user is logged in.
+    - GET: Create (or reuse the session's) payment intent and prefill
+    the order form if user is logged in.
     - POST: Validate submitted form, create Order and related LineItems,
     apply discount if available, and redirect to success page.
     """
     stripe_public_key = settings.STRIPE_PUBLIC_KEY
-    stripe_secret_key = settings.STRIPE_SECRET_KEY
 
     if request.method == 'POST':
         bag = request.session.get('bag', {})
@@ -77,46 +244,39 @@ def checkout(request):
             order.original_bag = json.dumps(bag)
 
             # Add member discount from context (if applicable)
-            current_bag = bag_contents(request)
+            current_bag = get_bag_summary(request)
             order.discount = Decimal(
                 current_bag.get('discount', '0.00')
             )
 
             # Attach profile if authenticated
-            if request.user.is_authenticated:
-                try:
-                    profile = UserProfile.objects.get(user=request.user)
-                    order.user_profile = profile
-                except UserProfile.DoesNotExist:
-                    pass
-
-            order.save()
-
-            for item_id, item_data in bag.items():
-                try:
-                    for variant_key, quantity in item_data[
-                        'items_by_variant'
-                    ].items():
-                        size, colour = variant_key.split('_')
-                        variant = ProductVariant.objects.get(
-                            product_id=item_id,
-                            size__iexact=size,
-                            colour__iexact=colour
-                        )
-                        OrderLineItem.objects.create(
-                            order=order,
-                            variant=variant,
-                            quantity=quantity
-                        )
-                except ProductVariant.DoesNotExist:
-                    messages.error(request, (
-                        "One of the products in your bag wasn't found. "
-                        "Please call us for help!"
-                    ))
-                    order.delete()
-                    return redirect(reverse('view_bag'))
-
-            order.update_total()
+            profile = get_request_profile(request)
+            if profile:
+                order.user_profile = profile
+
+            try:
+                build_order(order, bag)
+            except ProductVariant.DoesNotExist:
+                messages.error(request, (
+                    "One of the products in your bag wasn't found. "
+                    "Please call us for help!"
+                ))
+                return redirect(reverse('view_bag'))
+            except IntegrityError:
+                # The form was resubmitted, or the webhook got there
+                # first: this payment already has its order. The client
+                # secret is posted by the browser, so only this
+                # session's own payment intent is trusted.
+                session_intent = (
+                    request.session.get(PAYMENT_INTENT_SESSION_KEY) or {}
+                )
+                existing = None
+                if session_intent.get('id') == pid:
+                    existing = Order.objects.filter(stripe_pid=pid).first()
+                if existing is None:
+                    raise
+                order = existing
+
             request.session['save_info'] = 'save-info' in request.POST
             return redirect(
                 reverse('checkout_success', args=[order.order_number])
@@ -130,6 +290,7 @@ def checkout(request):
             stripe_public_key = settings.STRIPE_PUBLIC_KEY
             template = 'checkout/checkout.html'
             context = {
+                **get_bag_summary(request),
                 'order_form': order_form,
                 'stripe_public_key': stripe_public_key,
                 'client_secret': request.POST.get('client_secret'),
@@ -139,56 +300,80 @@ def checkout(request):
     else:
         bag = request.session.get('bag', {})
         if not bag:
-            messages.error(
-                request,
-                "There's nothing in your bag at the moment."
-            )
+            messages.error(request, EMPTY_BAG_MESSAGE)
             return redirect(reverse('products'))
 
-        current_bag = bag_contents(request)
-        total = current_bag['grand_total']
-        stripe_total = round(total * 100)
+        current_bag = get_bag_summary(request)
+        stripe_total = round(current_bag['grand_total'] * 100)
+        client_secret = _get_payment_intent(request, stripe_total)
+        return _render_checkout(request, client_secret)
 
-        stripe.api_key = stripe_secret_key
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-            payment_method_types=['card'],
-        )
 
-        if request.user.is_authenticated:
-            try:
-                profile = UserProfile.objects.get(user=request.user)
-                order_form = OrderForm(initial={
-                    'full_name': profile.user.get_full_name(),
-                    'email': profile.user.email,
-                    'phone_number': profile.default_phone_number,
-                    'country': profile.default_country,
-                    'postcode': profile.default_postcode,
-                    'town_or_city': profile.default_town_or_city,
-                    'street_address1': profile.default_street_address1,
-                    'street_address2': profile.default_street_address2,
-                    'county': profile.default_county,
-                })
-            except UserProfile.DoesNotExist:
-                order_form = OrderForm()
-        else:
-            order_form = OrderForm()
+async def checkout_async(request):
+    """
+    Async version of ``checkout``, used when ``ASYNC_CHECKOUT`` is on
+    and the site is served over ASGI.
 
-        if not stripe_public_key:
-            messages.warning(
-                request,
-                'Stripe public key is missing. '
-                'Did you forget to set it in your environment?'
-            )
+    - GET: The profile is loaded with async cache/ORM calls and the
+    PaymentIntent is created or updated on the async Stripe client, so
+    a worker can hold many checkouts waiting on Stripe at once. The
+    session, bag pricing and template rendering still run through
+    ``sync_to_async``.
+    - POST: Handed to the sync view, as the order is built in a single
+    database transaction.
+    """
+    if request.method == 'POST':
+        return await sync_to_async(checkout)(request)
 
-        template = 'checkout/checkout.html'
-        context = {
-            'order_form': order_form,
-            'stripe_public_key': stripe_public_key,
-            'client_secret': intent.client_secret,
-        }
-        return render(request, template, context)
+    bag = await sync_to_async(request.session.get)('bag', {})
+    if not bag:
+        await sync_to_async(messages.error)(request, EMPTY_BAG_MESSAGE)
+        return redirect(reverse('products'))
+
+    await aget_request_profile(request)
+    current_bag = await sync_to_async(get_bag_summary)(request)
+    stripe_total = round(current_bag['grand_total'] * 100)
+    client_secret = await _aget_payment_intent(request, stripe_total)
+    return await sync_to_async(_render_checkout)(request, client_secret)
+
+
+def _render_checkout(request, client_secret):
+    """
+    Render the checkout page for ``client_secret``, prefilling the
+    order form from the user's profile.
+    """
+    stripe_public_key = settings.STRIPE_PUBLIC_KEY
+    profile = get_request_profile(request)
+    if profile:
+        order_form = OrderForm(initial={
+            'full_name': profile.user.get_full_name(),
+            'email': profile.user.email,
+            'phone_number': profile.default_phone_number,
+            'country': profile.default_country,
+            'postcode': profile.default_postcode,
+            'town_or_city': profile.default_town_or_city,
+            'street_address1': profile.default_street_address1,
+            'street_address2': profile.default_street_address2,
+            'county': profile.default_county,
+        })
+    else:
+        order_form = OrderForm()
+
+    if not stripe_public_key:
+        messages.warning(
+            request,
+            'Stripe public key is missing. '
+            'Did you forget to set it in your environment?'
+        )
+
+    template = 'checkout/checkout.html'
+    context = {
+        **get_bag_summary(request),
+        'order_form': order_form,
+        'stripe_public_key': stripe_public_key,
+        'client_secret': client_secret,
+    }
+    return render(request, template, context)
 
 
 def checkout_success(request, order_number):
@@ -201,8 +386,8 @@ def checkout_success(request, order_number):
     save_info = request.session.get('save_info')
     order = get_object_or_404(Order, order_number=order_number)
 
-    if request.user.is_authenticated:
-        profile = UserProfile.objects.get(user=request.user)
+    profile = get_request_profile(request)
+    if profile:
         order.user_profile = profile
         order.save()
 
@@ -236,8 +421,9 @@ def checkout_success(request, order_number):
         )
     messages.success(request, msg)
 
-    if 'bag' in request.session:
-        del request.session['bag']
+    clear_bag(request)
+    # The intent is paid; the next checkout needs a new one
+    request.session.pop(PAYMENT_INTENT_SESSION_KEY, None)
 
     template = 'checkout/checkout_success.html'
     context = {'order': order}
@@ -1,19 +1,50 @@
 import json
-import time
 from decimal import Decimal
 
 import stripe
 from django.http import HttpResponse
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 
-from .models import Order, OrderLineItem
-from products.models import ProductVariant
+from .jobs import FailJob, RetryJob, enqueue_webhook_job
+from .models import Order
+from .outbox import queue_email
+from .stripe_client import get_stripe_client
+from .utils import build_order
 from profiles.models import UserProfile
 
 MEMBER_DISCOUNT_RATE = Decimal('0.10')
 
+# How many times the worker looks for the order created by the checkout
+# view before creating it from the webhook instead
+ORDER_WAIT_ATTEMPTS = 5
+
+# Order fields compared exactly rather than case-insensitively
+EXACT_MATCH_FIELDS = ('grand_total', 'original_bag')
+
+
+def _mismatched_order_fields(order, expected):
+    """
+    Return the names of fields on ``order`` that differ from
+    ``expected``.
+
+    Text fields are compared case-insensitively, with blank and ``None``
+    treated alike, as the address Stripe returns may differ in case and
+    blanks from what the customer submitted.
+    """
+    mismatched = []
+    for field, value in expected.items():
+        actual = getattr(order, field)
+        if field in EXACT_MATCH_FIELDS:
+            matches = actual == value
+        else:
+            matches = (
+                str(actual or '').casefold() == str(value or '').casefold()
+            )
+        if not matches:
+            mismatched.append(field)
+    return mismatched
+
 
 class StripeWH_Handler:
     """
@@ -22,17 +53,22 @@ class StripeWH_Handler:
     This class processes successful and failed payment intents,
     verifies or creates
     corresponding Order records, applies discounts for members,
-    sends confirmation
+    queues confirmation
     emails, and updates user profiles with saved delivery details.
+
+    Successful payments are queued as a ``WebhookJob`` and reconciled by
+    the background worker (see ``checkout.jobs``), so the webhook itself
+    returns immediately. The worker passes no request.
     """
 
-    def __init__(self, request):
+    def __init__(self, request=None):
         self.request = request
 
-    def _send_confirmation_email(self, order):
+    def _queue_confirmation_email(self, order):
         """
-        Send an order confirmation email to the customer using
-        predefined email subject and body templates.
+        Queue an order confirmation email to the customer using
+        predefined email subject and body templates. The outbox worker
+        sends it (see ``checkout.outbox``).
         """
         cust_email = order.email
         subject = render_to_string(
@@ -43,12 +79,7 @@ class StripeWH_Handler:
             'checkout/confirmation_emails/confirmation_email_body.txt',
             {'order': order, 'contact_email': settings.DEFAULT_FROM_EMAIL},
         )
-        send_mail(
-            subject,
-            body,
-            settings.DEFAULT_FROM_EMAIL,
-            [cust_email],
-        )
+        queue_email(subject, body, [cust_email])
 
     def handle_event(self, event):
         """
@@ -64,19 +95,70 @@ class StripeWH_Handler:
         """
         Handle Stripe's payment_intent.succeeded event.
 
-        - Attempts to find an existing matching order.
-        - If not found, creates a new Order and related OrderLineItems.
+        Queues the payment intent for reconciliation and acknowledges
+        the event straight away; the work happens in
+        ``reconcile_payment_intent`` on the background worker.
+        """
+        enqueue_webhook_job(event)
+        return HttpResponse(
+            content=(
+                f'Webhook received: {event["type"]} | SUCCESS: '
+                'Queued for reconciliation.'
+            ),
+            status=200,
+        )
+
+    def run_job(self, job):
+        """
+        Run a queued ``WebhookJob`` (called by the background worker).
+        """
+        if job.event_type == 'payment_intent.succeeded':
+            intent = stripe.PaymentIntent.construct_from(
+                json.loads(job.payload), None
+            )
+            self.reconcile_payment_intent(intent, job.attempts)
+
+    def reconcile_payment_intent(self, intent, attempt):
+        """
+        Make sure a successful payment intent has a matching order.
+
+        - Looks up the order the checkout view should have created by
+          its PID. While it is missing and ``attempt`` is below
+          ``ORDER_WAIT_ATTEMPTS``, raises ``RetryJob`` before calling
+          Stripe, so the worker tries again after a backoff instead of
+          sleeping.
+        - Then retrieves the charge and checks an existing order's
+          details match the payment.
+        - If the order is still missing, creates a new Order and related
+          OrderLineItems.
         - Applies member discounts if applicable.
         - Saves user profile data if requested.
-        - Sends confirmation email to the customer.
+        - Queues a confirmation email to the customer.
+
+        Raises:
+            RetryJob: if the order hasn't appeared yet.
+            FailJob: if the order for this PID doesn't match the
+            payment, so it is left for a human to review without
+            retrying.
+            Exception: anything raised creating the order; the worker
+            retries the job.
         """
-        intent = event.data.object
         pid = intent.id
         bag = intent.metadata.bag
         save_info = intent.metadata.save_info
 
+        # Look for the order the checkout view creates before calling
+        # Stripe, so retries while it is missing cost one indexed lookup.
+        # The PID is unique per order; the details are then checked
+        # against the one candidate row.
+        order = Order.objects.filter(stripe_pid=pid).first()
+        if order is None and attempt < ORDER_WAIT_ATTEMPTS:
+            raise RetryJob(f'No order for {pid} yet')
+
         # Retrieve charge and billing details
-        stripe_charge = stripe.Charge.retrieve(intent.latest_charge)
+        stripe_charge = get_stripe_client().v1.charges.retrieve(
+            intent.latest_charge
+        )
         billing_details = stripe_charge.billing_details
         shipping_details = intent.shipping
         grand_total = Decimal(stripe_charge.amount) / 100
@@ -112,111 +194,55 @@ class StripeWH_Handler:
             except UserProfile.DoesNotExist:
                 profile = None
 
-        # Try to find the existing order (may have been created pre‑webhook)
-        order_exists = False
-        attempt = 1
-        while attempt <= 5:
-            try:
-                order = Order.objects.get(
-                    full_name__iexact=shipping_details.name,
-                    email__iexact=billing_details.email,
-                    phone_number__iexact=shipping_details.phone,
-                    country__iexact=shipping_details.address.country,
-                    postcode__iexact=shipping_details.address.postal_code,
-                    town_or_city__iexact=shipping_details.address.city,
-                    street_address1__iexact=shipping_details.address.line1,
-                    street_address2__iexact=shipping_details.address.line2,
-                    county__iexact=shipping_details.address.state,
-                    grand_total=grand_total,
-                    original_bag=bag,
-                    stripe_pid=pid,
+        if order is not None:
+            mismatched = _mismatched_order_fields(order, {
+                'full_name': shipping_details.name,
+                'email': billing_details.email,
+                'phone_number': shipping_details.phone,
+                'country': shipping_details.address.country,
+                'postcode': shipping_details.address.postal_code,
+                'town_or_city': shipping_details.address.city,
+                'street_address1': shipping_details.address.line1,
+                'street_address2': shipping_details.address.line2,
+                'county': shipping_details.address.state,
+                'grand_total': grand_total,
+                'original_bag': bag,
+            })
+            if mismatched:
+                raise FailJob(
+                    f'Order {order.order_number} for {pid} does not match '
+                    f'the payment: {", ".join(mismatched)}'
                 )
-                order_exists = True
-                break
-            except Order.DoesNotExist:
-                attempt += 1
-                time.sleep(1)
-
-        if order_exists:
-            self._send_confirmation_email(order)
-            return HttpResponse(
-                content=(
-                    f'Webhook received: {event["type"]} | SUCCESS: '
-                    'Verified existing order.'
-                ),
-                status=200,
-            )
+            self._queue_confirmation_email(order)
+            return order
 
         # --- Create a new order if not found ---
-        order = None
-        try:
-            # Apply member discount if applicable
-            discount = Decimal('0.00')
-            if profile and profile.is_member:
-                discount = grand_total * MEMBER_DISCOUNT_RATE
-
-            order_total = grand_total - discount
-
-            # Estimate delivery using same logic as contexts.py
-            if order_total < settings.FREE_DELIVERY_THRESHOLD:
-                delivery_cost = order_total * Decimal(
-                    settings.STANDARD_DELIVERY_PERCENTAGE / 100
-                )
-            else:
-                delivery_cost = Decimal('0.00')
-
-            order = Order.objects.create(
-                full_name=shipping_details.name,
-                user_profile=profile,
-                email=billing_details.email,
-                phone_number=shipping_details.phone,
-                country=shipping_details.address.country,
-                postcode=shipping_details.address.postal_code,
-                town_or_city=shipping_details.address.city,
-                street_address1=shipping_details.address.line1,
-                street_address2=shipping_details.address.line2,
-                county=shipping_details.address.state,
-                order_total=order_total,
-                delivery_cost=delivery_cost,
-                discount=round(discount, 2),
-                grand_total=grand_total,
-                original_bag=bag,
-                stripe_pid=pid,
-            )
+        order = Order(
+            full_name=shipping_details.name,
+            user_profile=profile,
+            email=billing_details.email,
+            phone_number=shipping_details.phone,
+            country=shipping_details.address.country,
+            postcode=shipping_details.address.postal_code,
+            town_or_city=shipping_details.address.city,
+            street_address1=shipping_details.address.line1,
+            street_address2=shipping_details.address.line2,
+            county=shipping_details.address.state,
+            original_bag=bag,
+            stripe_pid=pid,
+        )
 
-            bag_items = json.loads(bag)
-            for item_id, item_data in bag_items.items():
-                for variant_key, quantity in (
-                    item_data['items_by_variant'].items()
-                ):
-                    size, colour = variant_key.split('_')
-                    variant = ProductVariant.objects.get(
-                        product_id=item_id,
-                        size__iexact=size,
-                        colour__iexact=colour,
-                    )
-                    OrderLineItem.objects.create(
-                        order=order,
-                        variant=variant,
-                        quantity=quantity,
-                    )
+        # Apply member discount to the goods, as the bag does
+        discount_rate = None
+        if profile and profile.is_member:
+            discount_rate = MEMBER_DISCOUNT_RATE
 
-        except Exception as e:
-            if order:
-                order.delete()
-            return HttpResponse(
-                content=f'Webhook received: {event["type"]} | ERROR: {e}',
-                status=500,
-            )
+        # Saved with its line items in one transaction, so a failure
+        # leaves nothing behind
+        build_order(order, json.loads(bag), discount_rate=discount_rate)
 
-        self._send_confirmation_email(order)
-        return HttpResponse(
-            content=(
-                f'Webhook received: {event["type"]} | SUCCESS: '
-                'Order created via webhook.'
-            ),
-            status=200,
-        )
+        self._queue_confirmation_email(order)
+        return order
 
     def handle_payment_intent_payment_failed(self, event):
         """
@@ -1,8 +1,10 @@
+from django.db import transaction
 from django.http import HttpResponse
 from django.conf import settings
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
+from checkout.models import ProcessedStripeEvent
 from checkout.webhook_handler import StripeWH_Handler
 
 import stripe
@@ -15,6 +17,8 @@ def webhook(request):
     Handle incoming Stripe webhook events.
 
     - Verifies the payload using Stripe's signing secret.
+    - Acknowledges events that were already handled (Stripe retries
+      deliveries) without handling them again.
     - Maps known event types to corresponding handler methods.
     - Uses `StripeWH_Handler` to process the event and return a response.
 
@@ -24,7 +28,6 @@ def webhook(request):
     """
     # Setup
     wh_secret = settings.STRIPE_WH_SECRET
-    stripe.api_key = settings.STRIPE_SECRET_KEY
 
     # Get the webhook data and verify its signature
     payload = request.body
@@ -62,6 +65,24 @@ def webhook(request):
     # Get the appropriate handler
     event_handler = event_map.get(event_type, handler.handle_event)
 
-    # Call the handler
-    response = event_handler(event)
+    # Record the event and call the handler together, so a failed
+    # delivery is forgotten and Stripe's retry is handled afresh
+    with transaction.atomic():
+        _, created = ProcessedStripeEvent.objects.get_or_create(
+            event_id=event['id'],
+            defaults={'event_type': event_type},
+        )
+        if not created:
+            return HttpResponse(
+                content=(
+                    f'Webhook received: {event_type} | '
+                    'Duplicate event, already processed.'
+                ),
+                status=200,
+            )
+
+        # Call the handler
+        response = event_handler(event)
+        if response.status_code >= 500:
+            transaction.set_rollback(True)
     return response
@@ -103,6 +103,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
                 'bag.contexts.bag_contents',
+                'home.contexts.deferred_csrf_token',
             ],
             'builtins': [
                 'crispy_forms.templatetags.crispy_forms_tags',
@@ -139,6 +140,46 @@ else:
         }
     }
 
+# Cache
+# Catalog versions and cache invalidations must be seen by every
+# gunicorn worker and the background workers, so the cache is always
+# shared: Redis when configured, otherwise a database table (created by
+# `python manage.py createcachetable`).
+# Catalog version counters (see products.versions) get their own
+# `versions` alias so they aren't evicted with cached pages; without
+# Redis they are kept in the CatalogVersion table instead.
+
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'versions',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# With Redis, sessions are read through the cache so cached anonymous
+# pages can be served without a database query
+if 'REDIS_URL' in os.environ:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Seconds anonymous catalog pages are served from the page cache
+# (0 disables it)
+ANONYMOUS_PAGE_CACHE_TIMEOUT = int(
+    os.environ.get('ANONYMOUS_PAGE_CACHE_TIMEOUT', 60 * 10)
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -257,6 +298,16 @@ STRIPE_CURRENCY = 'gbp'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WH_SECRET = os.getenv('STRIPE_WH_SECRET', '')
+# Point the Stripe client at another API host, e.g. a local stub server
+# (blank uses Stripe's own)
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')
+# Connect/read timeouts (seconds) and retries for Stripe API calls
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 5))
+STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', 20))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', 2))
+# Serve checkout with the async views and async Stripe client. Only
+# useful when running under ASGI (see the ``asgi`` process in Procfile)
+ASYNC_CHECKOUT = os.environ.get('ASYNC_CHECKOUT') == 'True'
 
 # --- Email Settings ---
 if os.environ.get('DEVELOPMENT') == 'True':
@@ -270,6 +321,8 @@ else:
     EMAIL_HOST = 'smtp.gmail.com'
     EMAIL_HOST_USER = os.environ.get('EMAIL_USER')
     EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASS')
+    # Don't let a slow mail server stall the outbox worker
+    EMAIL_TIMEOUT = 30
     DEFAULT_FROM_EMAIL = f'Fit Six <{EMAIL_HOST_USER}>'
 
 # --- Allauth Settings ---
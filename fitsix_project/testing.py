@@ -0,0 +1,14 @@
+"""
+Settings shared by the apps' test suites.
+"""
+
+# Stands in for the shared Redis cache, whose reads aren't SQL queries.
+# Use with ``override_settings(CACHES=IN_MEMORY_CACHES)`` in tests that
+# count queries.
+IN_MEMORY_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'versions',
+    },
+}
@@ -0,0 +1,22 @@
+"""
+Template context for pages that may be served from the shared anonymous
+page cache (see ``home.decorators``).
+"""
+from bag.utils import BAG_BADGE_DEFERRED_ATTR
+
+# Rendered in place of the visitor's CSRF token on shared pages; the bag
+# badge script swaps in the real token once the page loads
+DEFERRED_CSRF_TOKEN = 'deferred'
+
+
+def deferred_csrf_token(request):
+    """
+    Keep visitors' CSRF tokens out of pages that may be cached.
+
+    On shared pages ``{% csrf_token %}`` renders a placeholder instead of
+    calling ``get_token``, which overrides Django's built-in ``csrf``
+    context processor.
+    """
+    if getattr(request, BAG_BADGE_DEFERRED_ATTR, False):
+        return {'csrf_token': DEFERRED_CSRF_TOKEN}
+    return {}
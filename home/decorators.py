@@ -0,0 +1,90 @@
+"""
+Full-page caching for anonymous catalog traffic.
+
+Anonymous visitors see the same catalog pages apart from their bag
+badge and CSRF token, so those pages are cached per URL and catalog
+version. The badge is rendered blank and the token as a placeholder
+(``home.contexts.deferred_csrf_token``), and both values are filled in
+by the browser from the bag summary endpoint
+(``templates/includes/scripts/bag_badge.html``).
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.session import SessionStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from bag.utils import BAG_BADGE_DEFERRED_ATTR
+from products.versions import get_catalog_version
+
+PAGE_CACHE_KEY = 'pages:anonymous:{}:{}'
+
+
+def page_cache_key(request):
+    """Return the cache key for the page at the request's full URL."""
+    url = request.build_absolute_uri()
+    return PAGE_CACHE_KEY.format(
+        get_catalog_version(),
+        hashlib.md5(url.encode('utf-8')).hexdigest(),
+    )
+
+
+def _is_cacheable_request(request):
+    """
+    Only anonymous GETs with no pending messages share cached pages.
+    """
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not request.session.get(SessionStorage.session_key)
+    )
+
+
+def _is_cacheable_response(request, response):
+    """
+    Only store complete pages that carry nothing belonging to this
+    visitor: no cookies, and no CSRF token (rendering one calls
+    ``get_token``, which flags the cookie for an update).
+    """
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.session.modified
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cache_anonymous_page(view_func):
+    """
+    Serve anonymous GETs of a catalog page from the cache.
+
+    Pages are keyed on the full URL, so query strings (search, sort,
+    category, pagination) are cached separately, and on the catalog
+    version so any product change retires them. Signed-in visitors,
+    pending messages and responses that set cookies bypass the cache.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        timeout = settings.ANONYMOUS_PAGE_CACHE_TIMEOUT
+        if not timeout or not _is_cacheable_request(request):
+            return view_func(request, *args, **kwargs)
+
+        # The badge must not bake one visitor's bag into a shared page
+        setattr(request, BAG_BADGE_DEFERRED_ATTR, True)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view_func(request, *args, **kwargs)
+        if _is_cacheable_response(request, response):
+            cache.set(
+                key, (response.content, response['Content-Type']), timeout
+            )
+        return response
+    return _wrapped_view
@@ -1,3 +1,114 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from fitsix_project.testing import IN_MEMORY_CACHES
+from home.contexts import DEFERRED_CSRF_TOKEN
+from products.models import Category, Product, ProductVariant
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class AnonymousPageCacheTest(TestCase):
+    """
+    Tests for the full-page cache on anonymous catalog pages.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(
+            name='tops', friendly_name='Tops'
+        )
+        self.product = Product.objects.create(
+            name='Cached Tee',
+            description='A tee served from the page cache',
+            category=self.category
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size='M', colour='Red',
+            price=20.00, stock=5, sku='CACHED-TEE'
+        )
+        self.url = reverse('products')
+
+    def _warm(self, url):
+        self.client.get(url)
+
+    def test_anonymous_pages_served_without_queries(self):
+        """
+        Repeat anonymous visits are answered from the cache.
+        """
+        for url in (
+            self.url,
+            reverse('product_detail', args=[self.product.slug]),
+            reverse('home'),
+        ):
+            self._warm(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context)
+
+    def test_query_strings_cached_separately(self):
+        """
+        Each query string is its own cached page.
+        """
+        self._warm(self.url)
+        response = self.client.get(self.url, {'q': 'nothing-matches'})
+        self.assertContains(response, '0 Products')
+
+    def test_catalog_change_retires_pages(self):
+        """
+        Saving a product serves a freshly rendered page.
+        """
+        self._warm(self.url)
+        self.product.name = 'Renamed Tee'
+        self.product.save()
+        self.assertContains(self.client.get(self.url), 'Renamed Tee')
+
+    def test_bag_badge_is_deferred(self):
+        """
+        A visitor's bag count is never baked into the shared page.
+        """
+        session = self.client.session
+        session['bag'] = {str(self.product.pk): 3}
+        session.save()
+
+        response = self.client.get(self.url)
+        self.assertContains(response, 'data-bag-badge></span>')
+        self.assertContains(response, reverse('bag_summary'))
+
+    def test_csrf_token_is_never_cached(self):
+        """
+        Shared pages carry a placeholder token and set no CSRF cookie.
+        """
+        url = reverse('product_detail', args=[self.product.slug])
+        response = self.client.get(url)
+        self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertContains(
+            response,
+            f'name="csrfmiddlewaretoken" value="{DEFERRED_CSRF_TOKEN}"',
+        )
+
+        cached = self.client.get(url)
+        self.assertIsNone(cached.context)
+        self.assertEqual(cached.content, response.content)
+
+    def test_signed_in_users_bypass_cache(self):
+        """
+        Signed-in visitors always get a freshly rendered page.
+        """
+        user = User.objects.create_user(username='shopper', password='pw')
+        self.client.force_login(user)
+        self._warm(self.url)
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.context)
+        self.assertFalse(response.context['defer_bag_badge'])
+
+    def test_pending_messages_bypass_cache(self):
+        """
+        Pages with a pending message are rendered so it is shown.
+        """
+        self._warm(self.url)
+        response = self.client.get(self.url, {'q': ''}, follow=True)
+        self.assertContains(response, "You didn&#x27;t enter any search")
@@ -1,6 +1,9 @@
 from django.shortcuts import render
 
+from .decorators import cache_anonymous_page
 
+
+@cache_anonymous_page
 def index(request):
     """ A view to return the index page """
     return render(request, 'home/index.html')
@@ -1,5 +1,6 @@
 from django.utils.html import format_html
 from django.contrib import admin
+from .forms import BaseProductVariantFormSet
 from .models import Category, Product, ProductVariant
 
 
@@ -17,6 +18,7 @@ class ProductVariantInline(admin.TabularInline):
     within the Product admin interface.
     """
     model = ProductVariant
+    formset = BaseProductVariantFormSet
     extra = 1
     show_change_link = True
     verbose_name_plural = "Variants"
@@ -8,3 +8,7 @@ class ProductsConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        """Import signal handlers when the app is ready."""
+        import products.signals  # noqa: F401
@@ -0,0 +1,140 @@
+"""
+Type-ahead suggestions for the nav search box.
+
+Product and category names are loaded into a prefix trie once per
+worker. Every node stores its best few suggestions, so a lookup walks
+one node per typed character and never queries the database. The trie
+is rebuilt when the shared autocomplete version moves (see
+``products.signals``).
+"""
+import bisect
+import threading
+
+from django.urls import reverse
+
+from .models import Category, Product
+from .search import search_terms
+from .versions import get_autocomplete_version
+
+# Maximum suggestions returned for one prefix
+AUTOCOMPLETE_LIMIT = 8
+
+# Longest prefix worth looking up; longer input is truncated
+MAX_PREFIX_LENGTH = 50
+
+# Categories are listed ahead of individual products
+CATEGORY_RANK = 0
+PRODUCT_RANK = 1
+
+
+class _Node:
+    __slots__ = ('children', 'suggestions')
+
+    def __init__(self):
+        self.children = {}
+        self.suggestions = []
+
+
+class PrefixTrie:
+    """
+    Prefix trie keeping the top ``limit`` suggestions at every node.
+
+    Each label is inserted once for every word it contains, so typing
+    the start of any word in a name (e.g. "bot" for "Steel Bottle")
+    finds it.
+    """
+
+    def __init__(self, limit=AUTOCOMPLETE_LIMIT):
+        self.limit = limit
+        self.root = _Node()
+
+    def insert(self, suggestion, sort_key):
+        """Add a suggestion under the start of every word of its label."""
+        entry = (sort_key, suggestion)
+        words = search_terms(suggestion['label'])
+        phrases = {
+            ' '.join(words[index:]) for index in range(len(words))
+        }
+        for phrase in phrases:
+            node = self.root
+            for char in phrase:
+                node = node.children.setdefault(char, _Node())
+                self._offer(node, entry)
+
+    def _offer(self, node, entry):
+        suggestions = node.suggestions
+        if entry in suggestions:
+            return
+        if len(suggestions) == self.limit:
+            if entry[0] >= suggestions[-1][0]:
+                return
+            suggestions.pop()
+        bisect.insort(suggestions, entry, key=lambda item: item[0])
+
+    def lookup(self, prefix):
+        """Return the suggestions stored for ``prefix``."""
+        node = self.root
+        for char in ' '.join(search_terms(prefix)):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        if node is self.root:
+            return []
+        return [suggestion for _, suggestion in node.suggestions]
+
+
+class CatalogAutocomplete:
+    """
+    Per-worker trie over product and category names.
+
+    Built on first use with two queries and rebuilt whenever the shared
+    autocomplete version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.trie = None
+        self.version = None
+
+    def reset(self):
+        """Discard the trie so the next lookup rebuilds it."""
+        with self._lock:
+            self.trie = None
+            self.version = None
+
+    def suggest(self, prefix):
+        """Return up to ``AUTOCOMPLETE_LIMIT`` suggestions for ``prefix``."""
+        version = get_autocomplete_version()
+        if self.version != version:
+            self.rebuild(version)
+        return self.trie.lookup(prefix[:MAX_PREFIX_LENGTH])
+
+    def rebuild(self, version):
+        """Load every product and category name into a new trie."""
+        trie = PrefixTrie()
+        products_url = reverse('products')
+
+        for name, friendly_name in Category.objects.values_list(
+            'name', 'friendly_name'
+        ):
+            label = friendly_name or name
+            trie.insert({
+                'label': label,
+                'type': 'category',
+                'url': f'{products_url}?category={name}',
+            }, (CATEGORY_RANK, label.lower()))
+
+        for name, slug in Product.objects.values_list('name', 'slug'):
+            trie.insert({
+                'label': name,
+                'type': 'product',
+                'url': reverse('product_detail', args=[slug]),
+            }, (PRODUCT_RANK, name.lower(), slug))
+
+        with self._lock:
+            self.trie = trie
+            self.version = version
+
+
+# One trie per worker process
+catalog_autocomplete = CatalogAutocomplete()
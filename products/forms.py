@@ -1,6 +1,12 @@
 from django import forms
 from .widgets import CustomClearableFileInput
-from .models import Product, ProductVariant, Category
+from .models import (
+    DUPLICATE_VARIANT_MESSAGE,
+    Category,
+    Product,
+    ProductVariant,
+    make_variant_key,
+)
 
 
 class ProductVariantForm(forms.ModelForm):
@@ -41,6 +47,35 @@ class ProductVariantForm(forms.ModelForm):
                 })
 
 
+class BaseProductVariantFormSet(forms.BaseInlineFormSet):
+    """
+    Inline formset for a product's variants.
+
+    Rejects two variants with the same size and colour in one
+    submission, which the per-variant constraint check can't see.
+    """
+
+    def clean(self):
+        """
+        Flag every variant that repeats an earlier size and colour.
+        """
+        super().clean()
+        seen = set()
+        for form in self.forms:
+            # Skip blank extra forms and ones already showing errors
+            if not form.is_valid() or not form.cleaned_data:
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                continue
+            key = make_variant_key(
+                form.cleaned_data.get('size'),
+                form.cleaned_data.get('colour'),
+            )
+            if key in seen:
+                form.add_error(None, DUPLICATE_VARIANT_MESSAGE)
+            seen.add(key)
+
+
 class ProductForm(forms.ModelForm):
     """
     Form for creating and editing Product instances.
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 00:29
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.UniqueConstraint(models.F('product'), django.db.models.functions.text.Lower('size'), django.db.models.functions.text.Lower('colour'), name='unique_variant_product_size_colour', violation_error_message='This product already has a variant in that size and colour.'),
+        ),
+    ]
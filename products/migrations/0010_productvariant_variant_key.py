@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Concat, Lower
+
+
+def backfill_variant_keys(apps, schema_editor):
+    """Populate variant_key from each variant's size and colour."""
+    ProductVariant = apps.get_model('products', 'ProductVariant')
+    ProductVariant.objects.update(
+        variant_key=Lower(Concat(
+            Coalesce('size', Value('')),
+            Value('_'),
+            Coalesce('colour', Value('')),
+            output_field=models.CharField(),
+        ))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_productvariant_unique_variant_product_size_colour'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='productvariant',
+            name='unique_variant_product_size_colour',
+        ),
+        migrations.AddField(
+            model_name='productvariant',
+            name='variant_key',
+            field=models.CharField(
+                default='', editable=False, max_length=64
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            backfill_variant_keys, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='productvariant',
+            constraint=models.UniqueConstraint(
+                fields=('product', 'variant_key'),
+                name='unique_variant_product_key',
+                violation_error_message=(
+                    'This product already has a variant in that size '
+                    'and colour.'
+                ),
+            ),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Q
 from django.utils.text import slugify
 from django.urls import reverse
 
@@ -27,6 +30,21 @@ class Category(models.Model):
         return self.friendly_name
 
 
+class CatalogVersion(models.Model):
+    """
+    A catalog version counter (see ``products.versions``).
+
+    Counters are kept here when no ``versions`` cache is configured, so
+    they are bumped atomically and never culled along with cached pages.
+    """
+    key = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField()
+
+    def __str__(self):
+        """Return the counter's key and value."""
+        return f"{self.key}: {self.value}"
+
+
 class Product(models.Model):
     """
     Represents an individual product that can belong to a category
@@ -44,6 +62,8 @@ class Product(models.Model):
         image_url (str): Optional URL reference to an externally hosted image.
         created_at (datetime): Timestamp when the product was created.
         updated_at (datetime): Timestamp when the product was last updated.
+        search_vector (tsvector): Weighted full-text vector of the name and
+        description, maintained by the search backend on PostgreSQL.
     """
     category = models.ForeignKey(
         'Category', null=True, blank=True, on_delete=models.SET_NULL
@@ -62,6 +82,7 @@ class Product(models.Model):
     image = models.ImageField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def save(self, *args, **kwargs):
         """
@@ -93,6 +114,72 @@ class Product(models.Model):
         return self.name
 
 
+# Shown when a product would get two variants with the same size/colour
+DUPLICATE_VARIANT_MESSAGE = (
+    'This product already has a variant in that size and colour.'
+)
+
+
+def make_variant_key(size, colour):
+    """
+    Return the canonical ``"size_colour"`` key for a variant.
+
+    This is the same lower-cased form the bag stores, so bag lines can
+    be matched to variants with a plain equality lookup.
+    """
+    return f"{size or ''}_{colour or ''}".lower()
+
+
+class ProductVariantQuerySet(models.QuerySet):
+    """
+    Query helpers for product variants.
+    """
+
+    def for_option(self, product_id, size, colour):
+        """
+        Filter to the variant with the given size and colour,
+        case-insensitively, using the indexed ``variant_key``.
+        """
+        return self.filter(
+            product_id=product_id,
+            variant_key=make_variant_key(size, colour),
+        )
+
+    def for_keys(self, keys):
+        """
+        Filter to the variants for ``(product_id, variant_key)`` pairs.
+
+        Every pair is answered from the ``(product, variant_key)``
+        index in a single query.
+        """
+        lookups = Q()
+        for product_id, variant_key in keys:
+            lookups |= Q(product_id=product_id, variant_key=variant_key)
+        if not lookups:
+            return self.none()
+        return self.filter(lookups)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Set each variant's key before inserting, as ``save()`` would.
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj.variant_key = make_variant_key(obj.size, obj.colour)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        """
+        Refresh variant keys when sizes or colours are bulk updated.
+        """
+        objs = list(objs)
+        if {'size', 'colour'} & set(fields):
+            for obj in objs:
+                obj.variant_key = make_variant_key(obj.size, obj.colour)
+            fields = list(fields) + ['variant_key']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class ProductVariant(models.Model):
     """
     Represents a specific variation of a product,
@@ -107,9 +194,27 @@ class ProductVariant(models.Model):
         stock (int): Available quantity for this variant.
         size (str): The variant’s size (e.g., S, M, L) if applicable.
         colour (str): The variant’s colour (e.g., Black, Blue) if applicable.
+        variant_key (str): Canonical lower-cased ``"size_colour"`` key,
+        set on save and matching the keys stored in the bag.
         created_at (datetime): Timestamp when created.
         updated_at (datetime): Timestamp when last updated.
+
+    Each product can only have one variant per ``variant_key``, so size
+    and colour are unique case-insensitively, and the constraint's index
+    serves the bag, checkout and webhook lookups. The key is kept up to
+    date by ``save()``, ``bulk_create()`` and ``bulk_update()``, but not
+    by ``QuerySet.update()``, and is checked by model validation so
+    forms report duplicates instead of failing on save.
     """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'variant_key'],
+                name='unique_variant_product_key',
+                violation_error_message=DUPLICATE_VARIANT_MESSAGE,
+            ),
+        ]
+
     product = models.ForeignKey(
         'Product', on_delete=models.CASCADE, related_name='variants'
     )
@@ -123,9 +228,49 @@ class ProductVariant(models.Model):
     stock = models.PositiveIntegerField(default=0)
     size = models.CharField(max_length=5, null=True, blank=True)
     colour = models.CharField(max_length=50, null=True, blank=True)
+    variant_key = models.CharField(max_length=64, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductVariantQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """
+        Keep ``variant_key`` in step with the size and colour.
+        """
+        self.variant_key = make_variant_key(self.size, self.colour)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and (
+            {'size', 'colour'} & set(update_fields)
+        ):
+            kwargs['update_fields'] = set(update_fields) | {'variant_key'}
+        super().save(*args, **kwargs)
+
+    def validate_constraints(self, exclude=None):
+        """
+        Check the size/colour constraint whenever size and colour are
+        validated.
+
+        ``variant_key`` is never on a form, so model forms would
+        otherwise skip the constraint and the duplicate would only
+        surface as an ``IntegrityError`` on save.
+        """
+        self.variant_key = make_variant_key(self.size, self.colour)
+        if exclude and not {'size', 'colour'} & set(exclude):
+            exclude = set(exclude) - {'variant_key'}
+        super().validate_constraints(exclude=exclude)
+
+    def unique_error_message(self, model_class, unique_check):
+        """
+        Report a duplicate size/colour with the constraint's message
+        rather than one naming the hidden ``variant_key``.
+        """
+        if tuple(unique_check) == ('product', 'variant_key'):
+            return ValidationError(
+                DUPLICATE_VARIANT_MESSAGE, code='unique_together'
+            )
+        return super().unique_error_message(model_class, unique_check)
+
     def __str__(self):
         """
         Return a readable string representation combining
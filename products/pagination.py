@@ -0,0 +1,180 @@
+"""
+Pagination for the product listing.
+
+Two modes are supported:
+
+- Offset pages (``?page=N``) using Django's Paginator, counted against
+  the filtered but un-annotated queryset so the count never has to
+  aggregate variant prices.
+- Keyset pages (``?after=<cursor>``), which seek past the last product
+  of the previous page on the current sort key. Their cost stays flat
+  however deep into the catalog the visitor goes.
+
+Both modes order by the same ``(sort value, pk)`` pair, so a cursor taken
+from an offset page continues seamlessly.
+"""
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.paginator import Paginator, InvalidPage
+from django.db.models import DecimalField, F, Q, Value
+from django.db.models.functions import Coalesce, Lower
+from django.utils.functional import cached_property
+
+PRODUCTS_PER_PAGE = 24
+
+# Annotation name holding the value products are sorted on
+SORT_VALUE = 'sort_value'
+
+
+def _sort_expressions():
+    """Return the sort value expression for each supported sort."""
+    return {
+        'name': Lower('name'),
+        'category': Coalesce('category__name', Value('')),
+        'price': Coalesce(
+            'min_price', Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=6, decimal_places=2),
+        ),
+        # Only available on searches, which annotate search_rank
+        'relevance': F('search_rank'),
+    }
+
+
+class CountedPaginator(Paginator):
+    """
+    Paginator that counts a separate, cheaper queryset.
+
+    The listing queryset is annotated with aggregates, so counting it
+    directly wraps the whole grouped query in a subquery.
+    """
+
+    def __init__(self, object_list, per_page, count_queryset=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+        """Return the total number of products across all pages."""
+        if self.count_queryset is None:
+            return super().count
+        return self.count_queryset.count()
+
+
+def order_products(products, sort, direction):
+    """
+    Order products by the requested sort key with pk as a tie-breaker.
+
+    Unknown sorts fall back to ordering by pk.
+    """
+    expression = _sort_expressions().get(sort)
+    descending = direction == 'desc'
+
+    if expression is None:
+        return products.order_by('-pk' if descending else 'pk')
+
+    products = products.annotate(**{SORT_VALUE: expression})
+    if descending:
+        return products.order_by(F(SORT_VALUE).desc(), '-pk')
+    return products.order_by(F(SORT_VALUE).asc(), 'pk')
+
+
+def encode_cursor(product, sort):
+    """Return an opaque cursor pointing just past ``product``."""
+    value = None
+    if sort in _sort_expressions():
+        value = getattr(product, SORT_VALUE)
+        if isinstance(value, Decimal):
+            value = str(value)
+    payload = json.dumps([value, product.pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor, sort):
+    """
+    Decode a cursor into ``(sort value, pk)``.
+
+    Returns ``None`` for malformed cursors so callers can fall back to
+    the first page.
+    """
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        pk = int(pk)
+        if sort == 'price':
+            value = Decimal(value)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
+    return value, pk
+
+
+def seek_products(products, cursor, sort, direction):
+    """
+    Filter ordered products to those after the decoded cursor.
+    """
+    value, pk = cursor
+    descending = direction == 'desc'
+
+    if sort not in _sort_expressions():
+        if descending:
+            return products.filter(pk__lt=pk)
+        return products.filter(pk__gt=pk)
+
+    if descending:
+        after = Q(**{f'{SORT_VALUE}__lt': value}) | Q(
+            **{SORT_VALUE: value, 'pk__lt': pk}
+        )
+    else:
+        after = Q(**{f'{SORT_VALUE}__gt': value}) | Q(
+            **{SORT_VALUE: value, 'pk__gt': pk}
+        )
+    return products.filter(after)
+
+
+def paginate_products(request, products, count_queryset, sort, direction):
+    """
+    Return one page of ordered products plus pagination context.
+
+    ``products`` must already be ordered with `order_products`.
+    ``count_queryset`` is the filtered queryset without annotations.
+
+    Returns:
+        dict: ``products`` (list), ``product_total``, ``page_obj``
+        (``None`` in keyset mode), ``next_cursor`` and ``is_keyset``.
+    """
+    after = request.GET.get('after')
+    cursor = decode_cursor(after, sort) if after else None
+
+    if cursor:
+        rows = list(
+            seek_products(products, cursor, sort, direction)
+            [:PRODUCTS_PER_PAGE + 1]
+        )
+        has_next = len(rows) > PRODUCTS_PER_PAGE
+        page_products = rows[:PRODUCTS_PER_PAGE]
+        page_obj = None
+        product_total = count_queryset.count()
+    else:
+        paginator = CountedPaginator(
+            products, PRODUCTS_PER_PAGE, count_queryset=count_queryset
+        )
+        try:
+            page_obj = paginator.page(request.GET.get('page', 1))
+        except InvalidPage:
+            page_obj = paginator.page(1)
+        page_products = list(page_obj.object_list)
+        has_next = page_obj.has_next()
+        product_total = paginator.count
+
+    next_cursor = None
+    if has_next and page_products:
+        next_cursor = encode_cursor(page_products[-1], sort)
+
+    return {
+        'products': page_products,
+        'product_total': product_total,
+        'page_obj': page_obj,
+        'next_cursor': next_cursor,
+        'is_keyset': cursor is not None,
+    }
@@ -0,0 +1,447 @@
+"""
+Pluggable full-text search for the product catalog.
+
+The backend is picked from ``settings.PRODUCT_SEARCH_BACKEND`` (a dotted
+path) or, if unset, from the database vendor:
+
+- PostgreSQL: a GIN-indexed ``Product.search_vector`` tsvector column.
+- SQLite: an FTS5 virtual table (``products_product_fts``).
+- Anything else: the original ``icontains`` scan.
+
+``InvertedIndexSearchBackend`` can be selected explicitly where database
+extensions are unavailable; it answers searches from an in-memory index
+held by each worker.
+
+Every backend filters a product queryset and annotates it with
+``search_rank`` (higher is more relevant), and is kept in sync by the
+``Product``, ``ProductVariant`` and ``Category`` signals in
+``products.signals``.
+"""
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product, ProductVariant
+from .versions import bump_search_index_version, get_search_index_version
+
+# Annotation name holding each product's relevance for the search term
+SEARCH_RANK = 'search_rank'
+
+FTS_TABLE = 'products_product_fts'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Split a search query into lower-case word tokens."""
+    return [term.lower() for term in _TOKEN_RE.findall(query or '')]
+
+
+class BasicSearchBackend:
+    """
+    Case-insensitive substring search over name and description.
+
+    Used when the database has no full-text support. Name matches rank
+    above description-only matches.
+    """
+
+    def search(self, products, query):
+        """Filter and rank products matching ``query``."""
+        matches = Q(name__icontains=query) | Q(description__icontains=query)
+        return products.filter(matches).annotate(**{
+            SEARCH_RANK: Case(
+                When(name__icontains=query, then=Value(2.0)),
+                default=Value(1.0),
+                output_field=FloatField(),
+            )
+        })
+
+    def index_product(self, product):
+        """No index to maintain."""
+
+    def remove_product(self, product_id):
+        """No index to maintain."""
+
+    def reindex_products(self, product_ids):
+        """No index to maintain."""
+
+
+class PostgresSearchBackend:
+    """
+    Full-text search using the GIN-indexed ``search_vector`` column.
+
+    Names are weighted above descriptions, and every term is matched as
+    a prefix so partial words still find products as they did with
+    ``icontains``.
+    """
+
+    config = 'english'
+
+    def _vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return (
+            SearchVector('name', weight='A', config=self.config)
+            + SearchVector('description', weight='B', config=self.config)
+        )
+
+    def search(self, products, query):
+        """Filter and rank products matching ``query``."""
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms = search_terms(query)
+        if not terms:
+            return products.none()
+
+        tsquery = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            search_type='raw',
+            config=self.config,
+        )
+        return products.filter(search_vector=tsquery).annotate(**{
+            SEARCH_RANK: SearchRank(F('search_vector'), tsquery)
+        })
+
+    def index_product(self, product):
+        """Recompute the stored search vector for one product."""
+        Product.objects.filter(pk=product.pk).update(
+            search_vector=self._vector()
+        )
+
+    def remove_product(self, product_id):
+        """The vector is deleted along with its row."""
+
+    def reindex_products(self, product_ids):
+        """Variants and categories are not part of the vector."""
+
+
+class SQLiteFTSSearchBackend:
+    """
+    Full-text search using an SQLite FTS5 virtual table.
+
+    The table's rowid is the product id. Results are ranked with FTS5's
+    ``bm25()`` (negated, so higher is better), weighting names above
+    descriptions.
+    """
+
+    def _match_expression(self, query):
+        terms = search_terms(query)
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def search(self, products, query):
+        """Filter and rank products matching ``query``."""
+        match = self._match_expression(query)
+        if not match:
+            return products.none()
+
+        matching_ids = RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = {Product._meta.db_table}.id',
+            (match,),
+            output_field=FloatField(),
+        )
+        return products.filter(pk__in=matching_ids).annotate(**{
+            SEARCH_RANK: rank
+        })
+
+    def index_product(self, product):
+        """Replace the FTS row for one product."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) '
+                'VALUES (%s, %s, %s)',
+                [product.pk, product.name, product.description],
+            )
+
+    def remove_product(self, product_id):
+        """Delete the FTS row for one product."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id]
+            )
+
+    def reindex_products(self, product_ids):
+        """Variants and categories are not part of the FTS table."""
+
+
+# Relative weight of a term occurrence in each indexed field
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'colour': 1.5,
+    'description': 1.0,
+}
+
+# Upper bound on ids returned by the inverted index for one search, which
+# keeps the follow-up ``pk__in`` query and rank expression small
+INDEX_RESULT_LIMIT = 500
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index over the product catalog.
+
+    Maps each token from a product's name, description, category
+    friendly name and variant colours to the products containing it and
+    a field-weighted score. Query terms are matched as prefixes against
+    a sorted vocabulary, and every term must match.
+
+    The index is built on first use and updated per product as the
+    catalog changes. Its version is a shared counter (see
+    ``products.versions``), so a worker that misses another worker's
+    update rebuilds before its next search.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Discard the index so the next search rebuilds it."""
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            self._vocabulary = []
+            self._vocabulary_stale = False
+            self.version = None
+
+    def ensure_current(self):
+        """Rebuild the index if it is missing or out of date."""
+        version = get_search_index_version()
+        if self.version != version:
+            self.rebuild(version)
+
+    def rebuild(self, version=None):
+        """Build the index from scratch with two queries."""
+        colours = defaultdict(set)
+        variants = ProductVariant.objects.exclude(colour__isnull=True)
+        for product_id, colour in variants.values_list(
+            'product_id', 'colour'
+        ):
+            colours[product_id].add(colour)
+
+        products = Product.objects.select_related('category').only(
+            'pk', 'name', 'description',
+            'category__name', 'category__friendly_name',
+        )
+
+        with self._lock:
+            self._postings = {}
+            self._documents = {}
+            for product in products.iterator():
+                self._add(product.pk, self._score_product(
+                    product, colours.get(product.pk, ())
+                ))
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_stale = False
+            self.version = (
+                get_search_index_version() if version is None else version
+            )
+
+    def search(self, query, limit=INDEX_RESULT_LIMIT):
+        """
+        Return ``(product_id, score)`` pairs for products matching every
+        term in ``query``, best match first.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return []
+
+        self.ensure_current()
+        with self._lock:
+            if self._vocabulary_stale:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_stale = False
+
+            scores = None
+            for term in set(terms):
+                term_scores = self._prefix_scores(term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        product_id: score + term_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in term_scores
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    def update_products(self, product_ids):
+        """Re-read the given products from the database and re-index them."""
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+
+        colours = defaultdict(set)
+        variants = ProductVariant.objects.filter(
+            product_id__in=product_ids, colour__isnull=False
+        )
+        for product_id, colour in variants.values_list(
+            'product_id', 'colour'
+        ):
+            colours[product_id].add(colour)
+
+        products = Product.objects.filter(
+            pk__in=product_ids
+        ).select_related('category')
+
+        with self._lock:
+            for product_id in product_ids:
+                self._discard(product_id)
+            for product in products:
+                self._add(product.pk, self._score_product(
+                    product, colours.get(product.pk, ())
+                ))
+            self._mark_updated()
+
+    def remove_products(self, product_ids):
+        """Drop the given products from the index."""
+        with self._lock:
+            for product_id in product_ids:
+                self._discard(product_id)
+            self._mark_updated()
+
+    def _mark_updated(self):
+        """
+        Publish a change to other workers.
+
+        Bumps are atomic and a counter is never re-seeded to a value it
+        held before, so getting exactly ``self.version + 1`` back proves
+        no other change happened since this index was built. Otherwise
+        another worker's change is not reflected here, so the index is
+        left stale and rebuilt on the next search.
+        """
+        self._vocabulary_stale = True
+        version = bump_search_index_version()
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+        else:
+            self.version = None
+
+    def _score_product(self, product, colours):
+        """Return ``{token: score}`` for one product's indexed fields."""
+        category = product.category
+        fields = {
+            'name': product.name,
+            'description': product.description,
+            'category': (
+                (category.friendly_name or category.name) if category else ''
+            ),
+            'colour': ' '.join(colours),
+        }
+        scores = defaultdict(float)
+        for field, text in fields.items():
+            for token in search_terms(text):
+                scores[token] += FIELD_WEIGHTS[field]
+        return scores
+
+    def _add(self, product_id, scores):
+        for token, score in scores.items():
+            self._postings.setdefault(token, {})[product_id] = score
+        self._documents[product_id] = tuple(scores)
+        self._vocabulary_stale = True
+
+    def _discard(self, product_id):
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+
+    def _prefix_scores(self, term):
+        """Return the best score per product for tokens starting with term."""
+        scores = {}
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            for product_id, score in self._postings.get(token, {}).items():
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+
+
+# One index per worker process
+catalog_index = InvertedIndex()
+
+
+class InvertedIndexSearchBackend:
+    """
+    Search answered by the worker's in-memory `InvertedIndex`.
+
+    The index returns ranked product ids, so the database only fetches
+    the matching rows by primary key. Index updates are applied once the
+    surrounding transaction commits.
+    """
+
+    index = catalog_index
+
+    def search(self, products, query):
+        """Filter and rank products matching ``query``."""
+        ranked = self.index.search(query)
+        if not ranked:
+            return products.none()
+
+        return products.filter(
+            pk__in=[product_id for product_id, _ in ranked]
+        ).annotate(**{
+            SEARCH_RANK: Case(
+                *[
+                    When(pk=product_id, then=Value(score))
+                    for product_id, score in ranked
+                ],
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        })
+
+    def index_product(self, product):
+        """Re-index one product after it is saved."""
+        self.reindex_products([product.pk])
+
+    def remove_product(self, product_id):
+        """Drop a deleted product from the index."""
+        transaction.on_commit(
+            lambda: self.index.remove_products([product_id])
+        )
+
+    def reindex_products(self, product_ids):
+        """Re-index products whose variants or category changed."""
+        product_ids = list(product_ids)
+        transaction.on_commit(
+            lambda: self.index.update_products(product_ids)
+        )
+
+
+_VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteFTSSearchBackend,
+}
+
+
+def get_search_backend():
+    """Return the configured product search backend."""
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return _VENDOR_BACKENDS.get(connection.vendor, BasicSearchBackend)()
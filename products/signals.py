@@ -0,0 +1,132 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Category, Product, ProductVariant
+from .search import get_search_backend
+from .variant_matrix import invalidate_variant_matrix
+from .versions import (
+    bump_autocomplete_version,
+    bump_catalog_version,
+    bump_price_version,
+)
+
+
+@receiver(post_init, sender=ProductVariant)
+def remember_price_and_stock(sender, instance, **kwargs):
+    """
+    Remember the loaded price, stock, product and colour so saves can
+    detect changes
+    """
+    instance._loaded_price_and_stock = (instance.price, instance.stock)
+    instance._loaded_product_and_colour = (
+        instance.product_id, instance.colour
+    )
+
+
+@receiver(post_save, sender=ProductVariant)
+def bump_version_on_save(sender, instance, created, **kwargs):
+    """
+    Bump the price version when a variant's price or stock changes,
+    drop the product's cached variant matrix, and re-index the product
+    when its colours may have changed
+    """
+    current = (instance.price, instance.stock)
+    if created or current != instance._loaded_price_and_stock:
+        bump_price_version()
+    instance._loaded_price_and_stock = current
+    invalidate_variant_matrix(instance.product_id)
+
+    loaded = instance._loaded_product_and_colour
+    product_and_colour = (instance.product_id, instance.colour)
+    if created or product_and_colour != loaded:
+        get_search_backend().reindex_products(
+            {loaded[0], instance.product_id} - {None}
+        )
+    instance._loaded_product_and_colour = product_and_colour
+
+
+@receiver(post_delete, sender=ProductVariant)
+def bump_version_on_delete(sender, instance, **kwargs):
+    """
+    Bump the price version and drop the cached variant matrix when a
+    variant is removed
+    """
+    bump_price_version()
+    invalidate_variant_matrix(instance.product_id)
+    get_search_backend().reindex_products([instance.product_id])
+
+
+def touch_products(products):
+    """
+    Bump ``updated_at`` on products whose rendered cards or detail
+    pages depend on a changed variant or category.
+
+    Cached template fragments are keyed on ``updated_at``, so this
+    retires them. ``update()`` is used so no ``Product`` signals fire.
+    """
+    products.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def touch_product_on_variant_change(sender, instance, **kwargs):
+    """
+    Retire cached fragments for a product when one of its variants
+    changes
+    """
+    touch_products(Product.objects.filter(pk=instance.product_id))
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, **kwargs):
+    """
+    Keep the full-text search index and suggestions in sync with
+    product edits
+    """
+    get_search_backend().index_product(instance)
+    bump_autocomplete_version()
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    """
+    Remove deleted products from the full-text search index and
+    suggestions
+    """
+    get_search_backend().remove_product(instance.pk)
+    bump_autocomplete_version()
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, **kwargs):
+    """
+    Re-index a category's products, retire their cached fragments and
+    refresh suggestions when its names change
+    """
+    get_search_backend().reindex_products(
+        instance.product_set.values_list('pk', flat=True)
+    )
+    touch_products(instance.product_set.all())
+    bump_autocomplete_version()
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_suggestion(sender, instance, **kwargs):
+    """
+    Drop a deleted category from search suggestions
+    """
+    bump_autocomplete_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_version_on_change(sender, **kwargs):
+    """
+    Retire cached catalog pages whenever the catalog changes
+    """
+    bump_catalog_version()
@@ -0,0 +1,49 @@
+"""Custom template filters for the Products app."""
+from django import template
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+
+@register.filter(name='media_url')
+def media_url(name):
+    """
+    Return the public URL for a stored media file name.
+
+    Used with annotated image names (e.g. ``product.card_image``), which
+    are plain strings rather than file fields with a ``.url`` attribute.
+
+    Args:
+        name (str): The file name as stored in the database.
+
+    Returns:
+        str: The storage URL, or an empty string if no name is given.
+    """
+    if not name:
+        return ''
+    return default_storage.url(name)
+
+
+@register.simple_tag(takes_context=True)
+def query_transform(context, **kwargs):
+    """
+    Return the current query string with the given parameters replaced.
+
+    Parameters set to ``None`` or an empty string are removed, which lets
+    pagination links switch between ``page`` and ``after`` while keeping
+    the active search, category and sort.
+
+    Args:
+        context (Context): The template context containing ``request``.
+        **kwargs: Query parameters to set or remove.
+
+    Returns:
+        str: The encoded query string (without the leading ``?``).
+    """
+    params = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        if value in (None, ''):
+            params.pop(key, None)
+        else:
+            params[key] = value
+    return params.urlencode()
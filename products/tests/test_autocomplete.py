@@ -0,0 +1,143 @@
+"""
+Test suite for search autocomplete.
+
+Covers:
+- Prefix matching at the start of any word in a name
+- Ordering and limiting suggestions
+- The JSON endpoint, its caching and query-free lookups
+- Rebuilding suggestions when names change
+"""
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from fitsix_project.testing import IN_MEMORY_CACHES
+from products.autocomplete import (
+    AUTOCOMPLETE_LIMIT,
+    PrefixTrie,
+    catalog_autocomplete,
+)
+from products.models import Category, Product
+
+
+class PrefixTrieTest(TestCase):
+    """
+    Tests for the suggestion trie.
+    """
+
+    def _trie(self, *labels):
+        trie = PrefixTrie(limit=3)
+        for label in labels:
+            trie.insert({'label': label}, (label.lower(),))
+        return trie
+
+    def _labels(self, trie, prefix):
+        return [suggestion['label'] for suggestion in trie.lookup(prefix)]
+
+    def test_matches_start_of_any_word(self):
+        """
+        Typing the start of a later word still finds the name.
+        """
+        trie = self._trie('Steel Bottle', 'Shaker Bottle', 'Hoodie')
+        self.assertEqual(
+            self._labels(trie, 'BOT'), ['Shaker Bottle', 'Steel Bottle']
+        )
+        self.assertEqual(self._labels(trie, 'steel b'), ['Steel Bottle'])
+        self.assertEqual(self._labels(trie, 'x'), [])
+
+    def test_keeps_top_suggestions_per_prefix(self):
+        """
+        Only the best ``limit`` suggestions are kept for each prefix.
+        """
+        trie = self._trie('Shorts D', 'Shorts B', 'Shorts A', 'Shorts C')
+        self.assertEqual(
+            self._labels(trie, 'sh'), ['Shorts A', 'Shorts B', 'Shorts C']
+        )
+
+    def test_empty_prefix_has_no_suggestions(self):
+        """
+        Blank input should not list the whole catalog.
+        """
+        self.assertEqual(self._labels(self._trie('Hoodie'), '  '), [])
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class SearchAutocompleteViewTest(TestCase):
+    """
+    Tests for the autocomplete endpoint.
+    """
+
+    def setUp(self):
+        catalog_autocomplete.reset()
+        self.addCleanup(catalog_autocomplete.reset)
+        self.url = reverse('search_autocomplete')
+        self.category = Category.objects.create(
+            name='supplements', friendly_name='Supplements'
+        )
+        self.product = Product.objects.create(
+            name='Super Greens', description='Daily greens powder',
+            category=self.category
+        )
+
+    def test_returns_categories_before_products(self):
+        """
+        Matching categories are suggested ahead of products.
+        """
+        response = self.client.get(self.url, {'q': 'su'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['suggestions'], [
+            {
+                'label': 'Supplements',
+                'type': 'category',
+                'url': reverse('products') + '?category=supplements',
+            },
+            {
+                'label': 'Super Greens',
+                'type': 'product',
+                'url': reverse('product_detail', args=[self.product.slug]),
+            },
+        ])
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_lookups_do_not_query_products(self):
+        """
+        After the first build, typing never touches the database.
+        """
+        self.client.get(self.url, {'q': 'gr'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'q': 'gre'})
+        self.assertEqual(len(response.json()['suggestions']), 1)
+
+    def test_limits_suggestions(self):
+        """
+        At most ``AUTOCOMPLETE_LIMIT`` suggestions are returned.
+        """
+        Product.objects.bulk_create([
+            Product(name=f'Super Bar {i}', slug=f'super-bar-{i}',
+                    description='Bar')
+            for i in range(AUTOCOMPLETE_LIMIT + 5)
+        ])
+        Category.objects.create(name='bars')
+        response = self.client.get(self.url, {'q': 'super'})
+        self.assertEqual(
+            len(response.json()['suggestions']), AUTOCOMPLETE_LIMIT
+        )
+
+    def test_renamed_products_are_suggested(self):
+        """
+        Saving a product refreshes the cached suggestions.
+        """
+        self.client.get(self.url, {'q': 'sup'})
+        self.product.name = 'Mega Greens'
+        self.product.save()
+
+        response = self.client.get(self.url, {'q': 'meg'})
+        labels = [s['label'] for s in response.json()['suggestions']]
+        self.assertEqual(labels, ['Mega Greens'])
+
+    def test_blank_query(self):
+        """
+        An empty query returns no suggestions.
+        """
+        response = self.client.get(self.url, {'q': ''})
+        self.assertEqual(response.json(), {'suggestions': []})
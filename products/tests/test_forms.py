@@ -1,6 +1,9 @@
 from django.test import TestCase
 from products.forms import ProductForm, ProductVariantForm
-from products.models import Product, Category
+from products.models import (
+    DUPLICATE_VARIANT_MESSAGE, Category, Product, ProductVariant
+)
+from products.views import ProductVariantFormSet
 
 
 class ProductFormTest(TestCase):
@@ -134,3 +137,82 @@ class ProductVariantFormTest(TestCase):
         form = ProductVariantForm(data=form_data)
         self.assertFalse(form.is_valid())
         self.assertIn('stock', form.errors)
+
+
+class ProductVariantFormSetTest(TestCase):
+    """
+    Test suite for the product variant formset used by the edit page.
+
+    Covers:
+    - Duplicate size/colour against saved variants
+    - Duplicate size/colour within one submission
+    """
+
+    def setUp(self):
+        """
+        Create a product with one saved variant.
+        """
+        self.product = Product.objects.create(
+            name='Test Product',
+            description='Test Description',
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size='M', colour='Blue',
+            price=9.99, stock=10, sku='FS-1'
+        )
+
+    def _formset(self, *new_variants):
+        data = {
+            'variants-TOTAL_FORMS': 1 + len(new_variants),
+            'variants-INITIAL_FORMS': 1,
+            'variants-0-id': self.variant.pk,
+            'variants-0-size': 'M',
+            'variants-0-colour': 'Blue',
+            'variants-0-price': '9.99',
+            'variants-0-stock': 10,
+        }
+        for i, (size, colour) in enumerate(new_variants, start=1):
+            data.update({
+                f'variants-{i}-size': size,
+                f'variants-{i}-colour': colour,
+                f'variants-{i}-price': '9.99',
+                f'variants-{i}-stock': 5,
+            })
+        return ProductVariantFormSet(
+            data,
+            instance=self.product,
+            queryset=ProductVariant.objects.filter(product=self.product),
+        )
+
+    def test_duplicate_of_saved_variant_is_invalid(self):
+        """
+        A new variant matching a saved one in any case is reported on
+        the form instead of failing on save.
+        """
+        formset = self._formset(('m', 'BLUE'))
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            formset.forms[1].non_field_errors(),
+            [DUPLICATE_VARIANT_MESSAGE],
+        )
+
+    def test_duplicate_within_submission_is_invalid(self):
+        """
+        Two new variants with the same size and colour are rejected.
+        """
+        formset = self._formset(('L', 'Red'), ('l', 'red'))
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(formset.forms[1].non_field_errors(), [])
+        self.assertEqual(
+            formset.forms[2].non_field_errors(),
+            [DUPLICATE_VARIANT_MESSAGE],
+        )
+
+    def test_distinct_variants_are_valid(self):
+        """
+        A new colour in an existing size saves normally.
+        """
+        formset = self._formset(('M', 'Red'))
+        self.assertTrue(formset.is_valid())
+        formset.save()
+        self.assertEqual(self.product.variants.count(), 2)
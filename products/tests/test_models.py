@@ -5,11 +5,14 @@ This module covers:
 - String representations of each model.
 - Relationships between Product and Category.
 - Relationship and output formatting of ProductVariant.
+- Canonical variant keys, their uniqueness and indexed variant lookups.
 """
 
 from decimal import Decimal
+from django.db import IntegrityError
 from django.test import TestCase
 from products.models import Category, Product, ProductVariant
+from products.versions import get_price_version
 
 
 class CategoryModelTest(TestCase):
@@ -99,3 +102,102 @@ class ProductVariantModelTest(TestCase):
         """
         self.assertFalse(self.variant.image)
         self.assertFalse(self.variant.image_back)
+
+    def test_price_change_bumps_price_version(self):
+        """
+        Saving a new price should bump the catalog price version.
+        """
+        version = get_price_version()
+        self.variant.price = Decimal('24.99')
+        self.variant.save()
+        self.assertGreater(get_price_version(), version)
+
+    def test_unrelated_change_keeps_price_version(self):
+        """
+        Saving without touching price or stock keeps the version.
+        """
+        variant = ProductVariant.objects.get(pk=self.variant.pk)
+        version = get_price_version()
+        variant.colour = 'Navy'
+        variant.save()
+        self.assertEqual(get_price_version(), version)
+
+
+class ProductVariantIndexTest(TestCase):
+    """
+    Tests for the canonical variant key, its uniqueness and the query
+    plans of variant lookups.
+    """
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Indexed Tee', description='Tee'
+        )
+        for i, (size, colour) in enumerate(
+            [('S', 'Red'), ('M', 'Red'), ('M', 'Blue'), ('L', 'Black')]
+        ):
+            ProductVariant.objects.create(
+                product=self.product, size=size, colour=colour,
+                price=Decimal('10.00'), sku=f'IDX-{i}'
+            )
+
+    def test_variant_key_set_on_save(self):
+        """
+        The key is the lower-cased size and colour, as the bag stores it.
+        """
+        variant = ProductVariant.objects.get(sku='IDX-2')
+        self.assertEqual(variant.variant_key, 'm_blue')
+
+        variant.colour = 'Navy'
+        variant.save(update_fields=['colour'])
+        variant.refresh_from_db()
+        self.assertEqual(variant.variant_key, 'm_navy')
+
+    def test_for_option_is_case_insensitive(self):
+        """
+        Lookups ignore case on size and colour.
+        """
+        variant = ProductVariant.objects.for_option(
+            self.product.pk, 'm', 'BLUE'
+        ).get()
+        self.assertEqual(variant.sku, 'IDX-2')
+
+    def test_for_keys_fetches_pairs_in_one_query(self):
+        """
+        Several product/key pairs resolve with a single query.
+        """
+        with self.assertNumQueries(1):
+            skus = {
+                variant.sku for variant in ProductVariant.objects.for_keys(
+                    [(self.product.pk, 's_red'), (self.product.pk, 'l_black')]
+                )
+            }
+        self.assertEqual(skus, {'IDX-0', 'IDX-3'})
+        self.assertFalse(ProductVariant.objects.for_keys([]).exists())
+
+    def test_duplicate_option_rejected(self):
+        """
+        Two variants can't share a size and colour in different cases.
+        """
+        with self.assertRaises(IntegrityError):
+            ProductVariant.objects.create(
+                product=self.product, size='s', colour='RED',
+                price=Decimal('10.00'), sku='IDX-DUP'
+            )
+
+    def test_for_option_uses_index(self):
+        """
+        Key lookups are an index search on product and key, where the
+        previous ``__iexact`` lookup compared every variant of the product.
+        """
+        indexed = ProductVariant.objects.for_option(
+            self.product.pk, 'm', 'blue'
+        ).explain()
+        self.assertIn('USING INDEX', indexed)
+        self.assertIn('(product_id=? AND variant_key=?)', indexed)
+
+        iexact = ProductVariant.objects.filter(
+            product_id=self.product.pk, size__iexact='m',
+            colour__iexact='blue'
+        ).explain()
+        self.assertNotIn('variant_key=?', iexact)
@@ -0,0 +1,333 @@
+"""
+Test suite for the product search backends.
+
+Covers:
+- The SQLite FTS5 backend used by the test database
+- Keeping the index in sync on product save and delete
+- Relevance ranking and the relevance sort option
+- The basic icontains fallback backend
+- The in-memory inverted index backend and its incremental updates
+- Leaving the index stale when its version bump wasn't exclusive
+"""
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from fitsix_project.testing import IN_MEMORY_CACHES
+from products.models import Category, Product, ProductVariant
+from products.search import (
+    BasicSearchBackend,
+    InvertedIndexSearchBackend,
+    SQLiteFTSSearchBackend,
+    catalog_index,
+    get_search_backend,
+)
+from products.versions import (
+    SEARCH_INDEX_VERSION_KEY, VERSIONS_CACHE, bump_search_index_version,
+)
+
+
+class SearchBackendTest(TestCase):
+    """
+    Tests for full-text product search.
+    """
+
+    def setUp(self):
+        self.category = Category.objects.create(name='gear')
+        self.bottle = Product.objects.create(
+            name='Steel Bottle',
+            description='Keeps drinks cold for hours',
+            category=self.category
+        )
+        self.shaker = Product.objects.create(
+            name='Protein Shaker',
+            description='A shaker bottle for protein shakes',
+            category=self.category
+        )
+        self.hoodie = Product.objects.create(
+            name='Training Hoodie',
+            description='Warm cotton hoodie',
+            category=self.category
+        )
+
+    def _search(self, query, backend=None):
+        backend = backend or get_search_backend()
+        return list(backend.search(Product.objects.all(), query))
+
+    def test_sqlite_uses_fts_backend(self):
+        """
+        The test database should pick the FTS5 backend.
+        """
+        self.assertIsInstance(get_search_backend(), SQLiteFTSSearchBackend)
+
+    def test_search_matches_name_and_description(self):
+        """
+        Terms are matched against both name and description.
+        """
+        results = {product.pk for product in self._search('bottle')}
+        self.assertEqual(results, {self.bottle.pk, self.shaker.pk})
+
+    def test_search_matches_prefixes(self):
+        """
+        Partial words should still match, like icontains did.
+        """
+        results = [product.pk for product in self._search('hood')]
+        self.assertEqual(results, [self.hoodie.pk])
+
+    def test_name_matches_rank_above_description_matches(self):
+        """
+        A name match should be more relevant than a description match.
+        """
+        results = sorted(
+            self._search('bottle'),
+            key=lambda product: product.search_rank,
+            reverse=True
+        )
+        self.assertEqual(results[0], self.bottle)
+
+    def test_index_follows_product_edits(self):
+        """
+        Renaming or deleting a product updates the index.
+        """
+        self.hoodie.name = 'Training Jacket'
+        self.hoodie.description = 'Lightweight jacket'
+        self.hoodie.save()
+        self.assertEqual(self._search('hoodie'), [])
+        self.assertEqual(self._search('jacket'), [self.hoodie])
+
+        self.hoodie.delete()
+        self.assertEqual(self._search('jacket'), [])
+
+    def test_search_without_terms_returns_nothing(self):
+        """
+        Punctuation-only queries should not match everything.
+        """
+        self.assertEqual(self._search('!!!'), [])
+
+    @override_settings(
+        PRODUCT_SEARCH_BACKEND='products.search.BasicSearchBackend'
+    )
+    def test_basic_backend_setting(self):
+        """
+        The backend can be overridden with a dotted path setting.
+        """
+        backend = get_search_backend()
+        self.assertIsInstance(backend, BasicSearchBackend)
+        results = {product.pk for product in self._search('bottle', backend)}
+        self.assertEqual(results, {self.bottle.pk, self.shaker.pk})
+
+    def test_relevance_sort_in_listing(self):
+        """
+        The listing can sort search results by relevance.
+        """
+        response = self.client.get(reverse('products'), {
+            'q': 'bottle',
+            'sort': 'relevance',
+            'direction': 'desc',
+        })
+        products = response.context['products']
+        self.assertEqual(products[0], self.bottle)
+        self.assertEqual(response.context['product_total'], 2)
+        self.assertContains(response, 'Relevance')
+
+    def test_relevance_sort_ignored_without_search(self):
+        """
+        Relevance falls back to the default order without a search term.
+        """
+        response = self.client.get(reverse('products'), {
+            'sort': 'relevance',
+            'direction': 'desc',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['current_sorting'], 'None_None')
+
+
+@override_settings(
+    PRODUCT_SEARCH_BACKEND='products.search.InvertedIndexSearchBackend',
+    CACHES=IN_MEMORY_CACHES,
+)
+class InvertedIndexSearchTest(TestCase):
+    """
+    Tests for the in-memory inverted index backend.
+    """
+
+    def setUp(self):
+        catalog_index.reset()
+        self.addCleanup(catalog_index.reset)
+        self.category = Category.objects.create(
+            name='drinkware', friendly_name='Drinkware'
+        )
+        self.bottle = Product.objects.create(
+            name='Steel Bottle',
+            description='Keeps drinks cold for hours',
+            category=self.category
+        )
+        self.shaker = Product.objects.create(
+            name='Protein Shaker',
+            description='A shaker bottle for protein shakes'
+        )
+        ProductVariant.objects.create(
+            product=self.shaker, sku='SHK-RED', colour='Crimson',
+            price='9.99', stock=5
+        )
+
+    def _search(self, query):
+        return list(get_search_backend().search(Product.objects.all(), query))
+
+    def test_backend_setting(self):
+        """
+        The inverted index backend is selected by the setting.
+        """
+        self.assertIsInstance(
+            get_search_backend(), InvertedIndexSearchBackend
+        )
+
+    def test_indexes_category_and_colour(self):
+        """
+        Category friendly names and variant colours are searchable.
+        """
+        self.assertEqual(self._search('drinkware'), [self.bottle])
+        self.assertEqual(self._search('crims'), [self.shaker])
+
+    def test_ranks_name_matches_first(self):
+        """
+        A name match outranks a description match.
+        """
+        results = sorted(
+            self._search('bottle'),
+            key=lambda product: product.search_rank,
+            reverse=True
+        )
+        self.assertEqual(results, [self.bottle, self.shaker])
+
+    def test_all_terms_must_match(self):
+        """
+        Multi-word queries only return products matching every term.
+        """
+        self.assertEqual(self._search('protein bot'), [self.shaker])
+        self.assertEqual(self._search('steel protein'), [])
+
+    def test_search_fetches_only_matching_rows(self):
+        """
+        Once built, a search is a single primary key query.
+        """
+        catalog_index.ensure_current()
+        with self.assertNumQueries(1):
+            self.assertEqual(self._search('steel'), [self.bottle])
+
+    def test_updates_incrementally_on_commit(self):
+        """
+        Product and variant changes update the built index in place.
+        """
+        catalog_index.ensure_current()
+        version = catalog_index.version
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottle.name = 'Steel Flask'
+            self.bottle.save()
+            ProductVariant.objects.create(
+                product=self.bottle, sku='BTL-GRN', colour='Olive',
+                price='14.99', stock=3
+            )
+        self.assertEqual(catalog_index.version, version + 2)
+        self.assertEqual(self._search('flask'), [self.bottle])
+        self.assertEqual(self._search('olive'), [self.bottle])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottle.delete()
+        self.assertEqual(self._search('flask'), [])
+
+    def test_category_rename_reindexes_products(self):
+        """
+        Renaming a category updates its products' entries.
+        """
+        catalog_index.ensure_current()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.friendly_name = 'Hydration'
+            self.category.save()
+        self.assertEqual(self._search('hydration'), [self.bottle])
+        self.assertEqual(self._search('drinkware'), [])
+
+    def test_only_colour_changes_reindex_variants(self):
+        """
+        Stock and price edits leave the index alone; a colour change
+        updates the product's entry.
+        """
+        catalog_index.ensure_current()
+        variant = ProductVariant.objects.get(sku='SHK-RED')
+        version = catalog_index.version
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.stock = 2
+            variant.price = '7.99'
+            variant.save()
+        self.assertEqual(catalog_index.version, version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.colour = 'Teal'
+            variant.save()
+        self.assertEqual(catalog_index.version, version + 1)
+        self.assertEqual(self._search('teal'), [self.shaker])
+        self.assertEqual(self._search('crims'), [])
+
+    def test_lost_version_marks_index_stale(self):
+        """
+        An update after the shared version was lost leaves the index to
+        be rebuilt rather than trusting a re-seeded counter.
+        """
+        catalog_index.ensure_current()
+        caches[VERSIONS_CACHE].delete(SEARCH_INDEX_VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottle.name = 'Steel Flask'
+            self.bottle.save()
+        self.assertIsNone(catalog_index.version)
+        self.assertEqual(self._search('flask'), [self.bottle])
+
+    def test_rebuilds_after_another_worker_updates(self):
+        """
+        A version bump from elsewhere triggers a rebuild on next search.
+        """
+        catalog_index.ensure_current()
+        Product.objects.filter(pk=self.bottle.pk).update(name='Steel Flask')
+        bump_search_index_version()
+        self.assertEqual(self._search('flask'), [self.bottle])
+
+
+@override_settings(
+    PRODUCT_SEARCH_BACKEND='products.search.InvertedIndexSearchBackend',
+)
+class StoredIndexVersionTest(TestCase):
+    """
+    Tests for the inverted index with its version kept in the database,
+    as when there's no Redis.
+    """
+
+    def setUp(self):
+        catalog_index.reset()
+        self.addCleanup(catalog_index.reset)
+        self.bottle = Product.objects.create(
+            name='Steel Bottle', description='Keeps drinks cold'
+        )
+
+    def test_own_update_keeps_index(self):
+        """
+        An update with no other change in between keeps the index.
+        """
+        catalog_index.ensure_current()
+        version = catalog_index.version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottle.name = 'Steel Flask'
+            self.bottle.save()
+        self.assertEqual(catalog_index.version, version + 1)
+
+    def test_interleaved_update_marks_index_stale(self):
+        """
+        If another worker bumped the version first, the index is left to
+        be rebuilt.
+        """
+        catalog_index.ensure_current()
+        bump_search_index_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottle.name = 'Steel Flask'
+            self.bottle.save()
+        self.assertIsNone(catalog_index.version)
@@ -0,0 +1,89 @@
+"""
+Test suite for the catalog version counters in products.versions.
+
+Covers:
+- Counters kept in the CatalogVersion table without a versions cache
+- Counters surviving a cull of the default cache
+- Re-seeding a counter lost from the versions cache
+"""
+
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from fitsix_project.testing import IN_MEMORY_CACHES
+from products.models import CatalogVersion, Product, ProductVariant
+from products.versions import (
+    PRICE_VERSION_KEY, VERSIONS_CACHE, bump_price_version, get_price_version,
+)
+
+
+class StoredVersionTest(TestCase):
+    """
+    Tests for counters kept in the database, as when there's no Redis.
+    """
+
+    def test_bumps_return_new_values(self):
+        """
+        Each bump returns a new, higher value stored in the table.
+        """
+        version = get_price_version()
+        first = bump_price_version()
+        second = bump_price_version()
+
+        self.assertEqual(first, version + 1)
+        self.assertEqual(second, version + 2)
+        self.assertEqual(
+            CatalogVersion.objects.get(key=PRICE_VERSION_KEY).value, second
+        )
+
+    def test_culling_the_cache_keeps_prices_current(self):
+        """
+        Clearing the default cache doesn't bring back an old price.
+        """
+        product = Product.objects.create(name='Bottle', description='Bottle')
+        variant = ProductVariant.objects.create(
+            product=product, sku='BTL-1', price='20.00', stock=5
+        )
+        session = self.client.session
+        session['bag'] = {str(product.pk): 1}
+        session.save()
+        # The bag is priced against a counter seeded after an earlier cull
+        cache.clear()
+        url = reverse('bag_summary')
+        self.assertEqual(
+            self.client.get(url, {'prices': 1}).json()['total'], '20.00'
+        )
+
+        variant.price = '30.00'
+        variant.save()
+        cache.clear()
+
+        self.assertEqual(
+            self.client.get(url, {'prices': 1}).json()['total'], '30.00'
+        )
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class CachedVersionTest(TestCase):
+    """
+    Tests for counters kept in the versions cache, as with Redis.
+    """
+
+    def test_lost_counter_never_repeats(self):
+        """
+        A counter evicted from the cache comes back higher than before.
+        """
+        version = bump_price_version()
+        caches[VERSIONS_CACHE].delete(PRICE_VERSION_KEY)
+
+        self.assertGreater(get_price_version(), version)
+        self.assertFalse(CatalogVersion.objects.exists())
+
+    def test_default_cache_clear_keeps_counter(self):
+        """
+        Clearing cached pages leaves the counters alone.
+        """
+        version = bump_price_version()
+        cache.clear()
+        self.assertEqual(get_price_version(), version)
@@ -1,6 +1,8 @@
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
+from fitsix_project.testing import IN_MEMORY_CACHES
 from products.models import Product, Category, ProductVariant
 
 
@@ -232,3 +234,304 @@ class ProductViewsTest(TestCase):
         self.assertTrue(
             any("Failed to add product" in str(m) for m in messages)
         )
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class ProductListingQueryCountTest(TestCase):
+    """
+    The product listing should cost a constant number of queries
+    regardless of catalog size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='tops', friendly_name='Tops')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                description='Bulk product',
+                category=category,
+                has_variants=bool(i % 2),
+            )
+            for i in range(5000)
+        ])
+        ProductVariant.objects.bulk_create([
+            ProductVariant(
+                product=product,
+                sku=f'SKU-{product.pk}-{size}',
+                price=price,
+                stock=5,
+                size=size,
+                colour='Black',
+                image=f'products/{product.pk}.webp',
+            )
+            for product in products
+            for size, price in (('S', 10), ('M', 12))
+        ])
+
+    def test_listing_query_count_is_constant(self):
+        """
+        Listing a 5,000 product catalog should not query per product.
+        """
+        product = Product.objects.filter(has_variants=True).first()
+        # One count query plus one query for the page of cards
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('products'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'From £10.00')
+        self.assertContains(response, f'products/{product.pk}.webp')
+
+    def test_non_variant_products_use_first_variant_price(self):
+        """
+        Non-variant products show their first variant's price.
+        """
+        response = self.client.get(reverse('products'), {
+            'sort': 'price',
+            'direction': 'asc',
+        })
+        product = response.context['products'][0]
+        self.assertEqual(product.min_price, product.max_price)
+
+
+class ProductListingPaginationTest(TestCase):
+    """
+    Tests for offset and keyset pagination of the product listing.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='tops', friendly_name='Tops')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Product {i:02d}',
+                slug=f'product-{i}',
+                description='Paged product',
+                category=category,
+                has_variants=True,
+            )
+            for i in range(60)
+        ])
+        ProductVariant.objects.bulk_create([
+            ProductVariant(
+                product=product,
+                sku=f'PAGE-{product.pk}',
+                price=10 + (index % 7),
+                stock=5,
+                size='M',
+                colour='Black',
+            )
+            for index, product in enumerate(products)
+        ])
+
+    def _walk_pages(self, params):
+        """Follow the keyset Next links and collect every product id."""
+        seen = []
+        response = self.client.get(reverse('products'), params)
+        while True:
+            seen.extend(product.pk for product in response.context['products'])
+            cursor = response.context['next_cursor']
+            if not cursor:
+                return seen
+            response = self.client.get(
+                reverse('products'), {**params, 'after': cursor}
+            )
+
+    def test_first_page_is_limited_and_counted(self):
+        """
+        The first page shows one page of products and the full count.
+        """
+        response = self.client.get(reverse('products'))
+        self.assertEqual(len(response.context['products']), 24)
+        self.assertEqual(response.context['product_total'], 60)
+        self.assertContains(response, '60 Products')
+        self.assertIsNotNone(response.context['next_cursor'])
+
+    def test_offset_page_parameter(self):
+        """
+        ?page= should return the matching offset page.
+        """
+        response = self.client.get(reverse('products'), {'page': 3})
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(len(response.context['products']), 12)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_keyset_walk_covers_every_sort(self):
+        """
+        Following cursors visits every product exactly once in order.
+        """
+        for sort in ('name', 'price', 'category', None):
+            for direction in ('asc', 'desc'):
+                params = {'direction': direction}
+                if sort:
+                    params['sort'] = sort
+                with self.subTest(sort=sort, direction=direction):
+                    seen = self._walk_pages(params)
+                    self.assertEqual(len(seen), 60)
+                    self.assertEqual(len(set(seen)), 60)
+
+    def test_keyset_price_order_is_monotonic(self):
+        """
+        Prices should never decrease across keyset pages.
+        """
+        response = self.client.get(reverse('products'), {
+            'sort': 'price', 'direction': 'asc'
+        })
+        first_page = [p.min_price for p in response.context['products']]
+        response = self.client.get(reverse('products'), {
+            'sort': 'price',
+            'direction': 'asc',
+            'after': response.context['next_cursor'],
+        })
+        second_page = [p.min_price for p in response.context['products']]
+        self.assertTrue(response.context['is_keyset'])
+        self.assertLessEqual(max(first_page), min(second_page))
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        """
+        A garbage cursor should render the first page.
+        """
+        response = self.client.get(reverse('products'), {'after': '!!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['is_keyset'])
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES, ANONYMOUS_PAGE_CACHE_TIMEOUT=0)
+class ProductDetailVariantMatrixTest(TestCase):
+    """
+    Tests for the cached variant matrix on the product detail page.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(
+            name='tops', friendly_name='Tops'
+        )
+        self.product = Product.objects.create(
+            name='Matrix Tee',
+            description='A tee in two colours',
+            category=self.category,
+            has_variants=True
+        )
+        self.red = ProductVariant.objects.create(
+            product=self.product, size='M', colour='Red',
+            price=20.00, stock=5, sku='TEE-M-RED'
+        )
+        ProductVariant.objects.create(
+            product=self.product, size='L', colour='Blue',
+            price=22.00, stock=2, sku='TEE-L-BLUE'
+        )
+        self.url = reverse('product_detail', args=[self.product.slug])
+
+    def test_matrix_in_context(self):
+        """
+        Sizes, colours and price map come from the variant matrix.
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['sizes'], ['M', 'L'])
+        self.assertEqual(response.context['colours'], ['Red', 'Blue'])
+        self.assertEqual(
+            response.context['default_variant']['sku'], 'TEE-M-RED'
+        )
+        cell = response.context['variant_matrix']['cells']['L_Blue']
+        self.assertEqual(cell['stock'], 2)
+        self.assertContains(response, '"M_Red": 20.0')
+
+    def test_cached_matrix_renders_with_one_query(self):
+        """
+        Once the matrix is cached, only the product itself is queried.
+        """
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Tops')
+
+    def test_variant_save_invalidates_matrix(self):
+        """
+        Saving a variant refreshes the cached matrix.
+        """
+        self.client.get(self.url)
+        self.red.price = 18.50
+        self.red.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '<span id="product-price">18.50</span>')
+
+
+class ProductFragmentCacheTest(TestCase):
+    """
+    Tests for cached product card and detail fragments.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(
+            name='tops', friendly_name='Tops'
+        )
+        self.product = Product.objects.create(
+            name='Fragment Tee',
+            description='A cached tee',
+            category=self.category,
+            has_variants=True
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size='M', colour='Red',
+            price=20.00, stock=5, sku='FRAG-M-RED'
+        )
+        self.product.refresh_from_db()
+        self.detail_url = reverse('product_detail', args=[self.product.slug])
+
+    def test_card_served_from_cache(self):
+        """
+        A card is not re-rendered while the product is unchanged.
+        """
+        self.client.get(reverse('products'))
+        # Bypass signals and updated_at so the cached card stays current
+        Product.objects.filter(pk=self.product.pk).update(
+            name='Renamed Tee', updated_at=self.product.updated_at
+        )
+        response = self.client.get(reverse('products'))
+        self.assertContains(response, 'Fragment Tee')
+
+    def test_variant_change_refreshes_card_and_detail(self):
+        """
+        Saving a variant bumps the product's updated_at, so cached
+        fragments are rebuilt with the new price.
+        """
+        self.client.get(reverse('products'))
+        self.client.get(self.detail_url)
+
+        self.variant.price = 15.00
+        self.variant.save()
+
+        self.assertContains(self.client.get(reverse('products')), '£15.00')
+        self.assertContains(
+            self.client.get(self.detail_url),
+            '<span id="product-price">15.00</span>'
+        )
+
+    def test_category_rename_refreshes_card(self):
+        """
+        Renaming a category rebuilds its products' cards.
+        """
+        self.client.get(reverse('products'))
+        self.category.friendly_name = 'Shirts'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('products')), 'Shirts')
+
+    def test_superuser_cards_cached_separately(self):
+        """
+        Staff controls never leak into the cached anonymous card.
+        """
+        admin = User.objects.create_superuser(
+            username='fragadmin', password='adminpass'
+        )
+        self.client.force_login(admin)
+        self.assertContains(
+            self.client.get(reverse('products')),
+            reverse('edit_product', args=[self.product.slug])
+        )
+        self.client.logout()
+        self.assertNotContains(
+            self.client.get(reverse('products')),
+            reverse('edit_product', args=[self.product.slug])
+        )
@@ -3,6 +3,11 @@ from . import views
 
 urlpatterns = [
     path('', views.all_products, name='products'),
+    path(
+        'autocomplete/',
+        views.search_autocomplete,
+        name='search_autocomplete'
+    ),
     path(
         'add/',
         views.add_product,
@@ -0,0 +1,98 @@
+"""
+Per-product variant matrix for the product detail page.
+
+The matrix maps every size/colour combination to the variant's sku,
+price, stock and image URLs, along with the distinct sizes and colours
+and the default (first) variant. It is built with one query, cached,
+and dropped by the ``ProductVariant`` signals in ``products.signals``
+whenever one of the product's variants is saved or deleted.
+"""
+from django.core.cache import cache
+
+from .models import ProductVariant
+
+VARIANT_MATRIX_CACHE_KEY = 'products:variant_matrix:{}'
+VARIANT_MATRIX_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def variant_matrix_cache_key(product_id):
+    """Return the cache key for a product's variant matrix."""
+    return VARIANT_MATRIX_CACHE_KEY.format(product_id)
+
+
+def _file_url(field):
+    return field.url if field else ''
+
+
+def build_variant_matrix(product_id):
+    """
+    Build the variant matrix for a product from a single query.
+
+    Returns:
+        dict: ``sizes`` and ``colours`` (distinct, in variant order),
+        ``cells`` (``"size_colour"`` -> variant data),
+        ``colour_image_map`` (colour -> first variant's image URLs),
+        ``variant_price_map`` (``"size_colour"`` -> float price) and
+        ``default_variant`` (the first variant's data, or ``None``).
+    """
+    sizes = []
+    colours = []
+    cells = {}
+    colour_image_map = {}
+    default_variant = None
+
+    variants = ProductVariant.objects.filter(
+        product_id=product_id
+    ).order_by('pk')
+
+    for variant in variants:
+        cell = {
+            'sku': variant.sku,
+            'size': variant.size,
+            'colour': variant.colour,
+            'price': variant.price,
+            'stock': variant.stock,
+            'image_url': _file_url(variant.image),
+            'image_back_url': _file_url(variant.image_back),
+        }
+        if default_variant is None:
+            default_variant = cell
+
+        if variant.size not in sizes:
+            sizes.append(variant.size)
+        if variant.colour and variant.colour not in colours:
+            colours.append(variant.colour)
+
+        if variant.colour not in colour_image_map:
+            colour_image_map[variant.colour] = {
+                'image_url': cell['image_url'],
+                'image_back_url': cell['image_back_url'],
+            }
+
+        cells[f"{variant.size or ''}_{variant.colour or ''}"] = cell
+
+    return {
+        'sizes': sizes,
+        'colours': colours,
+        'cells': cells,
+        'colour_image_map': colour_image_map,
+        'variant_price_map': {
+            key: float(cell['price']) for key, cell in cells.items()
+        },
+        'default_variant': default_variant,
+    }
+
+
+def get_variant_matrix(product_id):
+    """Return the cached variant matrix for a product, building it once."""
+    key = variant_matrix_cache_key(product_id)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_variant_matrix(product_id)
+        cache.set(key, matrix, VARIANT_MATRIX_CACHE_TIMEOUT)
+    return matrix
+
+
+def invalidate_variant_matrix(product_id):
+    """Drop the cached variant matrix for a product."""
+    cache.delete(variant_matrix_cache_key(product_id))
@@ -0,0 +1,140 @@
+"""
+Catalog version counters used to invalidate derived caches.
+
+Every web and background worker must see the same value, so counters
+are shared: in the ``versions`` cache when one is configured (Redis,
+whose INCR is atomic), otherwise in the ``CatalogVersion`` table, bumped
+with a single ``UPDATE``. Either way they are kept apart from cached
+pages and fragments, so they aren't culled to make room for them.
+
+A missing counter is seeded from the clock in nanoseconds. A counter
+lost from the cache therefore comes back higher than any value it held
+before, and nothing stamped with an old value becomes valid again.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from .models import CatalogVersion
+
+VERSIONS_CACHE = 'versions'
+
+PRICE_VERSION_KEY = 'products:price_version'
+SEARCH_INDEX_VERSION_KEY = 'products:search_index_version'
+AUTOCOMPLETE_VERSION_KEY = 'products:autocomplete_version'
+CATALOG_VERSION_KEY = 'products:catalog_version'
+
+
+def _seed():
+    return time.time_ns()
+
+
+def _get_version(key):
+    if VERSIONS_CACHE not in settings.CACHES:
+        version = CatalogVersion.objects.filter(key=key).values_list(
+            'value', flat=True
+        ).first()
+        if version is None:
+            version = CatalogVersion.objects.get_or_create(
+                key=key, defaults={'value': _seed()}
+            )[0].value
+        return version
+
+    versions = caches[VERSIONS_CACHE]
+    version = versions.get(key)
+    if version is None:
+        versions.add(key, _seed(), timeout=None)
+        version = versions.get(key)
+    return version
+
+
+def _bump_version(key):
+    """
+    Increment a counter and return the new value, which no other bump
+    returns.
+    """
+    if VERSIONS_CACHE not in settings.CACHES:
+        # The UPDATE locks the row until commit, so the value read back
+        # is this bump's own
+        with transaction.atomic():
+            updated = CatalogVersion.objects.filter(key=key).update(
+                value=F('value') + 1
+            )
+            if not updated:
+                CatalogVersion.objects.get_or_create(
+                    key=key, defaults={'value': _seed()}
+                )
+                CatalogVersion.objects.filter(key=key).update(
+                    value=F('value') + 1
+                )
+            return CatalogVersion.objects.get(key=key).value
+
+    versions = caches[VERSIONS_CACHE]
+    try:
+        return versions.incr(key)
+    except ValueError:
+        versions.add(key, _seed(), timeout=None)
+        return versions.incr(key)
+
+
+def get_price_version():
+    """Return the current catalog price version."""
+    return _get_version(PRICE_VERSION_KEY)
+
+
+def bump_price_version():
+    """
+    Increment the catalog price version.
+
+    Called whenever a variant's price or stock changes, or a variant is
+    removed, so cached bag totals are recalculated on next access.
+    """
+    return _bump_version(PRICE_VERSION_KEY)
+
+
+def get_search_index_version():
+    """Return the current in-process search index version."""
+    return _get_version(SEARCH_INDEX_VERSION_KEY)
+
+
+def bump_search_index_version():
+    """
+    Increment the search index version.
+
+    Workers holding an in-memory index built at an older version
+    rebuild it before their next search.
+    """
+    return _bump_version(SEARCH_INDEX_VERSION_KEY)
+
+
+def get_autocomplete_version():
+    """Return the current search autocomplete version."""
+    return _get_version(AUTOCOMPLETE_VERSION_KEY)
+
+
+def bump_autocomplete_version():
+    """
+    Increment the search autocomplete version.
+
+    Called when product or category names change, which rebuilds each
+    worker's suggestion trie and retires cached suggestion responses.
+    """
+    return _bump_version(AUTOCOMPLETE_VERSION_KEY)
+
+
+def get_catalog_version():
+    """Return the current catalog version."""
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """
+    Increment the catalog version.
+
+    Called on any product, variant or category change so cached
+    catalog pages are never served stale.
+    """
+    return _bump_version(CATALOG_VERSION_KEY)
@@ -2,25 +2,70 @@ from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.forms import inlineformset_factory
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
 from django.utils.safestring import mark_safe
-from django.db.models import Q, Min, Max
-from django.db.models.functions import Lower
+from django.db.models import Min, Max, Case, When, OuterRef, Subquery
+import hashlib
 import json
 from uuid import uuid4
 
+from home.decorators import cache_anonymous_page
+from .autocomplete import MAX_PREFIX_LENGTH, catalog_autocomplete
 from .models import Product, ProductVariant, Category
-from .forms import ProductForm, ProductVariantForm
+from .forms import (
+    BaseProductVariantFormSet, ProductForm, ProductVariantForm
+)
+from .pagination import order_products, paginate_products
+from .search import get_search_backend
+from .variant_matrix import get_variant_matrix
+from .versions import get_autocomplete_version
+
+AUTOCOMPLETE_CACHE_KEY = 'products:autocomplete:{}:{}'
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 60
+AUTOCOMPLETE_MAX_AGE = 60
 
 ProductVariantFormSet = inlineformset_factory(
     Product,
     ProductVariant,
     form=ProductVariantForm,
+    formset=BaseProductVariantFormSet,
     fields=('id', 'size', 'colour', 'price', 'stock', 'image', 'image_back'),
     extra=0,
     can_delete=True
 )
 
 
+def annotate_product_cards(products):
+    """
+    Annotate a product queryset with the data used by product cards.
+
+    - ``min_price``/``max_price``: the variant price range, or the first
+      variant's price for non-variant products.
+    - ``card_image``: the first variant's front image name.
+    - The category is joined so its friendly name needs no extra query.
+    """
+    first_variant = ProductVariant.objects.filter(
+        product=OuterRef('pk')
+    ).order_by('pk')
+    first_price = Subquery(first_variant.values('price')[:1])
+
+    return products.select_related('category').annotate(
+        min_price=Case(
+            When(has_variants=False, then=first_price),
+            default=Min('variants__price'),
+        ),
+        max_price=Case(
+            When(has_variants=False, then=first_price),
+            default=Max('variants__price'),
+        ),
+        card_image=Subquery(first_variant.values('image')[:1]),
+    )
+
+
+@cache_anonymous_page
 def all_products(request):
     """
     Display all products, with optional sorting, category filtering,
@@ -28,18 +73,15 @@ def all_products(request):
 
     Supports:
     - Sorting by name, category, or lowest variant price.
+    - Offset (``?page=``) and keyset (``?after=``) pagination.
     - Filtering by category name(s).
-    - Searching by name or description.
-    - Annotates products with min/max variant prices for display logic.
+    - Full-text searching by name or description via the configured
+      search backend, with an optional relevance sort.
+    - Annotates products with everything a product card needs (price
+      range, first variant image, category) so the listing costs a
+      constant number of queries however large the catalog is.
     """
-    # Annotate each product with its min and max variant prices
-    products = (
-        Product.objects.prefetch_related('variants')
-        .annotate(
-            min_price=Min('variants__price'),
-            max_price=Max('variants__price')
-        )
-    )
+    products = Product.objects.all()
 
     query = None
     categories = None
@@ -49,24 +91,8 @@ def all_products(request):
 
     if request.GET:
         if 'sort' in request.GET:
-            sortkey = request.GET['sort']
-            sort = sortkey
-
-            if sortkey == 'name':
-                sortkey = 'lower_name'
-                products = products.annotate(lower_name=Lower('name'))
-            elif sortkey == 'category':
-                sortkey = 'category__name'
-            elif sortkey == 'price':
-                sortkey = 'min_price'
-                products = products.annotate(min_price=Min('variants__price'))
-
-            if 'direction' in request.GET:
-                direction = request.GET['direction']
-                if direction == 'desc':
-                    sortkey = f'-{sortkey}'
-
-            products = products.order_by(sortkey)
+            sort = request.GET['sort']
+            direction = request.GET.get('direction')
 
         if 'category' in request.GET:
             categories = request.GET['category'].split(',')
@@ -84,43 +110,79 @@ def all_products(request):
                     )
                 return redirect(reverse('products'))
 
-            queries = (
-                    Q(name__icontains=query) |
-                    Q(description__icontains=query)
-            )
-            products = products.filter(queries)
+            products = get_search_backend().search(products, query)
+
+    # Relevance only means something when there is a search term
+    if sort == 'relevance' and not query:
+        sort = None
+        direction = None
 
     current_sorting = f'{sort}_{direction}'
 
-    # Manually ensure min_price and max_price for non-variant products
-    for product in products:
-        if not product.has_variants:
-            variant = product.variants.first()
-            if variant:
-                setattr(product, 'min_price', variant.price)
-                setattr(product, 'max_price', variant.price)
+    # Count the filtered products before the card annotations are added
+    # so the count never has to aggregate variant prices
+    count_queryset = products
+    products = order_products(
+        annotate_product_cards(products), sort, direction
+    )
 
     context = {
-        'products': products,
         'search_term': query,
         'current_categories': categories,
         'selected_category': selected_category,
         'current_sorting': current_sorting,
+        **paginate_products(
+            request, products, count_queryset, sort, direction
+        ),
     }
 
     return render(request, 'products/products.html', context)
 
 
+@require_GET
+def search_autocomplete(request):
+    """
+    Return JSON type-ahead suggestions for the nav search box.
+
+    Suggestions come from the worker's in-memory prefix trie, and each
+    response is cached per prefix and autocomplete version, so typing
+    never queries the product table.
+
+    Returns:
+        JsonResponse: ``{"suggestions": [{"label", "type", "url"}]}``.
+    """
+    prefix = request.GET.get('q', '').strip().lower()[:MAX_PREFIX_LENGTH]
+    if not prefix:
+        payload = {'suggestions': []}
+    else:
+        key = AUTOCOMPLETE_CACHE_KEY.format(
+            get_autocomplete_version(),
+            hashlib.md5(prefix.encode('utf-8')).hexdigest(),
+        )
+        payload = cache.get(key)
+        if payload is None:
+            payload = {'suggestions': catalog_autocomplete.suggest(prefix)}
+            cache.set(key, payload, AUTOCOMPLETE_CACHE_TIMEOUT)
+
+    response = JsonResponse(payload)
+    patch_cache_control(response, public=True, max_age=AUTOCOMPLETE_MAX_AGE)
+    return response
+
+
 # products/views.py
+@cache_anonymous_page
 def product_detail(request, slug):
     """
     Display the detail page for a single product.
 
-    Retrieves all related product variants and prepares data for:
-    - Available sizes and colours (excluding empty/null values)
+    Reads the product's cached variant matrix (see
+    `products.variant_matrix`), which provides:
+    - Available sizes and colours (colours exclude empty/null values)
     - Mapping each colour to its associated front and back images
     - Mapping each size/colour combination to its price for dynamic updates
-    - Rendering colour and size selectors only when applicable
+    - The default variant shown before a selection is made
+
+    On a cache hit the page renders with a single product query.
 
     Args:
         request (HttpRequest): The incoming request object.
@@ -130,47 +192,22 @@ def product_detail(request, slug):
         HttpResponse: Rendered product detail page with product
         and variant context.
     """
-    product = get_object_or_404(Product, slug=slug)
-    variants = product.variants.all()
-
-    # Distinct dropdown data
-    colours = (
-        variants.exclude(colour__isnull=True)
-        .exclude(colour__exact='')
-        .values_list('colour', flat=True)
-        .distinct()
+    product = get_object_or_404(
+        Product.objects.select_related('category'), slug=slug
     )
-    sizes = variants.values_list('size', flat=True).distinct()
-
-    # Build a dictionary of variant data per colour (for image display)
-    colour_image_map = {}
-    for variant in variants:
-        if variant.colour not in colour_image_map:
-            colour_image_map[variant.colour] = {
-                'image_url': variant.image.url if variant.image else '',
-                'image_back_url': (
-                    variant.image_back.url
-                    if variant.image_back
-                    else ''
-                ),
-            }
-
-    # Build a variant price map for dynamic JS updates
-    variant_price_map = {}
-    for variant in variants:
-        size = variant.size or ''
-        colour = variant.colour or ''
-        key = f"{size}_{colour}"
-        variant_price_map[key] = float(variant.price)
+    matrix = get_variant_matrix(product.pk)
 
     context = {
         'product': product,
-        'variants': variants,
-        'colours': colours,
-        'sizes': sizes,
-        'colour_image_map': colour_image_map,
+        'variant_matrix': matrix,
+        'default_variant': matrix['default_variant'],
+        'colours': matrix['colours'],
+        'sizes': matrix['sizes'],
+        'colour_image_map': matrix['colour_image_map'],
         # Safe JSON to render in template
-        'variant_price_map': mark_safe(json.dumps(variant_price_map)),
+        'variant_price_map': mark_safe(
+            json.dumps(matrix['variant_price_map'])
+        ),
     }
 
     return render(request, 'products/product_detail.html', context)
@@ -189,6 +226,7 @@ def add_product(request):
         Product,
         ProductVariant,
         form=ProductVariantForm,
+        formset=BaseProductVariantFormSet,
         fields=(
             'id',
             'size',
@@ -217,10 +255,8 @@ def add_product(request):
 
                 for variant in variants:
                     # Skip duplicate size/colour combos
-                    if ProductVariant.objects.filter(
-                        product=product,
-                        size=variant.size,
-                        colour=variant.colour
+                    if ProductVariant.objects.for_option(
+                        product.pk, variant.size, variant.colour
                     ).exists():
                         messages.warning(
                             request,
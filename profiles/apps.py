@@ -10,3 +10,7 @@ class ProfilesConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'profiles'
+
+    def ready(self):
+        """Import signal handlers when the app is ready."""
+        import profiles.signals  # noqa: F401
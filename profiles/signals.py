@@ -0,0 +1,21 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import UserProfile
+from .utils import invalidate_profile_cache
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_on_save(sender, instance, **kwargs):
+    """
+    Drop the cached profile when it is saved
+    """
+    invalidate_profile_cache(instance.user_id)
+
+
+@receiver(post_delete, sender=UserProfile)
+def invalidate_on_delete(sender, instance, **kwargs):
+    """
+    Drop the cached profile when it is deleted
+    """
+    invalidate_profile_cache(instance.user_id)
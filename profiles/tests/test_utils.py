@@ -0,0 +1,70 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory, override_settings
+
+from fitsix_project.testing import IN_MEMORY_CACHES
+from profiles.utils import get_request_profile, is_member
+
+
+@override_settings(CACHES=IN_MEMORY_CACHES)
+class CachedProfileTest(TestCase):
+    """
+    Test suite for the cached profile accessors.
+
+    These tests verify:
+    - Profiles are looked up once per request and cached across requests.
+    - Saving a profile invalidates the cached copy.
+    - Anonymous users never query the database.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='member',
+            password='testpass123'
+        )
+        self.factory = RequestFactory()
+
+    def _request(self, user=None):
+        request = self.factory.get('/')
+        request.user = user or self.user
+        return request
+
+    def test_profile_is_looked_up_once_per_request(self):
+        """
+        Repeated lookups in one request should hit the database once.
+        """
+        request = self._request()
+        with self.assertNumQueries(1):
+            first = get_request_profile(request)
+            second = get_request_profile(request)
+        self.assertIs(first, second)
+        self.assertEqual(first.user, self.user)
+
+    def test_profile_is_cached_across_requests(self):
+        """
+        A second request should read the profile from the cache.
+        """
+        get_request_profile(self._request())
+        with self.assertNumQueries(0):
+            profile = get_request_profile(self._request())
+        self.assertEqual(profile.user_id, self.user.id)
+
+    def test_saving_profile_invalidates_cache(self):
+        """
+        Member status changes should be visible on the next request.
+        """
+        self.assertFalse(is_member(self._request()))
+        profile = self.user.userprofile
+        profile.is_member = True
+        profile.save()
+        self.assertTrue(is_member(self._request()))
+
+    def test_anonymous_user_has_no_profile(self):
+        """
+        Anonymous users should get None without any queries.
+        """
+        with self.assertNumQueries(0):
+            request = self._request(user=AnonymousUser())
+            self.assertIsNone(get_request_profile(request))
+            self.assertFalse(is_member(request))
@@ -0,0 +1,104 @@
+"""
+Cached access to the signed-in user's profile.
+
+The bag, checkout and success pages all need the profile (mostly to
+check ``is_member``). Profiles are memoized on the request and cached
+across requests, and the cache entry is dropped whenever the profile
+is saved or deleted (see ``profiles.signals``).
+"""
+from django.core.cache import cache
+
+from .models import UserProfile
+
+PROFILE_CACHE_KEY = 'profiles:userprofile:{}'
+PROFILE_CACHE_TIMEOUT = 60 * 15
+
+# Request attribute used to memoize the profile for one request
+PROFILE_ATTR = '_cached_user_profile'
+
+# Cached in place of a profile for users that do not have one
+_NO_PROFILE = 'no-profile'
+
+
+def profile_cache_key(user_id):
+    """Return the cache key for a user's profile."""
+    return PROFILE_CACHE_KEY.format(user_id)
+
+
+def get_cached_profile(user):
+    """
+    Return the profile for ``user``, or ``None`` if there isn't one.
+
+    Anonymous users never touch the cache or the database.
+    """
+    if not user.is_authenticated:
+        return None
+
+    key = profile_cache_key(user.pk)
+    profile = cache.get(key)
+    if profile is None:
+        try:
+            profile = UserProfile.objects.get(user_id=user.pk)
+        except UserProfile.DoesNotExist:
+            profile = _NO_PROFILE
+        cache.set(key, profile, PROFILE_CACHE_TIMEOUT)
+
+    if profile == _NO_PROFILE:
+        return None
+
+    # Reuse the request's user rather than caching it with the profile
+    profile.user = user
+    return profile
+
+
+async def aget_cached_profile(user):
+    """Async version of ``get_cached_profile``."""
+    if not user.is_authenticated:
+        return None
+
+    key = profile_cache_key(user.pk)
+    profile = await cache.aget(key)
+    if profile is None:
+        try:
+            profile = await UserProfile.objects.aget(user_id=user.pk)
+        except UserProfile.DoesNotExist:
+            profile = _NO_PROFILE
+        await cache.aset(key, profile, PROFILE_CACHE_TIMEOUT)
+
+    if profile == _NO_PROFILE:
+        return None
+
+    profile.user = user
+    return profile
+
+
+def get_request_profile(request):
+    """
+    Return the current user's profile, looking it up at most once
+    per request.
+    """
+    if not hasattr(request, PROFILE_ATTR):
+        setattr(request, PROFILE_ATTR, get_cached_profile(request.user))
+    return getattr(request, PROFILE_ATTR)
+
+
+async def aget_request_profile(request):
+    """
+    Async version of ``get_request_profile``. The profile is memoized
+    on the request, so sync code later in the request reuses it.
+    """
+    if not hasattr(request, PROFILE_ATTR):
+        user = await request.auser()
+        setattr(request, PROFILE_ATTR, await aget_cached_profile(user))
+    return getattr(request, PROFILE_ATTR)
+
+
+def is_member(request):
+    """Return True if the current user is a Fit Six member."""
+    profile = get_request_profile(request)
+    return bool(profile and profile.is_member)
+
+
+def invalidate_profile_cache(user_id):
+    """Drop the cached profile for a user."""
+    cache.delete(profile_cache_key(user_id))